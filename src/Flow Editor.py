@@ -10,6 +10,27 @@
 from tkinter import *
 from tkinter import filedialog
 from tkinter import messagebox
+from tkinter import simpledialog
+import io
+import os
+
+from flow_analysis import FlowAnalysis
+from flow_blocks import BlockCache
+from flow_cache import FlowCache, derivedSize, snapshotProgram
+from flow_common import (CMD_DOWN, CMD_LEFT, CMD_RIGHT, CMD_UP, DIR_DELTAS, DIR_NAMES,
+                         ERROR_MESSAGES, INVALID_FILE, NO_ERROR, OP_LENGTH)
+from flow_engine import FlowMachine
+from flow_grid import EMPTY_CELL, FlowGrid, saveFile, writeGrid
+from flow_hang import HangWatch
+from flow_index import Search, TripletIndex
+from flow_instrument import INSTRUMENT_ENV, Instrument
+from flow_journal import EditJournal, rowCell
+from flow_minimap import CELL_KINDS, KIND_BITS, MINIMAP_BG_COLOR, MINIMAP_SIZE, Minimap
+from flow_profile import HEAT_LEVELS, FlowProfile
+from flow_save import (BackgroundSave, appendRows, hasAutosave,
+                       removeAutosave, replayRows, rowRecord)
+from flow_trace import FlowTrace
+from flow_transpile import FlowTranspiler, compileC, gridSource
 
 "███████████████████████████████   Constants   ████████████████████████████████"
 
@@ -21,9 +42,18 @@ TRIPLET_HEIGHT = 16
 TRIPLET_WIDTH = 2 * TRIPLET_HEIGHT
 TRIPLET_FONT = "Courier"
 
-NUM_TRIPLETS_X = 24
+NUM_TRIPLETS_X = 24 # cells in view at first
 NUM_TRIPLETS_Y = 32
 
+# Zoom
+ZOOM_HEIGHTS = (1, 2, 4, 8, 12, 16, 24, 32) # cell heights; cells are twice as wide
+DEFAULT_ZOOM = ZOOM_HEIGHTS.index(TRIPLET_HEIGHT)
+TEXT_MIN_HEIGHT = 8 # shorter cells are drawn as colored blocks
+TEXT_MAX_CELLS = 20000 # more cells in view are drawn as colored blocks
+RULER_LABEL_SPACING = (32, 16) # fewest pixels between ruler labels (x, y)
+RESIZE_DELAY = 50 # ms of quiet before the view is fitted to the canvas
+WHEEL_CELLS = 3 # cells scrolled per mouse wheel notch
+
 # Canvas attributes
 BORDER_OFFSET = 5
 RULER_WIDTH = 16
@@ -31,6 +61,7 @@ CANVAS_WIDTH = NUM_TRIPLETS_X * TRIPLET_WIDTH + RULER_WIDTH
 CANVAS_HEIGHT = NUM_TRIPLETS_Y * TRIPLET_HEIGHT + RULER_WIDTH
 CANVAS_BG_COLOR = "#CCCCFF"
 CANVAS_OFFSET = (BORDER_OFFSET + RULER_WIDTH, BORDER_OFFSET + RULER_WIDTH)
+CANVAS_MIN_SIZE = 200 # pixels, each way
 
 RULER_FILL = "#EEEEEE"
 RULER_BORDER_COLOR = "#000000"
@@ -48,28 +79,94 @@ SELECTED_FILL = "#8888CC"
 SELECTED_BORDER_COLOR = "#555555"
 SELECTED_BORDER_WIDTH = 1.4
 
-
-# Flow commands
-CMD_START = '#'
-CMD_COMP  = '?'
-CMD_LEFT  = '<'
-CMD_RIGHT = '>'
-CMD_DOWN  = 'v'
-CMD_UP    = '^'
-
-CMD_LOAD  = '@'
-CMD_SET   = ':'
-CMD_ADD   = '+'
-CMD_SUB   = '-'
-CMD_MUL   = '*'
-CMD_DIV   = '/'
-CMD_MOD   = '%'
-CMD_IN    = '~'
-CMD_OUT   = '"'
+TRACE_FILL = "#FFDD55"
+TRACE_BORDER_COLOR = "#CC6600"
+TRACE_BORDER_WIDTH = 2.0
+
+CYCLE_FILL = "#FF9999"
+CYCLE_BORDER_COLOR = "#CC0000"
+CYCLE_BORDER_WIDTH = 1.4
+
+# (fill, outline, width) of a rectangle in each state
+RECT_STYLES = {"normal":   (NORMAL_FILL, NORMAL_BORDER_COLOR, NORMAL_BORDER_WIDTH),
+               "active":   (ACTIVE_FILL, ACTIVE_BORDER_COLOR, ACTIVE_BORDER_WIDTH),
+               "selected": (SELECTED_FILL, SELECTED_BORDER_COLOR, SELECTED_BORDER_WIDTH),
+               "trace":    (TRACE_FILL, TRACE_BORDER_COLOR, TRACE_BORDER_WIDTH),
+               "cycle":    (CYCLE_FILL, CYCLE_BORDER_COLOR, CYCLE_BORDER_WIDTH)}
+
+# fills of profiled cells, coolest first, one per heat level
+HEAT_FILLS = ("#FFF5CC", "#FFE699", "#FFD166", "#FFB347",
+              "#FF8C42", "#FF6B35", "#F03E1E", "#C81D11")
+for level, fill in enumerate(HEAT_FILLS[:HEAT_LEVELS], 1):
+  RECT_STYLES["heat{}".format(level)] = (fill, NORMAL_BORDER_COLOR, NORMAL_BORDER_WIDTH)
+
+# Console attributes
+CONSOLE_HEIGHT = 8 # lines of output shown
+CONSOLE_FONT = (TRIPLET_FONT, -12)
+CONSOLE_LIMIT = 1 << 18 # characters kept; older output is dropped
+
+# Execution
+RUN_TICK_LIMIT = 10000000 # ticks before a run is stopped
+CYCLE_CHUNK = 1 << 12 # ticks of an endless loop listed per call
+CYCLE_DELAY = 1 # ms between those calls
+TRACE_FRAME = 33 # ms between frames while tracing
+TRACE_SLICE = 0.025 # seconds of running per frame
+TRACE_ARROW_COLOR = "#CC6600" # flow direction while tracing
+TRACE_ARROW_WIDTH = 2
+
+# Status bar attributes
+STATUS_FONT = ("Courier", -12)
+ANALYSIS_DELAY = 250 # ms of quiet before the program is re-analyzed
+CHECK_LIST_LIMIT = 20 # cells listed per problem in Check Flow
+SAVE_POLL = 100 # ms between checks on a running save
+MINIMAP_DELAY = 100 # ms of quiet before the minimap is redrawn
+MINIMAP_BORDER = 2
+MINIMAP_VIEW_COLOR = "#FF0000" # outline of the view on the minimap
+AUTOSAVE_INTERVAL = 60000 # ms between autosaves of changed rows
+
+# Instrumentation
+OVERLAY_REFRESH = 500 # ms between updates of the debug overlay
+OVERLAY_FILL = "#FFFFE0"
+OVERLAY_FONT = ("Courier", -11)
+# event handlers and render paths timed when instrumenting
+INSTRUMENTED = ("keyPress", "delText", "backspaceText", "cut", "copy", "paste",
+                "undo", "redo", "b1Action", "b1Drag", "moveLeft", "moveRight",
+                "moveUp", "moveDown", "selectLeft", "selectRight", "selectUp",
+                "selectDown", "flushRender", "updateStatus", "updateMinimap",
+                "minimapClick", "traceFrame", "autosave", "pollSave", "find",
+                "findNext", "findPrevious", "runProgram", "profileProgram",
+                "checkFlow")
 
 # Defaults
 BASE_GRID = {(0,0): "#> "}
 
+###############
+# blockTable
+#   Builds the str.translate table from a
+#   cell's command to the Tk color of its block,
+#   then a space: the minimap's kind colors, with
+#   empty cells the canvas color.
+def blockTable():
+  table = {0: CANVAS_BG_COLOR + " "}
+  for byte in range(1, 256):
+    kind = KIND_BITS[byte].bit_length() - 1
+    table[byte] = CELL_KINDS[kind][2] + " "
+  return table
+
+BLOCK_COLORS = blockTable()
+
+###############
+# blockColors
+#   Returns the Tk colors of the blocks of a row
+#   of cells, as FlowGrid.rect returns it.
+def blockColors(row):
+  commands = row[::OP_LENGTH]
+  if not commands.isascii() and max(commands) > "\xff":
+    commands = "".join(command if command <= "\xff" else "\x7f"
+                       for command in commands)
+  return commands.translate(BLOCK_COLORS)
+
+
 "████████████████████████████████   Tkinter   █████████████████████████████████"
 
 
@@ -82,36 +179,105 @@ class Editor(Frame):
 
   ##############
   # init
-  #   Initializes the editor class
-  #   and all subclasses.
-  def __init__(self, master):
+  #   Initializes the editor class and all
+  #   subclasses. With an Instrument, its
+  #   handlers are timed.
+  def __init__(self, master, instrument = None):
     Frame.__init__(self, master)
     
     # loaded file
     self._openfile = ""
-    self._grid = {(0,0): "#> "}
+    self._grid = FlowGrid(BASE_GRID)
 
     # current item
     self._position = (0,0) # currently active cell
     self._insertindex = 0 # position in cell to insert
     self._selection = [(0,0), (0,0)] # topleft and botright corners of selection
+    self._typingat = None # cell the last keystroke left the cursor at
     self._direction = "right" # direction (defaults to right)
-    self._clipboard = {"size": (0, 0)}
+    self._clipboard = [EMPTY_CELL] # copied rows, as FlowGrid.rect returns
+    self._blocks = None # compiled program, built on first run
+    self._journal = EditJournal() # undo/redo history
+    self._index = None # triplet index, built on first search
+    self._search = None # last search, for find next/previous
+    self._analysis = None # control-flow analysis, built when idle
+    self._analysispending = False
+    self._cache = FlowCache() # programs loaded before, on disk
+    self._cachekey = None # cache key of the file as loaded, until edited
+    self._loaderror = NO_ERROR # its load error
+    self._cachedsize = None # derivedSize last stored under the key
+    self._caching = None # BackgroundSave writing a cache entry, if any
+    self._minimap = None # overview of the grid, made with the widgets
+    self._minimappending = False
+    self._trace = None # program being traced, if any
+    self._tracerunning = False # frames are scheduled
+    self._tracetarget = None # cell a run to cursor stops at
+    self._tracecell = None # cell the trace is at, as drawn
+    self._tracearrow = None # canvas line showing the flow direction
+    self._profile = None # last profile, shown as a heatmap
+    self._profiletop = 0 # hits of its hottest cell
+    self._detecthangs = BooleanVar(value = True) # stop runs that loop forever
+    self._cycle = None # cells of the last run's endless loop, highlighted
+    self._listing = None # (HangWatch, after id) while its loop is listed
+
+    # console
+    self._console = None # machine whose output the console shows
+    self._consoleshown = 0 # bytes of its output shown so far
+    self._consolesize = 0 # characters in the console
+    self._inputfile = "" # file programs read their input from, if any
+
+    # saving
+    self._saving = None # running BackgroundSave, if any
+    self._savingfile = "" # file it writes
+    self._savingrows = set() # rows it covers, dirty again if it fails
+    self._savingfull = False # writes the whole file, not the autosave log
+    self._dirtyrows = set() # rows changed since the last save or autosave
+
+    # instrumentation, wrapped before anything is bound
+    self._instrument = instrument
+    self._overlay = None # debug overlay's (rect, text) items, if shown
+    self._overlayafter = None # after id of its next refresh
+    if instrument is not None:
+      instrument.wrapMethods(self, INSTRUMENTED)
 
     # canvas tracking stuff
-    self._canvasitems = {}
-    self._grid = {(0, 0): "#> "}
+    self._viewsize = (NUM_TRIPLETS_X, NUM_TRIPLETS_Y) # cells in view
+    self._zoom = DEFAULT_ZOOM # index in ZOOM_HEIGHTS
+    self._cellsize = (TRIPLET_WIDTH, TRIPLET_HEIGHT) # pixels per cell
+    self._canvassize = (CANVAS_WIDTH + 2 * BORDER_OFFSET, # pixels, as last configured
+                        CANVAS_HEIGHT + 2 * BORDER_OFFSET)
+    self._resizepending = False
+    self._scrollshown = (None, None) # (first, last) each scrollbar shows
+    self._textmode = True # cells drawn as rects and text, not blocks
+    self._blockimage = None # canvas image of the blocks
+    self._blockphoto = None # its PhotoImage, kept alive
+    self._marks = {} # canvas rects outlining the selection in block mode
     self._rects = {}
+    self._rectstate = {} # style currently drawn by each rect
+    self._texts = {} # text item pool, indexed like _rects
+    self._textcache = {} # text currently shown by each pool item
     self._canvastopleft = (0, 0)
     self._rulers = {}
+    self._rulershown = {} # (offset, text) each ruler label shows
+
+    # render scheduling
+    self._renderpending = False
+    self._viewdirty = False # view moved since last render
+    self._textdirty = False # cells in view changed since last render
+    self._drawnselection = [(0, 0), (0, 0)] # selection as last drawn
+    self._drawnposition = (0, 0) # position as last drawn
+    self._drawntrace = None # trace cell as last drawn
 
     # setup
     self.createWidgets()
+    if instrument is not None:
+      instrument.countCalls(self.master)
     self._canvas.focus_set()
     self.master.protocol("WM_DELETE_WINDOW", self.closeProgram)
-    self.pack()
+    self.pack(fill = BOTH, expand = True)
 
     self.new()
+    self.after(AUTOSAVE_INTERVAL, self.autosave)
 
   ###############
   # createWidgets
@@ -124,7 +290,58 @@ class Editor(Frame):
                          bg = CANVAS_BG_COLOR,
                          bd = 2,
                          relief = SUNKEN)
-    self._canvas.pack()
+
+    # Minimap
+    self._minimap = Minimap(self._grid)
+    self._minimapcanvas = Canvas(self,
+                                 width = MINIMAP_SIZE,
+                                 height = MINIMAP_SIZE,
+                                 bg = MINIMAP_BG_COLOR,
+                                 bd = MINIMAP_BORDER,
+                                 highlightthickness = 0,
+                                 relief = SUNKEN)
+    self._minimapimage = PhotoImage(width = MINIMAP_SIZE, height = MINIMAP_SIZE)
+    self._minimapcanvas.create_image(MINIMAP_BORDER, MINIMAP_BORDER,
+                                     image = self._minimapimage, anchor = NW)
+    self._minimapview = self._minimapcanvas.create_rectangle(
+      0, 0, 0, 0, outline = MINIMAP_VIEW_COLOR)
+
+    # Status bar
+    statusbar = Frame(self)
+    self._status = Label(statusbar, anchor = W, font = STATUS_FONT)
+    self._status.pack(side = LEFT, fill = X, expand = True)
+    self._savestatus = Label(statusbar, anchor = E, font = STATUS_FONT)
+    self._savestatus.pack(side = RIGHT)
+    statusbar.pack(side = BOTTOM, fill = X)
+
+    # Console
+    console = Frame(self)
+    inputbar = Frame(console)
+    Label(inputbar, text = "Input:", font = STATUS_FONT).pack(side = LEFT)
+    self._inputvar = StringVar()
+    self._inputentry = Entry(inputbar, textvariable = self._inputvar, font = CONSOLE_FONT)
+    self._inputentry.pack(side = LEFT, fill = X, expand = True)
+    self._inputlabel = Label(inputbar, font = STATUS_FONT) # names the input file
+    self._inputlabel.pack(side = LEFT)
+    inputbar.pack(side = TOP, fill = X)
+    scrollbar = Scrollbar(console)
+    self._consoletext = Text(console, height = CONSOLE_HEIGHT, font = CONSOLE_FONT,
+                             state = DISABLED, yscrollcommand = scrollbar.set)
+    scrollbar.config(command = self._consoletext.yview)
+    scrollbar.pack(side = RIGHT, fill = Y)
+    self._consoletext.pack(side = LEFT, fill = BOTH, expand = True)
+    console.pack(side = BOTTOM, fill = X)
+
+    # Scrollbars, over the grid's cells and the view
+    self._xscroll = Scrollbar(self, orient = HORIZONTAL,
+                              command = lambda *args: self.scrollView(0, *args))
+    self._yscroll = Scrollbar(self, orient = VERTICAL,
+                              command = lambda *args: self.scrollView(1, *args))
+    self._xscroll.pack(side = BOTTOM, fill = X)
+
+    self._canvas.pack(side = LEFT, fill = BOTH, expand = True)
+    self._yscroll.pack(side = LEFT, fill = Y)
+    self._minimapcanvas.pack(side = LEFT, anchor = N)
 
     self.initCanvasRects()
     self.initCanvasRulers()
@@ -142,14 +359,46 @@ class Editor(Frame):
     self.menubar.add_cascade(label = "File",  menu = self.filemenu)
 
     self.editmenu = Menu(self.menubar, tearoff = 0)
+    self.editmenu.add_command(label = "Undo   (Ctr-Z)", command = self.undo)
+    self.editmenu.add_command(label = "Redo    (Ctr-Y)", command = self.redo)
+    self.editmenu.add_separator()
     self.editmenu.add_command(label = "Cut     (Ctr-X)", command = self.cut)
     self.editmenu.add_command(label = "Copy  (Ctr-C)", command = self.copy)
     self.editmenu.add_command(label = "Paste  (Ctr-V)", command = self.paste)
     self.editmenu.add_separator()
     self.editmenu.add_command(label = "Find    (Ctr-F)", command = self.find)
+    self.editmenu.add_command(label = "Find Next      (F3)", command = self.findNext)
+    self.editmenu.add_command(label = "Find Prev (Sh-F3)", command = self.findPrevious)
     self.editmenu.add_command(label = "Goto   (Ctr-G)", command = self.goto)
     self.menubar.add_cascade(label = "Edit",  menu = self.editmenu)
 
+    self.viewmenu = Menu(self.menubar, tearoff = 0)
+    self.viewmenu.add_command(label = "Zoom In      (Ctr-+)", command = self.zoomIn)
+    self.viewmenu.add_command(label = "Zoom Out     (Ctr--)", command = self.zoomOut)
+    self.viewmenu.add_command(label = "Actual Size (Ctr-0)", command = self.zoomReset)
+    self.menubar.add_cascade(label = "View",  menu = self.viewmenu)
+
+    self.runmenu = Menu(self.menubar, tearoff = 0)
+    self.runmenu.add_command(label = "Run       (F5)", command = self.runProgram)
+    self.runmenu.add_command(label = "Check Flow (F6)", command = self.checkFlow)
+    self.runmenu.add_checkbutton(label = "Detect Hangs", variable = self._detecthangs)
+    self.runmenu.add_command(label = "Input File...", command = self.inputFile)
+    self.runmenu.add_command(label = "Type Input", command = self.typeInput)
+    self.runmenu.add_command(label = "Clear Console", command = self.clearConsole)
+    self.runmenu.add_separator()
+    self.runmenu.add_command(label = "Profile         (F9)", command = self.profileProgram)
+    self.runmenu.add_command(label = "Export Profile...", command = self.exportProfile)
+    self.runmenu.add_command(label = "Clear Profile", command = self.clearProfile)
+    self.runmenu.add_separator()
+    self.runmenu.add_command(label = "Trace           (F7)", command = self.trace)
+    self.runmenu.add_command(label = "Pause Trace   (F8)", command = self.pauseTrace)
+    self.runmenu.add_command(label = "Step            (F10)", command = self.stepTrace)
+    self.runmenu.add_command(label = "Run to Cursor (F4)", command = self.runToCursor)
+    self.runmenu.add_command(label = "Stop Trace (Sh-F7)", command = self.stopTrace)
+    self.runmenu.add_separator()
+    self.runmenu.add_command(label = "Export to C...", command = self.exportC)
+    self.menubar.add_cascade(label = "Run",  menu = self.runmenu)
+
     self.menubar.add_command(label = "Help",  command = self.help)
 
     self.master.config(menu = self.menubar)
@@ -163,6 +412,15 @@ class Editor(Frame):
     self._canvas.bind("<Key>", self.keyPress)
     self._canvas.bind("<Button-1>", self.b1Action)
     self._canvas.bind("<B1-Motion>", self.b1Drag)
+    self._canvas.bind("<Configure>", self.canvasResized)
+    self._canvas.bind("<MouseWheel>", self.wheel)
+    self._canvas.bind("<Button-4>", self.wheel)
+    self._canvas.bind("<Button-5>", self.wheel)
+    self._minimapcanvas.bind("<Button-1>", self.minimapClick)
+    self._minimapcanvas.bind("<B1-Motion>", self.minimapClick)
+    # typing input must not run the grid's shortcuts, like Ctrl-V
+    self._inputentry.bindtags(self._inputentry.bindtags()[:3])
+    self._inputentry.bind("<Return>", self.runProgram)
 
     self.bind_all("<Control-n>", self.new)
     self.bind_all("<Control-o>", self.open)
@@ -171,9 +429,29 @@ class Editor(Frame):
     self.bind_all("<Control-x>", self.cut)
     self.bind_all("<Control-c>", self.copy)
     self.bind_all("<Control-v>", self.paste)
+    self.bind_all("<Control-z>", self.undo)
+    self.bind_all("<Control-y>", self.redo)
+    self.bind_all("<Control-Z>", self.redo)
     self.bind_all("<Control-f>", self.find)
+    self.bind_all("<F3>", self.findNext)
+    self.bind_all("<Shift-F3>", self.findPrevious)
     self.bind_all("<Control-g>", self.goto)
     self.bind_all("<F1>", self.help)
+    self.bind_all("<F5>", self.runProgram)
+    self.bind_all("<F6>", self.checkFlow)
+    self.bind_all("<F9>", self.profileProgram)
+    self.bind_all("<F7>", self.trace)
+    self.bind_all("<F8>", self.pauseTrace)
+    self.bind_all("<F10>", self.stepTrace)
+    self.bind_all("<F4>", self.runToCursor)
+    self.bind_all("<Shift-F7>", self.stopTrace)
+    self.bind_all("<Control-equal>", self.zoomIn)
+    self.bind_all("<Control-plus>", self.zoomIn)
+    self.bind_all("<Control-minus>", self.zoomOut)
+    self.bind_all("<Control-0>", self.zoomReset)
+    if self._instrument is not None:
+      self.bind_all("<F12>", self.toggleOverlay)
+      self.bind_all("<Control-F12>", self.dumpInstrument)
 
     self._canvas.bind("<Left>", self.moveLeft)
     self._canvas.bind("<Right>", self.moveRight)
@@ -192,38 +470,42 @@ class Editor(Frame):
   # delText
   #   Deletes text in the selected field.
   def delText(self, event = None):
-    print("delText called")
-    for x in range(self._selection[0][0], self._selection[1][0] + 1):
-      for y in range(self._selection[0][1], self._selection[1][1] + 1):
-        if (x, y) in self._grid.keys():
-          del self._grid[(x, y)]
-          self._canvas.delete(self._canvasitems[(x, y)])
-          del self._canvasitems[(x, y)]
+    self.clearSelection()
 
   ###############
   # backspaceText
   #   Backspaces a character.
   def backspaceText(self, event = None):
-    print("backspaceText called")
+    self.continueTyping()
     self._selection = [self._position, self._position]
+    deltas = []
     if self._insertindex == 0:
       self.advance(-1)
       if self._position in self._grid.keys():
-        self._grid[self._position] = self._grid[self._position][:2] + " "
+        deltas.append(self.setCell(self._position,
+                                   self._grid[self._position][:2] + " "))
         self._insertindex = 2
     elif self._insertindex == 1:
-      del self._grid[self._position]
-      self._canvas.delete(self._canvasitems[self._position])
-      del self._canvasitems[self._position]
+      if self._position in self._grid.keys():
+        deltas.append(self.setCell(self._position, None))
       self._insertindex = 0
-      return # to avoid canvas item set error
     elif self._insertindex == 2:
       if self._position in self._grid.keys():
-        self._grid[self._position] = self._grid[self._position][0] + "  "
+        deltas.append(self.setCell(self._position,
+                                   self._grid[self._position][0] + "  "))
       self._insertindex = 1
-    if self._position in self._grid.keys():
-      self._canvas.itemconfig(self._canvasitems[self._position],
-                              text = self._grid[self._position])
+    self._journal.recordCells(deltas, typing = True)
+    self._typingat = self._position
+    self.cellsChanged(deltas)
+
+  ###############
+  # continueTyping
+  #   Starts a new undo step unless the cursor is
+  #   still where the last keystroke left it, so
+  #   typing somewhere else is undone on its own.
+  def continueTyping(self):
+    if self._position != self._typingat:
+      self._journal.seal()
 
 
   ###############
@@ -231,61 +513,121 @@ class Editor(Frame):
   #   Copies selected text to clipboard
   #   and then deletes from file.
   def cut(self, event = None):
-    print("cut called")
-    self._clipboard = {}
-    self._clipboard["size"] = (self._selection[1][0] - self._selection[0][0],
-                               self._selection[1][1] - self._selection[0][1])
-    for x in range(self._selection[0][0], self._selection[1][0] + 1):
-      for y in range(self._selection[0][1], self._selection[1][1] + 1):
-        if (x, y) in self._grid.keys():
-          pos = (x - self._selection[0][0], y - self._selection[0][1])
-          self._clipboard[pos] = self._grid[(x, y)]
-          # now delete stuff
-          del self._grid[(x, y)]
-          self._canvas.delete(self._canvasitems[(x, y)])
-          del self._canvasitems[(x, y)]
+    self._clipboard = self.selectionRows()
+    self.clearSelection()
 
   ###############
   # copy
   #   Copies selected text to clipboard.
   def copy(self, event = None):
-    print("copy called")
-    self._clipboard = {}
-    self._clipboard["size"] = (self._selection[1][0] - self._selection[0][0],
-                               self._selection[1][1] - self._selection[0][1])
-    for x in range(self._selection[0][0], self._selection[1][0] + 1):
-      for y in range(self._selection[0][1], self._selection[1][1] + 1):
-        if (x, y) in self._grid.keys():
-          pos = (x - self._selection[0][0], y - self._selection[0][1])
-          self._clipboard[pos] = self._grid[(x, y)]
+    self._clipboard = self.selectionRows()
 
   ###############
   # paste
   #   Pastes selected text from clipboard to
   #   file, starting from top left.
   def paste(self, event = None):
-    print("paste called")
-    for x in range(self._clipboard["size"][0] + 1):
-      for y in range(self._clipboard["size"][1] + 1):
-        pos = (self._selection[0][0] + x, self._selection[0][1] + y)
-        if (x, y) in self._clipboard.keys(): # replace
-          self._grid[pos] = self._clipboard[(x, y)]
-          if pos in self._canvasitems.keys():
-            self._canvas.itemconfig(self._canvasitems[pos],
-                                    text = self._grid[pos])
-          else:
-            loc = self.getCanvasLoc(pos)
-            self._canvasitems[pos] = self._canvas.create_text(loc[0],
-                                      loc[1],
-                                      text = self._grid[pos],
-                                      font = (TRIPLET_FONT, -TRIPLET_HEIGHT),
-                                      anchor = NW)
-        else: # clear
-          if pos in self._grid.keys():
-            del self._grid[pos]
-            self._canvas.delete(self._canvasitems[pos])
-            del self._canvasitems[pos]
-    self.raiseRuler()
+    width = len(self._clipboard[0]) // OP_LENGTH
+    old = self._grid.rect(self._selection[0], width, len(self._clipboard),
+                          EMPTY_CELL)
+    deltas = self._grid.setRect(self._selection[0], self._clipboard)
+    if deltas:
+      self._journal.recordRect(self._selection[0], width, old,
+                               self._clipboard)
+    self.cellsChanged(deltas)
+    self.scheduleText()
+
+  ###############
+  # clearSelection
+  #   Empties the selected cells in one pass.
+  def clearSelection(self):
+    old = self.selectionRows()
+    deltas = self._grid.clearRect(*self._selection)
+    if deltas:
+      self._journal.recordRect(self._selection[0],
+                               len(old[0]) // OP_LENGTH, old, None)
+    self.cellsChanged(deltas)
+    self.scheduleText()
+
+  ###############
+  # selectionRows
+  #   Returns the selected cells as one string per
+  #   row, with EMPTY_CELL for empty cells.
+  def selectionRows(self):
+    return self._grid.rect(self._selection[0],
+                           self._selection[1][0] - self._selection[0][0] + 1,
+                           self._selection[1][1] - self._selection[0][1] + 1,
+                           EMPTY_CELL)
+
+  ###############
+  # undo
+  #   Undoes the last edit.
+  def undo(self, event = None):
+    self.journalChanged(self._journal.undo(self._grid))
+
+  ###############
+  # redo
+  #   Redoes the last undone edit.
+  def redo(self, event = None):
+    self.journalChanged(self._journal.redo(self._grid))
+
+  ###############
+  # journalChanged
+  #   Updates everything after an undo or redo
+  #   changed the grid, given its deltas.
+  def journalChanged(self, deltas):
+    if deltas is None:
+      return
+    self.cellsChanged(deltas)
+    self.scheduleText()
+    self._insertindex = 0
+
+  ###############
+  # setCell
+  #   Sets a grid cell to a triplet, or clears it if
+  #   triplet is None, and updates its text on the
+  #   canvas. Returns the (coord, old, new) delta.
+  def setCell(self, coord, triplet):
+    old = self._grid.get(coord)
+    if triplet is None:
+      if old is not None:
+        del self._grid[coord]
+    else:
+      self._grid[coord] = triplet
+    self.updateText(coord)
+    return (coord, old, triplet)
+
+  ###############
+  # cellsChanged
+  #   Tells everything derived from the grid about
+  #   edited cells, given (coord, old, new) deltas.
+  def cellsChanged(self, deltas):
+    self._dirtyrows.update(coord[1] for coord, old, new in deltas)
+    if deltas:
+      self._cachekey = None # no longer the file's contents
+    if self._trace is not None and deltas:
+      self.endTrace() # its machine runs the old program
+    if self._listing is not None and deltas:
+      self.stopListing() # so does the loop's
+    if self._cycle is not None and deltas:
+      self.clearCycle()
+    if self._profile is not None and deltas:
+      self._profile = None # counts of the old program
+      self.colorSelection(True)
+      self.scheduleAnalysis() # the status bar named its hottest cell
+    if self._blocks is not None and deltas:
+      self._blocks.invalidate(deltas)
+    if self._index is not None and deltas:
+      self._index.update(deltas)
+      if self._search is not None:
+        self._search.update(deltas)
+    if self._analysis is not None and deltas:
+      self._analysis.invalidate(deltas)
+      self.scheduleAnalysis()
+    if deltas:
+      self._minimap.invalidate(deltas)
+      self.scheduleMinimap()
+
   ###############
   # b1Action
   #   Performs the left-click action.
@@ -293,15 +635,15 @@ class Editor(Frame):
   def b1Action(self, event):
     if event.x < CANVAS_OFFSET[0] or event.y < CANVAS_OFFSET[1]:
       return # ignore
-    self.colorSelection("normal")
 
-    x = (event.x - CANVAS_OFFSET[0]) // TRIPLET_WIDTH
-    y = (event.y - CANVAS_OFFSET[1]) // TRIPLET_HEIGHT
+    x = (event.x - CANVAS_OFFSET[0]) // self._cellsize[0]
+    y = (event.y - CANVAS_OFFSET[1]) // self._cellsize[1]
     self._position = (x + self._canvastopleft[0], y + self._canvastopleft[1])
     self._insertindex = 0
     self._selection = [self._position, self._position]
+    self._journal.seal()
 
-    self.colorSelection("active")
+    self.scheduleRender()
 
   ###############
   # b1Drag
@@ -310,8 +652,8 @@ class Editor(Frame):
   def b1Drag(self, event):
     if event.x < CANVAS_OFFSET[0] or event.y < CANVAS_OFFSET[1]:
       return # ignore
-    x = (event.x - CANVAS_OFFSET[0]) // TRIPLET_WIDTH
-    y = (event.y - CANVAS_OFFSET[1]) // TRIPLET_HEIGHT
+    x = (event.x - CANVAS_OFFSET[0]) // self._cellsize[0]
+    y = (event.y - CANVAS_OFFSET[1]) // self._cellsize[1]
     curr = (x + self._canvastopleft[0], y + self._canvastopleft[1])
     
     if self._selection[0][0] > curr[0]: # x
@@ -327,88 +669,157 @@ class Editor(Frame):
     self._position = curr # update pos
 
     # recolor
-    self.colorSelection("active")
+    self.scheduleRender()
     self._insertindex = 0
+    self._journal.seal()
 
   ###############
-  # colorSelection
-  #   Colors the selection's rectangles.
-  def colorSelection(self, mode):
-    if mode == "active":
-      mode_fill = SELECTED_FILL
-      mode_border_color = SELECTED_BORDER_COLOR
-      mode_border_width = SELECTED_BORDER_WIDTH
-    elif mode == "normal":
-      mode_fill = NORMAL_FILL
-      mode_border_color = NORMAL_BORDER_COLOR
-      mode_border_width = NORMAL_BORDER_WIDTH
-    for x in range(self._selection[0][0], self._selection[1][0] + 1):
-      for y in range(self._selection[0][1], self._selection[1][1] + 1):
-        if self.isInView(x, y): # valid rectangle
-          rect = (x - self._canvastopleft[0], y - self._canvastopleft[1])
-          self._canvas.itemconfig(self._rects[rect],
-                                  fill = mode_fill,
-                                  outline = mode_border_color,
-                                  width = mode_border_width)
-    if mode == "active" and self.isInView(self._position):
-        rect = (self._position[0] - self._canvastopleft[0],
-                self._position[1] - self._canvastopleft[1])
-        self._canvas.itemconfig(self._rects[rect],
-                                fill = ACTIVE_FILL,
-                                outline = ACTIVE_BORDER_COLOR,
-                                width = ACTIVE_BORDER_WIDTH)
+  # scheduleRender
+  #   Requests a redraw of the selection (and the
+  #   view, if it moved) once Tk is idle, so a burst
+  #   of events is drawn only once.
+  def scheduleRender(self):
+    if not self._renderpending:
+      self._renderpending = True
+      self.after_idle(self.flushRender)
 
+  ###############
+  # flushRender
+  #   Draws everything recorded since the last render.
+  def flushRender(self):
+    self._renderpending = False
+    if self._viewdirty:
+      self._viewdirty = False
+      self._textdirty = False
+      self.redrawText()
+      self.renumberRulers()
+      self.colorSelection(True)
+      self.drawMinimapView()
+      self.drawScrollbars()
+    else:
+      if self._textdirty:
+        self._textdirty = False
+        self.redrawText()
+      self.colorSelection()
+      self.drawScrollbars()
+    if self._tracearrow is not None:
+      self.drawTraceArrow()
 
+  ###############
+  # scheduleText
+  #   Requests a redraw of the text in view, for
+  #   edits of many cells at once, so the canvas is
+  #   touched once per cell in view rather than once
+  #   per edited cell.
+  def scheduleText(self):
+    self._textdirty = True
+    self.scheduleRender()
+
+  ###############
+  # colorSelection
+  #   Colors the selection's rectangles, only touching
+  #   rectangles whose style changed. Unless full is
+  #   set, only the old and new selections are checked.
+  def colorSelection(self, full = False):
+    if not self._textmode:
+      rects = ()
+      self.drawMarks()
+    elif full:
+      rects = self._rects.keys()
+    else:
+      rects = set()
+      for sel in (self._drawnselection, self._selection,
+                  [self._drawnposition] * 2, [self._position] * 2,
+                  [self._drawntrace] * 2, [self._tracecell] * 2):
+        if sel[0] is not None:
+          rects.update(self.viewRects(sel[0], sel[1]))
+    for rect in rects:
+      coord = (rect[0] + self._canvastopleft[0], rect[1] + self._canvastopleft[1])
+      if coord == self._tracecell:
+        state = "trace"
+      elif coord == self._position:
+        state = "active"
+      elif (self._selection[0][0] <= coord[0] <= self._selection[1][0] and
+            self._selection[0][1] <= coord[1] <= self._selection[1][1]):
+        state = "selected"
+      elif self._cycle is not None and coord in self._cycle:
+        state = "cycle"
+      elif self._profile is not None:
+        heat = self._profile.heat(coord, self._profiletop)
+        state = "heat{}".format(heat) if heat else "normal"
+      else:
+        state = "normal"
+      if self._rectstate[rect] != state:
+        style = RECT_STYLES[state]
+        self._canvas.itemconfig(self._rects[rect],
+                                fill = style[0],
+                                outline = style[1],
+                                width = style[2])
+        self._rectstate[rect] = state
+    self._drawnselection = list(self._selection)
+    self._drawnposition = self._position
+    self._drawntrace = self._tracecell
 
+  ###############
+  # viewRects
+  #   Returns the rects showing the coords between
+  #   topleft and botright that are in view.
+  def viewRects(self, topleft, botright):
+    left = max(topleft[0], self._canvastopleft[0]) - self._canvastopleft[0]
+    top = max(topleft[1], self._canvastopleft[1]) - self._canvastopleft[1]
+    right = min(botright[0] - self._canvastopleft[0], self._viewsize[0] - 1)
+    bottom = min(botright[1] - self._canvastopleft[1], self._viewsize[1] - 1)
+    return [(x, y) for x in range(left, right + 1)
+                   for y in range(top, bottom + 1)]
 
   ###############
   # moveLeft
   #   Moves active cell to left.
   def moveLeft(self, event = None):
-    self.colorSelection("normal")
     self._position = (self._position[0] - 1, self._position[1])
     self._selection = [self._position, self._position]
     if not self.isInView(self._position):
       self.shiftView("left")
     self._insertindex = 0
-    self.colorSelection("active")
+    self._journal.seal()
+    self.scheduleRender()
 
 
   ###############
   # moveRight
   #   Moves active cell to right.
   def moveRight(self, event = None):
-    self.colorSelection("normal")
     self._position = (self._position[0] + 1, self._position[1])
     self._selection = [self._position, self._position]
     if not self.isInView(self._position):
       self.shiftView("right")
     self._insertindex = 0
-    self.colorSelection("active")
+    self._journal.seal()
+    self.scheduleRender()
 
   ###############
   # moveUp
   #   Moves active cell upwards.
   def moveUp(self, event = None):
-    self.colorSelection("normal")
     self._position = (self._position[0], self._position[1] - 1)
     self._selection = [self._position, self._position]
     if not self.isInView(self._position):
       self.shiftView("up")
     self._insertindex = 0
-    self.colorSelection("active")
+    self._journal.seal()
+    self.scheduleRender()
 
   ###############
   # moveDown
   #   Moves active cell downwards.
   def moveDown(self, event = None):
-    self.colorSelection("normal")
     self._position = (self._position[0], self._position[1] + 1)
     self._selection = [self._position, self._position]
     if not self.isInView(self._position):
       self.shiftView("down")
     self._insertindex = 0
-    self.colorSelection("active")
+    self._journal.seal()
+    self.scheduleRender()
 
   def selectLeft(self, event = None):
     self._position = (self._position[0] - 1, self._position[1])
@@ -417,8 +828,9 @@ class Editor(Frame):
       self._selection[0] = (self._position[0], self._selection[0][1])
 
     # recolor
-    self.colorSelection("active")
+    self.scheduleRender()
     self._insertindex = 0
+    self._journal.seal()
 
   def selectRight(self, event = None):
     self._position = (self._position[0] + 1, self._position[1])
@@ -427,8 +839,9 @@ class Editor(Frame):
       self._selection[1] = (self._position[0], self._selection[1][1])
 
     # recolor
-    self.colorSelection("active")
+    self.scheduleRender()
     self._insertindex = 0
+    self._journal.seal()
 
   def selectUp(self, event = None):
     self._position = (self._position[0], self._position[1] - 1)
@@ -437,8 +850,9 @@ class Editor(Frame):
       self._selection[0] = (self._selection[0][0], self._position[1])
 
     # recolor
-    self.colorSelection("active")
+    self.scheduleRender()
     self._insertindex = 0
+    self._journal.seal()
 
   def selectDown(self, event = None):
     self._position = (self._position[0], self._position[1] + 1)
@@ -447,54 +861,38 @@ class Editor(Frame):
       self._selection[1] = (self._selection[1][0], self._position[1])
 
     # recolor
-    self.colorSelection("active")
+    self.scheduleRender()
     self._insertindex = 0
+    self._journal.seal()
 
   ###############
   # keyPress
   #   If a character is valid input, enters that
   #   character at the current pointer
   def keyPress(self, event):
-    print("'{}' pressed: char is '{}', type is '{}', state is '{}'".format(event.keysym,event.char, event.type, event.state))
-
     if (event.char != "" and event.char != "\t" and
         event.keysym != "Return" and
         (0 <= event.state and event.state < 4 or
          8 <= event.state and event.state < 12)): # valid key entry, not a shortcut
-      print("char should be entered")
-
+      self.continueTyping()
       # reset selection
       if (self._selection[0] != self._selection[1]):
-        for x in range(self._selection[0][0], self._selection[1][0] + 1):
-          for y in range(self._selection[0][1], self._selection[1][1] + 1):
-            if (x,y) != self._position and self.isInView(x, y):
-              rect = (x - self._canvastopleft[0], y - self._canvastopleft[1])
-              self._canvas.itemconfig(self._rects[rect],
-                                      fill = NORMAL_FILL,
-                                      outline = NORMAL_BORDER_COLOR,
-                                      width = NORMAL_BORDER_WIDTH)
         self._selection = [self._position, self._position]
+        self.scheduleRender()
 
       # update text
+      cell = self._grid.get(self._position, "   ")
       if self._insertindex == 0:
-        self._grid[self._position] = event.char + "  "
+        cell = event.char + "  "
       elif self._insertindex == 1:
-        self._grid[self._position] = self._grid[self._position][0] + event.char + " "
+        cell = cell[0] + event.char + " "
       elif self._insertindex == 2:
-        self._grid[self._position] = self._grid[self._position][0:2] + event.char
+        cell = cell[0:2] + event.char
       self._insertindex += 1
-
-      if self._position in self._canvasitems.keys():
-        self._canvas.itemconfig(self._canvasitems[self._position],
-                                text = self._grid[self._position])
-      else:
-        loc = self.getCanvasLoc(self._position)
-        self._canvasitems[self._position] = self._canvas.create_text(loc[0],
-                                              loc[1],
-                                              text = self._grid[self._position],
-                                              font = (TRIPLET_FONT, -TRIPLET_HEIGHT),
-                                              anchor = NW)
-        self.raiseRuler()
+      deltas = [self.setCell(self._position, cell)]
+      self._journal.recordCells(deltas, typing = True)
+      self._typingat = self._position
+      self.cellsChanged(deltas)
 
       if self._insertindex == 3:
         self.advance()
@@ -528,7 +926,6 @@ class Editor(Frame):
   # advance
   #   Moves position in the current direction.
   def advance(self, delta = 1):
-    self.colorSelection("normal")
     if self._direction == "up":
       self._position = (self._position[0], self._position[1] - delta)
     elif self._direction == "down":
@@ -537,46 +934,146 @@ class Editor(Frame):
       self._position = (self._position[0] - delta, self._position[1])
     elif self._direction == "right":
       self._position = (self._position[0] + delta, self._position[1])
-    rect_idx = (self._position[0] - self._canvastopleft[0],
-                self._position[1] - self._canvastopleft[1])
-    if not self.isInView(self._position):
-      self.shiftView()
+    if self._position[0] < self._canvastopleft[0]:
+      self.shiftView("left")
+    elif self._position[0] >= self._canvastopleft[0] + self._viewsize[0]:
+      self.shiftView("right")
+    elif self._position[1] < self._canvastopleft[1]:
+      self.shiftView("up")
+    elif self._position[1] >= self._canvastopleft[1] + self._viewsize[1]:
+      self.shiftView("down")
 
     self._selection = [self._position, self._position]
     self._insertindex = 0
-    self.colorSelection("active")
+    self._typingat = self._position
+    self.scheduleRender()
 
   ###############
   # shiftView
-  #   Shifts the view in a given direction
-  #   in relation to the file data (text).
+  #   Shifts the view a number of spaces in a given
+  #   direction in relation to the file data (text).
   def shiftView(self, direction, spaces = 1):
-    self.colorSelection("normal")
     if direction == "up":
-      self._canvastopleft = (self._canvastopleft[0],
-                             self._canvastopleft[1] - 1)
-      self.shiftCanvasText("down")
+      self.moveView((self._canvastopleft[0], self._canvastopleft[1] - spaces))
     elif direction == "down":
-      self._canvastopleft = (self._canvastopleft[0],
-                             self._canvastopleft[1] + 1)
-      self.shiftCanvasText("up")
+      self.moveView((self._canvastopleft[0], self._canvastopleft[1] + spaces))
     elif direction == "left":
-      self._canvastopleft = (self._canvastopleft[0] - 1,
-                             self._canvastopleft[1])
-      self.shiftCanvasText("right")
+      self.moveView((self._canvastopleft[0] - spaces, self._canvastopleft[1]))
     elif direction == "right":
-      self._canvastopleft = (self._canvastopleft[0] + 1,
-                             self._canvastopleft[1])
-      self.shiftCanvasText("left")
+      self.moveView((self._canvastopleft[0] + spaces, self._canvastopleft[1]))
 
-    # renumber rulers
-    for x in range(NUM_TRIPLETS_X):
-        self._canvas.itemconfig(self._rulers["x"][x],
-                                text = str(self._canvastopleft[0] + x))
-    for y in range(NUM_TRIPLETS_Y):
-        self._canvas.itemconfig(self._rulers["y"][y],
-                                text = str(self._canvastopleft[1] + y))
-    self.colorSelection("active")
+  ###############
+  # moveView
+  #   Puts the view's top left cell at topleft in
+  #   one step. The next render redraws the view
+  #   once, however far it moved.
+  def moveView(self, topleft):
+    if topleft != self._canvastopleft:
+      self._canvastopleft = topleft
+      self._viewdirty = True
+      self.scheduleRender()
+
+  ###############
+  # scrollExtent
+  #   Returns the (first, end) cells along an axis
+  #   (0 for x, 1 for y) the scrollbars cover: the
+  #   grid's cells and the view.
+  def scrollExtent(self, axis):
+    first = self._canvastopleft[axis]
+    end = first + self._viewsize[axis]
+    bounds = self._grid.bounds()
+    if bounds is not None:
+      first = min(first, bounds[axis])
+      end = max(end, bounds[axis + 2] + 1)
+    return first, end
+
+  ###############
+  # drawScrollbars
+  #   Sets the scrollbars to where the view is in
+  #   the scroll extent, if that changed.
+  def drawScrollbars(self):
+    for axis, scrollbar in enumerate((self._xscroll, self._yscroll)):
+      first, end = self.scrollExtent(axis)
+      start = self._canvastopleft[axis]
+      shown = ((start - first) / (end - first),
+               (start + self._viewsize[axis] - first) / (end - first))
+      if self._scrollshown[axis] != shown:
+        scrollbar.set(*shown)
+        self._scrollshown = (self._scrollshown[:axis] + (shown,) +
+                             self._scrollshown[axis + 1:])
+
+  ###############
+  # scrollView
+  #   Moves the view for a scrollbar along an axis:
+  #   ("moveto", fraction) drags it, ("scroll", n,
+  #   "units" or "pages") steps it by cells or views.
+  def scrollView(self, axis, action, amount, what = "units"):
+    start = self._canvastopleft[axis]
+    if action == "moveto":
+      first, end = self.scrollExtent(axis)
+      start = first + round(float(amount) * (end - first))
+    elif what == "pages":
+      start += int(amount) * max(1, self._viewsize[axis] - 1)
+    else:
+      start += int(amount)
+    topleft = list(self._canvastopleft)
+    topleft[axis] = start
+    self.moveView(tuple(topleft))
+
+  ###############
+  # wheel
+  #   Scrolls the view with the mouse wheel:
+  #   sideways with Shift held, and zooming
+  #   with Control held.
+  def wheel(self, event):
+    if event.num in (4, 5): # X11 reports the wheel as buttons
+      notches = -1 if event.num == 4 else 1
+    else:
+      notches = max(1, abs(event.delta) // 120)
+      if event.delta > 0:
+        notches = -notches
+    if event.state & 0x4:
+      self.setZoom(self._zoom - notches)
+    elif event.state & 0x1:
+      self.scrollView(0, "scroll", notches * WHEEL_CELLS)
+    else:
+      self.scrollView(1, "scroll", notches * WHEEL_CELLS)
+
+  ###############
+  # renumberRulers
+  #   Labels the rulers with the coords in view,
+  #   every rulerStep cells, only touching labels
+  #   that move or change.
+  def renumberRulers(self):
+    for axis, name in enumerate("xy"):
+      step = self.rulerStep(axis)
+      start = self._canvastopleft[axis]
+      first = -(-start // step) * step # first multiple of step in view
+      for i, item in enumerate(self._rulers[name]):
+        offset = first + i * step - start
+        text = str(first + i * step) if offset < self._viewsize[axis] else ""
+        shown = self._rulershown[item]
+        if shown[0] != offset:
+          middle = CANVAS_OFFSET[axis] + (offset + 0.5) * self._cellsize[axis]
+          if axis == 0:
+            self._canvas.coords(item, middle, CANVAS_OFFSET[1] / 2)
+          else:
+            self._canvas.coords(item, CANVAS_OFFSET[0] / 2, middle)
+        if shown[1] != text:
+          self._canvas.itemconfig(item, text = text)
+        self._rulershown[item] = (offset, text)
+
+  ###############
+  # rulerStep
+  #   Returns how many cells apart the labels of
+  #   a ruler are (axis 0 for x, 1 for y): the
+  #   smallest of 1, 2, 5, 10, 20, 50... that
+  #   keeps them RULER_LABEL_SPACING apart.
+  def rulerStep(self, axis):
+    step = 1
+    while step * self._cellsize[axis] < RULER_LABEL_SPACING[axis]:
+      step = step * 5 // 2 if str(step)[0] == "2" else step * 2
+    return step
 
   ###############
   # isInView
@@ -585,52 +1082,156 @@ class Editor(Frame):
     if isinstance(coordorx, int):
       coordorx = (coordorx, y)
     return (self._canvastopleft[0] <= coordorx[0] and
-            coordorx[0] < self._canvastopleft[0] + NUM_TRIPLETS_X and
+            coordorx[0] < self._canvastopleft[0] + self._viewsize[0] and
             self._canvastopleft[1] <= coordorx[1] and
-            coordorx[1] < self._canvastopleft[1] + NUM_TRIPLETS_Y)
+            coordorx[1] < self._canvastopleft[1] + self._viewsize[1])
     
   ###############
   # reloadCanvasItems
-  #   Reloads canvasitems from the grid.
+  #   Rebuilds the canvas and fills the
+  #   text pool from the grid.
   def reloadCanvasItems(self):
     self._canvas.delete("all")
-    self.initCanvasRects()
-    for key in self._grid.keys():
-      loc = self.getCanvasLoc(key)
-      self._canvasitems[key] = self._canvas.create_text(loc[0], loc[1],
-                                text = self._grid[key],
-                                font = (TRIPLET_FONT, -TRIPLET_HEIGHT),
-                                anchor = NW)
+    self._rects = {}
+    self._rectstate = {}
+    self._texts = {}
+    self._textcache = {}
+    self.stopOverlay()
+    if self._textmode:
+      self.initCanvasRects()
+      self.initCanvasText()
+    else:
+      self.initCanvasBlocks()
+    self._tracearrow = self._canvas.create_line(0, 0, 0, 0, arrow = LAST,
+                                                fill = TRACE_ARROW_COLOR,
+                                                width = TRACE_ARROW_WIDTH,
+                                                state = HIDDEN)
     self.initCanvasRulers() # must be last to keep above other items
+    self.redrawText()
+    self.renumberRulers()
+    self.colorSelection(True)
+    self.drawScrollbars()
+
+  ###############
+  # redrawText
+  #   Rebinds every item in the text pool to
+  #   the grid cell currently under it. Cost
+  #   depends on the view size, not the grid size.
+  def redrawText(self):
+    if not self._textmode:
+      self.drawBlocks()
+      return
+    rows = self._grid.rect(self._canvastopleft, self._viewsize[0],
+                           self._viewsize[1], EMPTY_CELL)
+    for rect, item in self._texts.items():
+      text = rowCell(rows[rect[1]], rect[0]) or ""
+      if self._textcache[rect] != text:
+        self._canvas.itemconfig(item, text = text)
+        self._textcache[rect] = text
+
+  ###############
+  # updateText
+  #   Refreshes the pool item showing the given
+  #   grid coord, if that coord is in view. In
+  #   block mode, the blocks are redrawn on the
+  #   next render instead.
+  def updateText(self, coord):
+    if not self._textmode:
+      self._textdirty = self._textdirty or self.isInView(coord)
+    elif self.isInView(coord):
+      rect = (coord[0] - self._canvastopleft[0],
+              coord[1] - self._canvastopleft[1])
+      text = self._grid.get(coord, "")
+      if self._textcache[rect] != text:
+        self._canvas.itemconfig(self._texts[rect], text = text)
+        self._textcache[rect] = text
 
   ###############
   # initCanvasRects
-  #   Initializes canvas cells.
-  def initCanvasRects(self):
-    for x in range(NUM_TRIPLETS_X):
-      for y in range(NUM_TRIPLETS_Y):
-        loc = self.getCanvasLoc(x,y)
-        self._rects[(x,y)] = self._canvas.create_rectangle(loc[0], loc[1],
-                                loc[0] + TRIPLET_WIDTH,
-                                loc[1] + TRIPLET_HEIGHT,
-                                fill = NORMAL_FILL,
-                                outline = NORMAL_BORDER_COLOR,
-                                width = NORMAL_BORDER_WIDTH)
-    
-    rect = (self._position[0] - self._canvastopleft[0],
-            self._position[1] - self._canvastopleft[1])
-    self._canvas.itemconfig(self._rects[(0, 0)],
-                            fill = ACTIVE_FILL,
-                            outline = ACTIVE_BORDER_COLOR,
-                            width = ACTIVE_BORDER_WIDTH)
+  #   Initializes canvas cells, all those in
+  #   view or just the given rects.
+  def initCanvasRects(self, rects = None):
+    if rects is None:
+      rects = self.viewRects(self._canvastopleft, (1 << 62, 1 << 62))
+    for x, y in rects:
+      loc = self.getCanvasLoc(x + self._canvastopleft[0],
+                              y + self._canvastopleft[1])
+      self._rects[(x,y)] = self._canvas.create_rectangle(loc[0], loc[1],
+                              loc[0] + self._cellsize[0],
+                              loc[1] + self._cellsize[1],
+                              fill = NORMAL_FILL,
+                              outline = NORMAL_BORDER_COLOR,
+                              width = NORMAL_BORDER_WIDTH)
+      self._rectstate[(x,y)] = "normal"
+
+  ###############
+  # initCanvasText
+  #   Initializes the text item pool, one item
+  #   per canvas cell, or just the given rects.
+  def initCanvasText(self, rects = None):
+    if rects is None:
+      rects = self.viewRects(self._canvastopleft, (1 << 62, 1 << 62))
+    for x, y in rects:
+      loc = self.getCanvasLoc(x + self._canvastopleft[0],
+                              y + self._canvastopleft[1])
+      self._texts[(x,y)] = self._canvas.create_text(loc[0], loc[1],
+                             text = "",
+                             font = (TRIPLET_FONT, -self._cellsize[1]),
+                             anchor = NW)
+      self._textcache[(x,y)] = ""
+
+  ###############
+  # initCanvasBlocks
+  #   Initializes block mode: one image of the
+  #   cells in view, and rects outlining the
+  #   selection, active cell and trace cell.
+  def initCanvasBlocks(self):
+    self._blockimage = self._canvas.create_image(CANVAS_OFFSET, anchor = NW)
+    self._marks = {}
+    for state in ("selected", "active", "trace"):
+      style = RECT_STYLES[state]
+      self._marks[state] = self._canvas.create_rectangle(
+        0, 0, 0, 0, outline = style[1], width = style[2], state = HIDDEN)
+
+  ###############
+  # drawBlocks
+  #   Draws the cells in view as blocks colored by
+  #   their kind of command (as on the minimap):
+  #   one pixel per cell, scaled up by Tk.
+  def drawBlocks(self):
+    width, height = self._viewsize
+    rows = self._grid.rect(self._canvastopleft, width, height, EMPTY_CELL)
+    small = PhotoImage(width = width, height = height)
+    small.put(" ".join("{" + blockColors(row) + "}" for row in rows))
+    self._blockphoto = small.zoom(*self._cellsize)
+    self._canvas.itemconfig(self._blockimage, image = self._blockphoto)
+
+  ###############
+  # drawMarks
+  #   Outlines the selection, active cell and
+  #   trace cell in block mode.
+  def drawMarks(self):
+    for state, (topleft, botright) in (("selected", self._selection),
+                                       ("active", [self._position] * 2),
+                                       ("trace", [self._tracecell] * 2)):
+      item = self._marks[state]
+      if topleft is None or (state == "selected" and topleft == botright):
+        self._canvas.itemconfig(item, state = HIDDEN)
+        continue
+      left, top = self.getCanvasLoc(topleft)
+      right, bottom = self.getCanvasLoc(botright[0] + 1, botright[1] + 1)
+      self._canvas.coords(item, left, top, right, bottom)
+      self._canvas.itemconfig(item, state = NORMAL)
 
   ###############
   # initCanvasRulers
   #   Initializes canvas rulers.
   def initCanvasRulers(self):
+    right, bottom = self.getCanvasLoc(self._canvastopleft[0] + self._viewsize[0],
+                                      self._canvastopleft[1] + self._viewsize[1])
     self._rulers["xrect"] = self._canvas.create_rectangle(CANVAS_OFFSET[0],
                               0,
-                              CANVAS_WIDTH + BORDER_OFFSET,
+                              right + BORDER_OFFSET,
                               CANVAS_OFFSET[1],
                               fill = RULER_FILL,
                               outline = RULER_BORDER_COLOR,
@@ -638,7 +1239,7 @@ class Editor(Frame):
     self._rulers["yrect"] = self._canvas.create_rectangle(0,
                               CANVAS_OFFSET[1],
                               CANVAS_OFFSET[0],
-                              CANVAS_HEIGHT + BORDER_OFFSET,
+                              bottom + BORDER_OFFSET,
                               fill = RULER_FILL,
                               outline = RULER_BORDER_COLOR,
                               width = RULER_BORDER_WIDTH)
@@ -650,20 +1251,15 @@ class Editor(Frame):
                               outline = RULER_BORDER_COLOR,
                               width = RULER_BORDER_WIDTH)
 
-    self._rulers["x"] = []
-    for x in range(self._canvastopleft[0], NUM_TRIPLETS_X + 1):
-      text = self._canvas.create_text(CANVAS_OFFSET[0] + (x + 0.5) * TRIPLET_WIDTH,
-                                      CANVAS_OFFSET[1] / 2,
-                                      text = str(x),
-                                      font = (TRIPLET_FONT, -RULER_WIDTH * 4 // 5))
-      self._rulers["x"].append(text)
-    self._rulers["y"] = []
-    for y in range(self._canvastopleft[1], NUM_TRIPLETS_Y + 1):
-      text = self._canvas.create_text(CANVAS_OFFSET[0] / 2,
-                                      CANVAS_OFFSET[1] + (y + 0.5) * TRIPLET_HEIGHT,
-                                      text = str(y),
-                                      font = (TRIPLET_FONT, -RULER_WIDTH * 4 // 5))
-      self._rulers["y"].append(text)
+    # a pool of labels, placed by renumberRulers
+    self._rulershown = {}
+    for axis, name in enumerate("xy"):
+      self._rulers[name] = []
+      for i in range(self._viewsize[axis] // self.rulerStep(axis) + 1):
+        text = self._canvas.create_text(0, 0, text = "",
+                                        font = (TRIPLET_FONT, -RULER_WIDTH * 4 // 5))
+        self._rulers[name].append(text)
+        self._rulershown[text] = (None, "")
 
   ###############
   # raiseRuler
@@ -682,65 +1278,49 @@ class Editor(Frame):
   #   Returns all positions in grid that
   #   contain a given string.
   def findByData(self, data):
-    locs = []
-    for key, val in self._grid.items():
-      if data in val:
-        locs.append(key)
-    return locs
+    return self.tripletIndex().find(data)
+
+  ###############
+  # tripletIndex
+  #   Returns the index of the grid's triplets,
+  #   building it on first use.
+  def tripletIndex(self):
+    if self._index is None:
+      self._index = TripletIndex(self._grid)
+    return self._index
 
   ###############
   # findByX
   #   Returns all positions in grid with given x loc.
   def findByX(self, xVal):
-    locs = []
-    for key in self._grid.keys():
-      if key[0] == xVal:
-        locs.append(key)
-    return locs
+    return self._grid.column(xVal)
 
   ##############
   # findByY
   #   Returns all positions in grid with given y loc.
   def findByY(self, yVal):
-    locs = []
-    for key in self._grid.keys():
-      if key[1] == yVal:
-        locs.append(key)
-    return locs
+    return self._grid.row(yVal)
 
   ###############
   # dimensions
   #   Returns the width and height
   #   of the current flow program.
   def dimensions(self):
-    minX = 0
-    minY = 0
-    maxX = 0
-    maxY = 0
-    for key in self._grid.keys():
-      if key[0] < minX:
-        minX = key[0]
-      if key[1] < minY:
-        minY = key[1]
-      if key[0] > maxX:
-        maxX = key[0]
-      if key[1] > maxY:
-        maxY = key[1]
-    return (maxX - minX, maxY - minY)
+    bounds = self._grid.bounds()
+    if bounds is None:
+      return (0, 0)
+    return (max(bounds[2], 0) - min(bounds[0], 0),
+            max(bounds[3], 0) - min(bounds[1], 0))
 
   ################
   # getTopLeft
   #   Gets the leftmost and upmost coordinates
   #   in the current flow program.
   def getTopLeft(self):
-    minX = 0
-    minY = 0
-    for key in self._grid.keys():
-      if key[0] < minX:
-        minX = key[0]
-      if key[1] < minY:
-        minY = key[1]
-    return (minX, minY)
+    bounds = self._grid.bounds()
+    if bounds is None:
+      return (0, 0)
+    return (min(bounds[0], 0), min(bounds[1], 0))
 
 
   ##################
@@ -748,50 +1328,157 @@ class Editor(Frame):
   #   Gets location of a coordinate on canvas
   def getCanvasLoc(self, coordorx, y = -1):
     if isinstance(coordorx, int):
-      return ((coordorx - self._canvastopleft[0]) * TRIPLET_WIDTH + CANVAS_OFFSET[0],
-              (y - self._canvastopleft[1]) * TRIPLET_HEIGHT + CANVAS_OFFSET[0])
+      return ((coordorx - self._canvastopleft[0]) * self._cellsize[0] + CANVAS_OFFSET[0],
+              (y - self._canvastopleft[1]) * self._cellsize[1] + CANVAS_OFFSET[0])
     else:
-      return ((coordorx[0] - self._canvastopleft[0]) * TRIPLET_WIDTH + CANVAS_OFFSET[0],
-              (coordorx[1] - self._canvastopleft[1]) * TRIPLET_HEIGHT + CANVAS_OFFSET[1])
+      return ((coordorx[0] - self._canvastopleft[0]) * self._cellsize[0] + CANVAS_OFFSET[0],
+              (coordorx[1] - self._canvastopleft[1]) * self._cellsize[1] + CANVAS_OFFSET[1])
 
   ##################
-  # shiftCanvasText
-  #   Shifts all text elements of the canvas
-  #   in given direction by one triplet.
-  def shiftCanvasText(self, direction, cells = 1):
-    for key, val in self._canvasitems.items():
-      if direction == "right":
-        self._canvas.move(val, TRIPLET_WIDTH * cells, 0)
-      elif direction == "left":
-        self._canvas.move(val, -TRIPLET_WIDTH * cells, 0)
-      elif direction == "up":
-        self._canvas.move(val, 0, -TRIPLET_HEIGHT * cells)
-      elif direction == "down":
-        self._canvas.move(val, 0, TRIPLET_HEIGHT * cells)
+  # canvasResized
+  #   Notes the canvas's new size, fitting the
+  #   view to it once resizing pauses.
+  def canvasResized(self, event):
+    if (event.width, event.height) == self._canvassize:
+      return
+    self._canvassize = (event.width, event.height)
+    if not self._resizepending:
+      self._resizepending = True
+      self.after(RESIZE_DELAY, self.fitView)
+
+  ##################
+  # fitView
+  #   Sizes the view to the cells that fit the
+  #   canvas, growing or shrinking the rect and
+  #   text pools to match, or switching between
+  #   text and block mode.
+  def fitView(self):
+    self._resizepending = False
+    viewsize = self.cellsThatFit()
+    if viewsize == self._viewsize:
+      return
+    oldrects = set(self.viewRects(self._canvastopleft, (1 << 62, 1 << 62)))
+    self._viewsize = viewsize
+    textmode = self.useText()
+    if textmode != self._textmode:
+      self._textmode = textmode
+      self.reloadCanvasItems()
+      return
+    if textmode:
+      newrects = set(self.viewRects(self._canvastopleft, (1 << 62, 1 << 62)))
+      for rect in oldrects - newrects:
+        self._canvas.delete(self._rects.pop(rect))
+        self._canvas.delete(self._texts.pop(rect))
+        del self._rectstate[rect]
+        del self._textcache[rect]
+      self.initCanvasRects(sorted(newrects - oldrects))
+      self.initCanvasText(sorted(newrects - oldrects))
+    for name in ("xrect", "yrect", "square"):
+      self._canvas.delete(self._rulers[name])
+    for item in self._rulers["x"] + self._rulers["y"]:
+      self._canvas.delete(item)
+    self._canvas.tag_raise(self._tracearrow)
+    self.initCanvasRulers()
+    self._viewdirty = True
+    self.scheduleRender()
+
+  ##################
+  # cellsThatFit
+  #   Returns the (columns, rows) of cells, even
+  #   partly shown, that fit the canvas at the
+  #   current zoom.
+  def cellsThatFit(self):
+    return tuple(max(1, -(-(max(self._canvassize[axis], CANVAS_MIN_SIZE) -
+                            CANVAS_OFFSET[axis] - BORDER_OFFSET) // self._cellsize[axis]))
+                 for axis in (0, 1))
+
+  ##################
+  # useText
+  #   True if cells at the current zoom and view
+  #   size are drawn as text, not blocks.
+  def useText(self):
+    return (self._cellsize[1] >= TEXT_MIN_HEIGHT and
+            self._viewsize[0] * self._viewsize[1] <= TEXT_MAX_CELLS)
+
+  ##################
+  # zoomIn
+  #   Makes cells bigger.
+  def zoomIn(self, event = None):
+    self.setZoom(self._zoom + 1)
+
+  ##################
+  # zoomOut
+  #   Makes cells smaller, to see more.
+  def zoomOut(self, event = None):
+    self.setZoom(self._zoom - 1)
+
+  ##################
+  # zoomReset
+  #   Goes back to the normal cell size.
+  def zoomReset(self, event = None):
+    self.setZoom(DEFAULT_ZOOM)
+
+  ##################
+  # setZoom
+  #   Sets the zoom level, keeping the cell in the
+  #   middle of the view there, and rebuilds the
+  #   canvas for the new cell size.
+  def setZoom(self, zoom):
+    zoom = min(max(zoom, 0), len(ZOOM_HEIGHTS) - 1)
+    if zoom == self._zoom:
+      return
+    middle = (self._canvastopleft[0] + self._viewsize[0] // 2,
+              self._canvastopleft[1] + self._viewsize[1] // 2)
+    self._zoom = zoom
+    self._cellsize = (2 * ZOOM_HEIGHTS[zoom], ZOOM_HEIGHTS[zoom])
+    self._viewsize = self.cellsThatFit()
+    self._textmode = self.useText()
+    self._canvastopleft = (middle[0] - self._viewsize[0] // 2,
+                           middle[1] - self._viewsize[1] // 2)
+    self.reloadCanvasItems()
+    self.drawMinimapView()
 
   ##################
   # new
   #   Creates new file. If one is loaded,
   #   prompts user to save.
   def new(self, event = None):
+    self.endTrace()
     if self._grid.items() != BASE_GRID.items():
       self.promptSave()
+    self.finishSave()
+    self.cacheProgram(True)
+    self._cachekey = None
     self._openfile = ""
-    self._grid = {(0,0): "#> "}
-    self.colorSelection("normal")
+    self._grid = FlowGrid(BASE_GRID)
+    self._dirtyrows = set()
+    self._blocks = None
+    self._journal = EditJournal()
+    self._index = None
+    self._search = None
+    self._analysis = None
     self._position = (0,0)
     self._selection = [(0, 0), (0, 0)]
     self._canvastopleft = (0, 0)
-    self.colorSelection("active")
     self._insertindex = 0
+    self._minimap.reset(self._grid)
+    self._profile = None
+    self.stopListing()
+    self._cycle = None
     self.reloadCanvasItems()
+    self.scheduleAnalysis()
+    self.scheduleMinimap()
 
   ##################
   # promptSave
-  #   Prompts user to save file.
+  #   Prompts user to save file. Declining also
+  #   drops the file's autosaved changes.
   def promptSave(self):
     if messagebox.askquestion("Save","Data will be lost.\nWould you like to save?") == "yes":
       self.save()
+    elif self._openfile != "":
+      self.finishSave()
+      removeAutosave(self._openfile)
 
   ##################
   # closeProgram
@@ -799,6 +1486,10 @@ class Editor(Frame):
   def closeProgram(self, event = None):
     if self._grid.items() != BASE_GRID.items():
       self.promptSave()
+    self.finishSave()
+    self.cacheProgram(True)
+    self.finishCache()
+    self.dumpInstrument()
     self.master.destroy()
 
   ##################
@@ -816,25 +1507,48 @@ class Editor(Frame):
   # loadIn
   #   Loads a file in.
   def loadIn(self):
-    f = open(self._openfile,'r')
-    lineList = f.readlines()
-    f.close()
-
-    x = 0
-    y = 0
-    for line in lineList:
-      for i in range(0,len(line),3):
-        if i + 3 < len(line):
-          triplet = line[i:i + 3]
-          self._grid[(x,y)] = triplet.replace("\n","")
-        else:
-          triplet = line[i:]
-          self._grid[(x,y)] = triplet.replace("\n","") + " "*(3 - len(triplet))
-        x += 1
-      x = 0
-      y += 1
-
+    self.endTrace()
+    self.finishSave()
+    self.cacheProgram(True)
+    cached = self._cache.loadFile(self._openfile)
+    if cached is None:
+      messagebox.showerror("Open", ERROR_MESSAGES[INVALID_FILE])
+      self._openfile = ""
+      return
+    grid, error = cached.grid, cached.error
+    self._cachekey = cached.key
+    self._loaderror = error
+    self._cachedsize = derivedSize(cached.analysis, cached.blocks)
+
+    if hasAutosave(self._openfile):
+      if messagebox.askquestion("Open", "This file has autosaved changes "
+                                "that were never saved.\nRecover them?") == "yes":
+        replayRows(grid, self._openfile)
+        cached.analysis = cached.blocks = None
+        self._cachekey = None
+      else:
+        removeAutosave(self._openfile)
+
+    self._grid = grid
+    self._dirtyrows = set()
+    self._blocks = cached.blocks
+    self._journal = EditJournal()
+    self._index = None
+    self._search = None
+    self._analysis = cached.analysis
+    self._position = (0,0)
+    self._selection = [(0, 0), (0, 0)]
+    self._canvastopleft = (0, 0)
+    self._insertindex = 0
+    self._minimap.reset(self._grid)
+    self._profile = None
+    self.stopListing()
+    self._cycle = None
     self.reloadCanvasItems()
+    self.scheduleAnalysis()
+    self.scheduleMinimap()
+    if error != NO_ERROR:
+      messagebox.showwarning("Open", ERROR_MESSAGES[error])
 
 
   ##################
@@ -845,38 +1559,108 @@ class Editor(Frame):
     if self._openfile == "":
       self.saveAs()
     else:
-      outfile = open(self._openfile, 'w')
-      outfile.write(self.convertToStr())
-      outfile.close()
+      self.writeOut()
 
   ##################
   # saveAs
   #   Initiates dialog to save current file.
   def saveAs(self, event = None):
+    oldfile = self._openfile
     self._openfile = filedialog.asksaveasfilename(
       filetypes = [("Flow files", "*.fl")])
     if self._openfile != "" and self._openfile[-3:] != ".fl":
       self._openfile += ".fl"
     if self._openfile != "":
-      outfile = open(self._openfile, 'w')
-      outfile.write(self.convertToStr())
-      outfile.close()
+      if oldfile != "" and oldfile != self._openfile:
+        self.finishSave()
+        removeAutosave(oldfile) # its changes go to the new file
+      self.writeOut()
+
+  ##################
+  # writeOut
+  #   Starts writing a snapshot of the grid to the
+  #   open file on a worker thread. pollSave warns
+  #   if the program would not load in Flow.
+  def writeOut(self):
+    self.finishSave()
+    self.startSave(BackgroundSave(saveFile, self._grid.copy(), self._openfile),
+                   self._dirtyrows, True)
+    self._dirtyrows = set()
+
+  ##################
+  # autosave
+  #   Appends the rows changed since the last save
+  #   or autosave to the open file's autosave log,
+  #   on a worker thread. Runs every AUTOSAVE_INTERVAL.
+  def autosave(self):
+    self.after(AUTOSAVE_INTERVAL, self.autosave)
+    if self._openfile == "" or not self._dirtyrows or self._saving is not None:
+      return
+    rows = [rowRecord(self._grid, y) for y in sorted(self._dirtyrows)]
+    self.startSave(BackgroundSave(appendRows, self._openfile, rows),
+                   self._dirtyrows, False)
+    self._dirtyrows = set()
+
+  ##################
+  # startSave
+  #   Tracks a save just started, covering rows,
+  #   until pollSave sees it finish. full is True
+  #   for a save of the whole file.
+  def startSave(self, saving, rows, full):
+    self._saving = saving
+    self._savingfile = self._openfile
+    self._savingrows = rows
+    self._savingfull = full
+    self._savestatus.config(text = "Saving...")
+    self.after(SAVE_POLL, self.pollSave)
+
+  ##################
+  # pollSave
+  #   Shows the running save's progress, and
+  #   finishes it once it is done.
+  def pollSave(self):
+    if self._saving is None:
+      return
+    if self._saving.done:
+      self.finishSave()
+    else:
+      self._savestatus.config(text = "Saving... {}%".format(
+        int(self._saving.progress * 100)))
+      self.after(SAVE_POLL, self.pollSave)
+
+  ##################
+  # finishSave
+  #   Waits for the running save, if any, then
+  #   reports how it went. A full save that worked
+  #   makes the autosave log redundant; if a save
+  #   failed, its rows are autosaved again later.
+  def finishSave(self):
+    saving = self._saving
+    if saving is None:
+      return
+    saving.wait()
+    self._saving = None
+    if not saving.saved:
+      self._dirtyrows |= self._savingrows
+      self._savestatus.config(text = "Save failed")
+      messagebox.showerror("Save", "Could not save {}:\n{}".format(
+        self._savingfile, saving.failure or "the save was interrupted"))
+      return
+    if self._savingfull:
+      removeAutosave(self._savingfile)
+      self._savestatus.config(text = "Saved")
+    else:
+      self._savestatus.config(text = "Autosaved")
+    if saving.error != NO_ERROR:
+      messagebox.showwarning("Save", ERROR_MESSAGES[saving.error])
 
   ##################
   # convertToStr
   #   Converts the grid to a string
   def convertToStr(self):
-    retStr = ""
-    topLeft = self.getTopLeft()
-    dim = self.dimensions()
-    for y in range(topLeft[1],topLeft[1] + dim[1] + 1):
-      for x in range(topLeft[0], topLeft[0] + dim[0] + 1):
-        if (x,y) in self._grid.keys():
-          retStr += self._grid[(x,y)]
-        else:
-          retStr += "   "
-      retStr += "\n"
-    return retStr
+    out = io.StringIO()
+    writeGrid(self._grid, out)
+    return out.getvalue()
 
   ##################
   # exit
@@ -884,19 +1668,678 @@ class Editor(Frame):
   def exit(self):
     if self._openfile != "":
       self.promptSave()
+    self.finishSave()
+    self.cacheProgram(True)
+    self.finishCache()
+    self.dumpInstrument()
     self.master.quit()
 
   ##################
   # find
   #   Initiates dialog to find a string in the file.
   def find(self, event = None):
-    print("find called")
+    last = "" if self._search is None else self._search.text
+    text = simpledialog.askstring("Find", "Find cells containing:",
+                                  parent = self, initialvalue = last)
+    if not text:
+      return
+    self._search = Search(self.tripletIndex(), text)
+    self.findNext()
+
+  ##################
+  # findNext
+  #   Jumps to the next match of the last search.
+  def findNext(self, event = None):
+    if self._search is None:
+      self.find()
+    else:
+      self.showMatch(self._search.next(self._position))
+
+  ##################
+  # findPrevious
+  #   Jumps to the previous match of the last search.
+  def findPrevious(self, event = None):
+    if self._search is None:
+      self.find()
+    else:
+      self.showMatch(self._search.previous(self._position))
+
+  ##################
+  # showMatch
+  #   Moves to a search match, or says there
+  #   are none if coord is None.
+  def showMatch(self, coord):
+    if coord is None:
+      messagebox.showinfo("Find", "No cells contain \"{}\".".format(self._search.text))
+      return
+    self.jumpTo(coord)
+
+  ##################
+  # jumpTo
+  #   Makes coord the active cell, centering
+  #   the view on it if it is out of view.
+  def jumpTo(self, coord):
+    self._position = coord
+    self._selection = [coord, coord]
+    self._insertindex = 0
+    self._journal.seal()
+    if not self.isInView(coord):
+      self.centerView(coord)
+    self.scheduleRender()
+
+  ##################
+  # centerView
+  #   Moves the view so coord is in its middle.
+  def centerView(self, coord):
+    self.moveView((coord[0] - self._viewsize[0] // 2,
+                   coord[1] - self._viewsize[1] // 2))
 
   ##################
   # goto
   #   Initiates dialog to goto a coordinate in the file.
   def goto(self, event = None):
-    print("goto called")
+    text = simpledialog.askstring("Goto", "Go to cell (x, y):", parent = self)
+    if text is None:
+      return
+    try:
+      x, y = (int(value) for value in text.replace(",", " ").split())
+    except ValueError:
+      messagebox.showwarning("Goto", "Enter a cell as two numbers, like 12, 40.")
+      return
+    self.jumpTo((x, y))
+
+  ##################
+  # runProgram
+  #   Runs the program in the grid with the Python
+  #   engine on the console's input, and shows what
+  #   it printed in the console. With Detect Hangs on,
+  #   a run that loops forever is stopped early and
+  #   its loop highlighted.
+  def runProgram(self, event = None):
+    data = self.programInput()
+    if data is None:
+      return
+    machine = FlowMachine(self.blockCache().program, data)
+    self.startConsole(machine)
+    self.clearCycle()
+    if not self._detecthangs.get():
+      self._blocks.run(machine, RUN_TICK_LIMIT)
+      self.showOutput(machine)
+      return
+    watch = HangWatch(machine)
+    if watch.run(self._blocks, RUN_TICK_LIMIT):
+      self.listCycle(watch)
+    else:
+      self.showOutput(machine)
+
+  ##################
+  # listCycle
+  #   Lists the cells of the endless loop a run was
+  #   found in, a chunk of ticks per call so the
+  #   editor stays responsive, then highlights the
+  #   loop and shows the run's output.
+  def listCycle(self, watch):
+    cycle = watch.listCycle(CYCLE_CHUNK)
+    if cycle is None:
+      self._listing = (watch, self.after(CYCLE_DELAY, self.listCycle, watch))
+      return
+    self._listing = None
+    self._cycle = set(cycle.cells)
+    self.colorSelection(True)
+    if cycle.cells and not self.isInView(cycle.cells[0]):
+      self.centerView(cycle.cells[0])
+    self.showOutput(watch.machine, cycle)
+
+  ##################
+  # stopListing
+  #   Stops listing a run's loop, if one is being
+  #   listed, and shows the run's output as is.
+  def stopListing(self):
+    if self._listing is not None:
+      watch, after = self._listing
+      self._listing = None
+      self.after_cancel(after)
+      self.showOutput(watch.machine)
+
+  ##################
+  # clearCycle
+  #   Removes the highlight of a run's
+  #   endless loop.
+  def clearCycle(self):
+    if self._cycle is not None:
+      self._cycle = None
+      self.colorSelection(True)
+
+  ##################
+  # blockCache
+  #   Returns the compiled program,
+  #   building it on first use.
+  def blockCache(self):
+    if self._blocks is None:
+      self._blocks = BlockCache(self._grid)
+    return self._blocks
+
+  ##################
+  # startTrace
+  #   Sets up a trace of the program on the console's
+  #   input, paused at its start command. Returns
+  #   False if there is nothing to trace.
+  def startTrace(self):
+    if self._trace is not None:
+      return True
+    program = self.blockCache().program
+    if program.error != NO_ERROR:
+      messagebox.showwarning("Trace", ERROR_MESSAGES[program.error])
+      return False
+    data = self.programInput()
+    if data is None:
+      return False
+    self._trace = FlowTrace(self._blocks, data)
+    self.startConsole(self._trace.machine)
+    self.showTrace()
+    return True
+
+  ##################
+  # trace
+  #   Runs the program, showing where it is
+  #   once per frame, until paused.
+  def trace(self, event = None):
+    if self.startTrace():
+      self._tracetarget = None
+      self.resumeTrace()
+
+  ##################
+  # runToCursor
+  #   Runs the program until flow reaches
+  #   the active cell.
+  def runToCursor(self, event = None):
+    if not self.startTrace():
+      return
+    if not self._trace.machine.program.contains(self._position):
+      messagebox.showinfo("Trace", "Flow never reaches cells outside the program.")
+      return
+    self._tracetarget = self._position
+    self.resumeTrace()
+
+  ##################
+  # resumeTrace
+  #   Schedules trace frames, unless they
+  #   already are.
+  def resumeTrace(self):
+    if not self._tracerunning:
+      self._tracerunning = True
+      self.after(TRACE_FRAME, self.traceFrame)
+
+  ##################
+  # pauseTrace
+  #   Stops running the trace after this frame.
+  def pauseTrace(self, event = None):
+    self._tracerunning = False
+    if self._trace is not None:
+      self.showTrace()
+
+  ##################
+  # stepTrace
+  #   Runs one tick of the trace, starting
+  #   one if needed.
+  def stepTrace(self, event = None):
+    if self._trace is None:
+      self.startTrace()
+      return
+    self._tracerunning = False
+    self._trace.step()
+    self.showTrace()
+    if self._trace.done():
+      self.stopTrace()
+
+  ##################
+  # traceFrame
+  #   Runs the trace for a slice of time, then
+  #   shows where it got to. The engine runs many
+  #   ticks between frames, so drawing does not
+  #   hold it back.
+  def traceFrame(self):
+    if not self._tracerunning or self._trace is None:
+      return
+    if self._tracetarget is None:
+      self._trace.runFor(TRACE_SLICE)
+    else:
+      index = self._trace.machine.program.index(self._tracetarget)
+      if self._trace.runTo(index, TRACE_SLICE):
+        self._tracerunning = False
+    self.showTrace()
+    if self._trace.done():
+      self.stopTrace()
+    elif self._tracerunning:
+      self.after(TRACE_FRAME, self.traceFrame)
+
+  ##################
+  # showTrace
+  #   Highlights the trace's cell and flow
+  #   direction, bringing the cell into view,
+  #   and adds its new output to the console.
+  def showTrace(self):
+    machine = self._trace.machine
+    self.flushConsole()
+    coord = machine.position()
+    if not self.isInView(coord):
+      self.centerView(coord)
+    self._tracecell = coord
+    self._status.config(text = "{} at {} going {}, {} ticks".format(
+      "Tracing" if self._tracerunning else "Paused", coord,
+      DIR_NAMES[machine.direction], machine.ticks))
+    self.scheduleRender()
+
+  ##################
+  # drawTraceArrow
+  #   Points the trace arrow from the trace's
+  #   cell in its flow direction, or hides it.
+  def drawTraceArrow(self):
+    if self._trace is None or not self.isInView(self._tracecell):
+      self._canvas.itemconfig(self._tracearrow, state = HIDDEN)
+      return
+    dx, dy = DIR_DELTAS[self._trace.machine.direction]
+    x, y = self.getCanvasLoc(self._tracecell)
+    width, height = self._cellsize
+    x += width // 2
+    y += height // 2
+    self._canvas.coords(self._tracearrow, x, y,
+                        x + dx * width * 3 // 4,
+                        y + dy * height * 3 // 4)
+    self._canvas.itemconfig(self._tracearrow, state = NORMAL)
+
+  ##################
+  # stopTrace
+  #   Ends the trace and shows its output.
+  def stopTrace(self, event = None):
+    machine = self.endTrace()
+    if machine is not None:
+      self.showOutput(machine)
+
+  ##################
+  # endTrace
+  #   Ends the trace, if any, clearing its
+  #   highlight. Returns its machine, or None.
+  def endTrace(self):
+    trace = self._trace
+    if trace is None:
+      return None
+    self._trace = None
+    self._tracerunning = False
+    self._tracecell = None
+    self.scheduleRender()
+    self.updateStatus()
+    return trace.machine
+
+  ##################
+  # profileProgram
+  #   Runs the program like runProgram, counting
+  #   how often each cell runs, and shows the
+  #   counts as a heatmap.
+  def profileProgram(self, event = None):
+    data = self.programInput()
+    if data is None:
+      return
+    blocks = self.blockCache()
+    machine = FlowMachine(blocks.program, data)
+    self.startConsole(machine)
+    profile = FlowProfile(blocks.program)
+    blocks.runProfiled(machine, profile, RUN_TICK_LIMIT)
+    profile.finish(blocks, machine)
+    hottest = profile.hottest()
+    self._profile = profile
+    self._profiletop = hottest[0] if hottest else 0
+    self.colorSelection(True)
+    if hottest:
+      self._status.config(text = "Profiled {} ticks, hottest cell {} ran {} times".format(
+        profile.ticks, hottest[1], hottest[0]))
+    self.showOutput(machine)
+
+  ##################
+  # clearProfile
+  #   Removes the heatmap.
+  def clearProfile(self, event = None):
+    if self._profile is not None:
+      self._profile = None
+      self.colorSelection(True)
+      self.updateStatus()
+
+  ##################
+  # exportProfile
+  #   Saves the last profile's counts as CSV or
+  #   JSON, chosen by the file's extension.
+  def exportProfile(self, event = None):
+    if self._profile is None:
+      messagebox.showinfo("Export Profile", "Profile the program first (Run->Profile).")
+      return
+    filename = filedialog.asksaveasfilename(
+      defaultextension = ".csv",
+      filetypes = [("CSV files", "*.csv"), ("JSON files", "*.json")])
+    if not filename:
+      return
+    try:
+      with open(filename, 'w', newline = "") as outfile:
+        if filename.lower().endswith(".json"):
+          self._profile.writeJSON(self._grid, outfile)
+        else:
+          self._profile.writeCSV(self._grid, outfile)
+    except OSError as failure:
+      messagebox.showerror("Export Profile", "Could not save {}:\n{}".format(
+        filename, failure))
+
+  ##################
+  # exportC
+  #   Translates the program to C and compiles it
+  #   with the local cc, or just saves the C if
+  #   the file's name ends in .c.
+  def exportC(self, event = None):
+    source = gridSource(self._grid)
+    if source.error != NO_ERROR:
+      messagebox.showwarning("Export to C", ERROR_MESSAGES[source.error])
+      return
+    filename = filedialog.asksaveasfilename(
+      filetypes = [("Programs", "*"), ("C files", "*.c")])
+    if not filename:
+      return
+    text = FlowTranspiler(source).cSource(
+      os.path.basename(self._openfile) or "untitled.fl")
+    try:
+      if filename.lower().endswith(".c"):
+        with open(filename, 'w') as outfile:
+          outfile.write(text)
+      else:
+        compileC(text, filename)
+    except (OSError, RuntimeError) as failure:
+      messagebox.showerror("Export to C", "Could not save {}:\n{}".format(
+        filename, failure))
+      return
+    self._status.config(text = "Exported {}".format(filename))
+
+  ##################
+  # showOutput
+  #   Finishes showing a machine's output in the
+  #   console with how its run ended, or the
+  #   endless loop it was stopped in.
+  def showOutput(self, machine, cycle = None):
+    if cycle is not None:
+      status = cycle.message()
+    elif machine.error != NO_ERROR:
+      status = machine.errorMessage()
+    elif machine.complete:
+      status = "[Flow] Program exited successfully."
+    else:
+      status = "[Flow] Stopped after {} ticks.".format(machine.ticks)
+
+    self.flushConsole()
+    self.writeConsole("\n" + status + "\n")
+    self._console = None
+
+  ##################
+  # programInput
+  #   Returns the input a run reads: the input file's
+  #   bytes, or the typed input and a newline. Returns
+  #   None if the file cannot be read.
+  def programInput(self):
+    if not self._inputfile:
+      return (self._inputvar.get() + "\n").encode()
+    try:
+      with open(self._inputfile, 'rb') as infile:
+        return infile.read()
+    except OSError as failure:
+      messagebox.showerror("Input", "Could not read {}:\n{}".format(
+        self._inputfile, failure))
+      return None
+
+  ##################
+  # inputFile
+  #   Chooses a file for runs to read
+  #   their input from.
+  def inputFile(self, event = None):
+    filename = filedialog.askopenfilename()
+    if filename:
+      self._inputfile = filename
+      self._inputentry.config(state = DISABLED)
+      self._inputlabel.config(text = "from " + os.path.basename(filename))
+
+  ##################
+  # typeInput
+  #   Goes back to reading input from
+  #   the input box.
+  def typeInput(self, event = None):
+    self._inputfile = ""
+    self._inputentry.config(state = NORMAL)
+    self._inputlabel.config(text = "")
+    self._inputentry.focus_set()
+
+  ##################
+  # startConsole
+  #   Clears the console to show a
+  #   machine's output.
+  def startConsole(self, machine):
+    self.stopListing()
+    self.clearConsole()
+    self._console = machine
+
+  ##################
+  # clearConsole
+  #   Empties the console.
+  def clearConsole(self, event = None):
+    self._console = None
+    self._consoleshown = 0
+    self._consolesize = 0
+    self._consoletext.config(state = NORMAL)
+    self._consoletext.delete("1.0", END)
+    self._consoletext.config(state = DISABLED)
+
+  ##################
+  # flushConsole
+  #   Adds the output the console's machine printed
+  #   since the last flush, in one insert. Output that
+  #   would be dropped straight away is skipped.
+  def flushConsole(self):
+    if self._console is None:
+      return
+    output = self._console.output
+    if len(output) > self._consoleshown:
+      start = max(self._consoleshown, len(output) - CONSOLE_LIMIT)
+      self._consoleshown = len(output)
+      self.writeConsole(output[start:].decode("latin-1"))
+
+  ##################
+  # writeConsole
+  #   Appends text to the console, dropping its
+  #   oldest characters past CONSOLE_LIMIT.
+  def writeConsole(self, text):
+    self._consoletext.config(state = NORMAL)
+    self._consoletext.insert(END, text)
+    self._consolesize += len(text)
+    if self._consolesize > CONSOLE_LIMIT:
+      self._consoletext.delete("1.0", "1.0 + {} chars".format(
+        self._consolesize - CONSOLE_LIMIT))
+      self._consolesize = CONSOLE_LIMIT
+    self._consoletext.config(state = DISABLED)
+    self._consoletext.see(END)
+
+  ##################
+  # flowAnalysis
+  #   Returns the control-flow analysis of the
+  #   grid, building it on first use.
+  def flowAnalysis(self):
+    if self._analysis is None:
+      self._analysis = FlowAnalysis(self._grid)
+    return self._analysis
+
+  ##################
+  # scheduleAnalysis
+  #   Re-analyzes the program once edits have
+  #   paused, so typing is not slowed down.
+  def scheduleAnalysis(self):
+    if not self._analysispending:
+      self._analysispending = True
+      self.after(ANALYSIS_DELAY, self.updateStatus)
+
+  ##################
+  # updateStatus
+  #   Shows the analysis of the program
+  #   in the status bar.
+  def updateStatus(self):
+    self._analysispending = False
+    self._status.config(text = self.flowAnalysis().report().summary())
+    self.cacheProgram()
+
+  ##################
+  # cacheProgram
+  #   Stores the file as loaded in the on-disk
+  #   cache, with its analysis and compiled blocks,
+  #   unless it has been edited since or nothing
+  #   new has been worked out since last time. A
+  #   snapshot is written on a BackgroundSave; if
+  #   the last one is still writing, this waits for
+  #   it when wait is set and otherwise leaves the
+  #   store to a later call.
+  def cacheProgram(self, wait = False):
+    if self._cachekey is None:
+      return
+    size = derivedSize(self._analysis, self._blocks)
+    if size == self._cachedsize:
+      return
+    if self._caching is not None and not self._caching.done:
+      if not wait:
+        return
+      self._caching.wait()
+    self._caching = BackgroundSave(self._cache.store, snapshotProgram(
+      self._cachekey, self._grid, self._loaderror, self._analysis, self._blocks))
+    self._cachedsize = size
+
+  ##################
+  # finishCache
+  #   Waits for the cache entry being written, if
+  #   any. A failed write just leaves it uncached.
+  def finishCache(self):
+    if self._caching is not None:
+      self._caching.wait()
+      self._caching = None
+
+  ##################
+  # scheduleMinimap
+  #   Redraws the edited parts of the minimap
+  #   once edits have paused.
+  def scheduleMinimap(self):
+    if not self._minimappending:
+      self._minimappending = True
+      self.after(MINIMAP_DELAY, self.updateMinimap)
+
+  ##################
+  # updateMinimap
+  #   Puts the minimap's changed pixels into
+  #   its image.
+  def updateMinimap(self):
+    self._minimappending = False
+    puts, full = self._minimap.updates()
+    for data, to in puts:
+      self._minimapimage.put(data, to = to)
+    if full:
+      self.drawMinimapView()
+
+  ##################
+  # drawMinimapView
+  #   Outlines the part of the grid in view
+  #   on the minimap.
+  def drawMinimapView(self):
+    left, top = self._minimap.pixel(self._canvastopleft)
+    right, bottom = self._minimap.pixel((self._canvastopleft[0] + self._viewsize[0],
+                                         self._canvastopleft[1] + self._viewsize[1]))
+    self._minimapcanvas.coords(self._minimapview,
+                               left + MINIMAP_BORDER, top + MINIMAP_BORDER,
+                               right + MINIMAP_BORDER, bottom + MINIMAP_BORDER)
+
+  ##################
+  # minimapClick
+  #   Centers the view on the cells under a click
+  #   or drag on the minimap.
+  def minimapClick(self, event):
+    self.centerView(self._minimap.coord(event.x - MINIMAP_BORDER,
+                                        event.y - MINIMAP_BORDER))
+
+  ##################
+  # checkFlow
+  #   Lists where the program's flow goes wrong:
+  #   leaks, bad cells, no way back to the start,
+  #   and cells no path reaches.
+  def checkFlow(self, event = None):
+    report = self.flowAnalysis().report()
+    if report.error != NO_ERROR:
+      messagebox.showwarning("Check Flow", ERROR_MESSAGES[report.error])
+      return
+    lines = []
+    for coord, direction in sorted(report.leaks)[:CHECK_LIST_LIMIT]:
+      lines.append("Flow leaves the file going {} from {}.".format(
+        DIR_NAMES[direction], coord))
+    for coord, error in sorted(report.failures)[:CHECK_LIST_LIMIT]:
+      lines.append("{} at cell {}.".format(ERROR_MESSAGES[error], coord))
+    if not report.returns:
+      lines.append("No path returns to the start command.")
+    unreachable = sorted(report.unreachable(self._grid),
+                         key = lambda coord: (coord[1], coord[0]))
+    if unreachable:
+      lines.append("Unreachable cells: {}, first at {}.".format(
+        len(unreachable), unreachable[0]))
+    if not lines:
+      lines.append("Every cell is reachable and no path leaves the file.")
+    messagebox.showinfo("Check Flow", "\n".join(lines))
+
+  ##################
+  # toggleOverlay
+  #   Shows or hides the instrument's handler
+  #   timings over the cells.
+  def toggleOverlay(self, event = None):
+    if self._overlay is None:
+      self._overlay = (self._canvas.create_rectangle(0, 0, 0, 0, fill = OVERLAY_FILL),
+                       self._canvas.create_text(CANVAS_OFFSET, anchor = NW,
+                                                font = OVERLAY_FONT))
+      self.drawOverlay()
+    else:
+      for item in self._overlay:
+        self._canvas.delete(item)
+      self.stopOverlay()
+
+  ##################
+  # drawOverlay
+  #   Refreshes the debug overlay while
+  #   it is shown.
+  def drawOverlay(self):
+    if self._overlay is None:
+      return
+    rect, text = self._overlay
+    self._canvas.itemconfig(text, text = "\n".join(self._instrument.report()))
+    self._canvas.coords(rect, *self._canvas.bbox(text))
+    self._canvas.tag_raise(rect)
+    self._canvas.tag_raise(text)
+    self._overlayafter = self.after(OVERLAY_REFRESH, self.drawOverlay)
+
+  ##################
+  # stopOverlay
+  #   Forgets the debug overlay, once its items
+  #   are deleted, and cancels its next refresh
+  #   so showing it again starts just one.
+  def stopOverlay(self):
+    self._overlay = None
+    if self._overlayafter is not None:
+      self.after_cancel(self._overlayafter)
+      self._overlayafter = None
+
+  ##################
+  # dumpInstrument
+  #   Writes the instrument's timings to its
+  #   file, if instrumenting.
+  def dumpInstrument(self, event = None):
+    if self._instrument is None:
+      return
+    try:
+      self._instrument.dump()
+    except OSError as failure:
+      messagebox.showerror("Instrument", "Could not save {}:\n{}".format(
+        self._instrument.filename, failure))
 
   ##################
   # help
@@ -913,8 +2356,10 @@ def main():
   img = PhotoImage(file = ICON_FILE)
   root.tk.call('wm','iconphoto',root._w,img)
 
-  editor = Editor(root)
+  dumpfile = os.environ.get(INSTRUMENT_ENV)
+  editor = Editor(root, Instrument(dumpfile) if dumpfile else None)
 
   root.mainloop()
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+  main()
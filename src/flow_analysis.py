@@ -0,0 +1,227 @@
+#########################
+# flow_analysis.py
+# --------------
+# Static control-flow analysis of a Flow
+# program: which cells can run, where flow
+# can leave the file, and whether it can
+# get back to the start command.
+#########################
+
+from flow_common import *
+from flow_engine import *
+from flow_grid import gridExtent
+
+"████████████████████████████████   Analysis   ████████████████████████████████"
+
+
+######################
+# FlowPath
+#   A straight run of program flow, from moving out
+#   of a cell in a direction up to the next compare
+#   or the end of the run. Exits are the keys
+#   (index * 4 + direction) of the runs a compare
+#   branches into.
+######################
+class FlowPath:
+
+  def __init__(self):
+    self.cells = [] # indices crossed
+    self.exits = []
+    self.leak = None # (index, direction) flow leaves the file from
+    self.failure = None # index of a cell raising an error
+    self.returns = False # reaches the start command
+
+###############
+# compareTurns
+#   Returns the directions a compare can turn flow
+#   moving in direction d, as (op, arg) allow.
+def compareTurns(op, arg, d):
+  if op == OP_COMP_VAR and arg == ARG_LOADED:
+    return (d,) # compares the loaded variable to itself
+  turns = [d]
+  if op == OP_COMP_VAR or arg > 0:
+    turns.append(ROTATE_CCW[d]) # loaded var can be less
+  if op == OP_COMP_VAR or arg < 0xFF:
+    turns.append(ROTATE_CW[d]) # loaded var can be greater
+  return turns
+
+###############
+# walkPath
+#   Follows flow from index in direction d until a
+#   compare, the start command, an error, leaving
+#   the file, or a loop. Returns the FlowPath.
+def walkPath(program, index, d):
+  ops = program.ops
+  steps = program.steps
+  path = FlowPath()
+  seen = set()
+  i = index
+  while i * 4 + d not in seen:
+    seen.add(i * 4 + d)
+    j = i + steps[d]
+    op = ops[j]
+    if op == OP_LEAK:
+      path.leak = (i, d)
+      break
+    path.cells.append(j)
+    if op == OP_END:
+      path.returns = True
+      break
+    elif op == OP_FAIL:
+      path.failure = j
+      break
+    elif op == OP_COMP_IMM or op == OP_COMP_VAR:
+      path.exits = [j * 4 + turn
+                    for turn in compareTurns(op, program.args[j], d)]
+      break
+    elif OP_NOP < op <= OP_DOWN:
+      d = op - 1
+    i = j
+  return path
+
+
+######################
+# FlowReport
+#   The result of analyzing a program.
+######################
+class FlowReport:
+
+  def __init__(self, program, grid):
+    self.program = program
+    self.error = program.error # parse error, NO_ERROR if none
+    self.reachable = set() # indices flow can reach
+    self.leaks = set() # (coord, direction) flow leaves the file from
+    self.failures = set() # (coord, ErrCode) of reachable bad cells
+    self.returns = False # some path gets back to the start
+    self.cellcount = len(grid)
+    self.reachablecount = 0 # grid cells among reachable
+
+  ###############
+  # unreachable
+  #   Returns the coords of grid cells no path
+  #   reaches, in no particular order.
+  def unreachable(self, grid):
+    index = self.program.index
+    return [coord for coord in grid if index(coord) not in self.reachable]
+
+  ###############
+  # summary
+  #   One line describing the report.
+  def summary(self):
+    if self.error != NO_ERROR:
+      return ERROR_MESSAGES[self.error]
+    parts = ["{} of {} cells reachable".format(self.reachablecount,
+                                               self.cellcount)]
+    if self.leaks:
+      parts.append("{} leak{}".format(len(self.leaks),
+                                      "" if len(self.leaks) == 1 else "s"))
+    if self.failures:
+      parts.append("{} bad cell{}".format(len(self.failures),
+                                          "" if len(self.failures) == 1 else "s"))
+    if not self.returns:
+      parts.append("never returns to " + CMD_START)
+    return ", ".join(parts)
+
+
+######################
+# FlowAnalysis
+#   Control-flow graph of a grid's program, as
+#   FlowPaths keyed by (entry index, direction).
+#   Edited cells only drop the paths that cross
+#   them, so re-analyzing after an edit only
+#   walks those paths again.
+######################
+class FlowAnalysis:
+
+  ##############
+  # init
+  #   Lowers a grid, with no paths walked yet.
+  def __init__(self, grid):
+    self._grid = grid
+    self.reset()
+
+  ###############
+  # reset
+  #   Re-lowers the whole grid and drops all paths.
+  def reset(self):
+    self.program = FlowProgram(self._grid)
+    self._paths = {} # index * 4 + direction: FlowPath
+    self._cellpaths = {} # index: keys of paths crossing it
+    self._report = None
+
+  ###############
+  # invalidate
+  #   Updates the program after cells changed, given
+  #   (coord, old, new) deltas, and drops the paths
+  #   crossing them. If the program's extent changed,
+  #   everything is rebuilt on the next report.
+  def invalidate(self, deltas):
+    program = self.program
+    if not deltas or program is None:
+      return
+    if gridExtent(self._grid) != program.extent:
+      self.program = None
+      self._report = None
+      return
+    self._report = None
+    for coord, old, new in deltas:
+      if old == new or not program.contains(coord):
+        continue # nothing to re-lower, and no index to re-lower it at
+      program.updateCell(coord, old, new)
+      for key in self._cellpaths.pop(program.index(coord), ()):
+        self._paths.pop(key, None)
+    if program.start is None and program.starts > 0:
+      self.reset() # the start moved to a cell we cannot find cheaply
+
+  ###############
+  # path
+  #   Returns the FlowPath leaving index in
+  #   direction d, walking it if needed.
+  def path(self, index, d):
+    key = index * 4 + d
+    path = self._paths.get(key)
+    if path is None:
+      path = walkPath(self.program, index, d)
+      self._paths[key] = path
+      for cell in path.cells:
+        self._cellpaths.setdefault(cell, []).append(key)
+    return path
+
+  ###############
+  # report
+  #   Returns the FlowReport of every path from
+  #   the start command, reusing cached paths.
+  def report(self):
+    if self._report is not None:
+      return self._report
+    if self.program is None:
+      self.reset()
+    program = self.program
+    report = FlowReport(program, self._grid)
+    self._report = report
+    if program.error != NO_ERROR:
+      return report
+
+    report.reachable.add(program.start)
+    todo = [program.start * 4 + program.startdir]
+    done = set(todo)
+    while todo:
+      key = todo.pop()
+      path = self.path(key >> 2, key & 3)
+      report.reachable.update(path.cells)
+      if path.returns:
+        report.returns = True
+      if path.leak is not None:
+        report.leaks.add((program.coord(path.leak[0]), path.leak[1]))
+      if path.failure is not None:
+        report.failures.add((program.coord(path.failure),
+                             program.args[path.failure]))
+      for exit in path.exits:
+        if exit not in done:
+          done.add(exit)
+          todo.append(exit)
+
+    grid = self._grid
+    coord = program.coord
+    report.reachablecount = sum(1 for i in report.reachable if coord(i) in grid)
+    return report
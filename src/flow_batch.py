@@ -0,0 +1,243 @@
+#########################
+# flow_batch.py
+# --------------
+# Runs many Flow programs headless, in
+# parallel across a process pool, checking
+# each one's output, and writes one report.
+#
+# usage: python flow_batch.py manifest.json|prog.fl|dir ...
+#          [-j N] [-o report.json] [--ticks N] [--timeout S]
+#          [--no-hangs]
+#
+# A manifest is a JSON list of jobs like
+#   {"program": "sort.fl", "input": "5 3 9\n",
+#    "expected": "3 5 9", "error": 0,
+#    "ticks": 1000000, "timeout": 2.0, "hangs": true}
+# where only program is required. Input text is
+# one byte per character; for any bytes, give
+# "input_base64" or an "input_file" instead.
+# Paths are relative to the manifest. Without
+# expected, a job just reports what it printed.
+# Unless hangs is false, a job found to loop
+# forever is stopped early with a hang status. A
+# job that cannot be run at all, such as one
+# without a program, gets a job error status.
+#########################
+
+import argparse
+import base64
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import json
+import os
+import sys
+import time
+
+from flow_blocks import BlockCache
+from flow_common import *
+from flow_grid import loadFile
+from flow_hang import HangWatch
+from flow_trace import FlowTrace
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+BATCH_TICKS = 10000000 # default tick limit of a job
+BATCH_TIMEOUT = 10.0 # default seconds a job may run
+JOB_CHUNKS = 4 # chunks per worker the jobs are split into
+
+# job statuses
+PASSED = "pass"
+FAILED = "fail" # output or error not as expected
+RAN = "ran" # nothing expected
+TIMED_OUT = "timeout"
+HUNG = "hang" # loops forever
+TICK_LIMIT = "tick limit"
+LOAD_FAILED = "load error"
+JOB_ERROR = "job error" # the job itself is bad
+
+"█████████████████████████████████   Jobs   ███████████████████████████████████"
+
+
+###############
+# readManifest
+#   Returns the jobs of a manifest file, with
+#   paths made absolute. Entries that are not
+#   JSON objects become jobs with no program, to
+#   be reported as job errors.
+def readManifest(filename):
+  folder = os.path.dirname(os.path.abspath(filename))
+  with open(filename, 'r') as infile:
+    entries = json.load(infile)
+  jobs = []
+  for n, job in enumerate(entries):
+    if not isinstance(job, dict):
+      job = {}
+    if "program" not in job:
+      job.setdefault("name", "{} #{}".format(os.path.basename(filename), n + 1))
+    for key in ("program", "input_file"):
+      if isinstance(job.get(key), str):
+        job[key] = os.path.join(folder, job[key])
+    jobs.append(job)
+  return jobs
+
+###############
+# collectJobs
+#   Returns the jobs named on the command line:
+#   manifests, .fl files, and folders of them.
+def collectJobs(paths):
+  jobs = []
+  for path in paths:
+    if os.path.isdir(path):
+      jobs.extend({"program": name}
+                  for name in sorted(glob.glob(os.path.join(path, "*.fl"))))
+    elif path.endswith(".json"):
+      jobs.extend(readManifest(path))
+    else:
+      jobs.append({"program": path})
+  return jobs
+
+###############
+# jobInput
+#   Returns a job's input bytes: its input file,
+#   its base64 input, or its input text, one
+#   byte per character.
+def jobInput(job):
+  if "input_file" in job:
+    with open(job["input_file"], 'rb') as infile:
+      return infile.read()
+  if "input_base64" in job:
+    return base64.b64decode(job["input_base64"], validate = True)
+  try:
+    return job.get("input", "").encode("latin-1")
+  except UnicodeEncodeError:
+    raise ValueError("input has characters past U+00FF; "
+                     "give input_base64 or input_file instead")
+
+###############
+# runJob
+#   Runs one job with runProgram. Returns the
+#   job's result dict, with a job error status
+#   if the job could not be run. Runs in a
+#   worker process.
+def runJob(job):
+  start = time.perf_counter()
+  result = {"name": job.get("name", os.path.basename(str(job.get("program")))),
+            "program": job.get("program")}
+  try:
+    runProgram(job, result)
+  except Exception as failure:
+    result.update(status = JOB_ERROR, message = "{}: {}".format(
+      type(failure).__name__, failure))
+  result["seconds"] = time.perf_counter() - start
+  return result
+
+###############
+# runProgram
+#   Loads and runs a job's program with the
+#   block engine, stopping at its tick limit or
+#   timeout, or once it is found to loop forever.
+#   Fills in the job's result dict.
+def runProgram(job, result):
+  if not isinstance(job.get("program"), str):
+    raise ValueError("job has no program")
+  data = jobInput(job)
+  grid, error = loadFile(job["program"])
+  if grid is None:
+    result.update(status = LOAD_FAILED, message = ERROR_MESSAGES[error])
+    return
+
+  trace = FlowTrace(BlockCache(grid), data)
+  machine = trace.machine
+  ticks = job.get("ticks", BATCH_TICKS)
+  timeout = job.get("timeout", BATCH_TIMEOUT)
+  watch = HangWatch(machine) if job.get("hangs", True) else None
+  run = watch.run if watch is not None else (
+    lambda blocks, batch: blocks.run(machine, batch))
+  trace.slice(timeout, lambda batch: run(
+    trace.blocks, min(batch, ticks - machine.ticks)) or machine.ticks >= ticks)
+
+  output = machine.output.decode("latin-1")
+  result.update(ticks = machine.ticks, error = machine.error,
+                message = machine.errorMessage(), output = output)
+  if watch is not None and watch.search is not None:
+    cycle = watch.finishCycle()
+    result.update(status = HUNG, message = cycle.message(), cycle = cycle.cells)
+  elif not machine.done():
+    result["status"] = TICK_LIMIT if machine.ticks >= ticks else TIMED_OUT
+  elif "expected" not in job:
+    result["status"] = RAN
+  elif (output == job["expected"] and
+        machine.error == job.get("error", NO_ERROR)):
+    result["status"] = PASSED
+  else:
+    result["status"] = FAILED
+    result["expected"] = job["expected"]
+
+###############
+# runJobs
+#   Runs jobs across a pool of workers processes
+#   (one per CPU if workers is None). Returns
+#   their results, in the jobs' order.
+def runJobs(jobs, workers = None):
+  workers = workers or os.cpu_count() or 1
+  chunk = max(1, len(jobs) // (workers * JOB_CHUNKS))
+  with ProcessPoolExecutor(max_workers = workers) as pool:
+    return list(pool.map(runJob, jobs, chunksize = chunk))
+
+###############
+# summarize
+#   Returns the number of results with each
+#   status.
+def summarize(results):
+  counts = {}
+  for result in results:
+    counts[result["status"]] = counts.get(result["status"], 0) + 1
+  return counts
+
+
+"██████████████████████████████████   Main   ██████████████████████████████████"
+
+def main():
+  parser = argparse.ArgumentParser(description = "Run Flow programs in bulk.")
+  parser.add_argument("paths", nargs = "+",
+                      help = "manifests (.json), programs (.fl) or folders")
+  parser.add_argument("-j", "--jobs", type = int,
+                      help = "worker processes (default: one per CPU)")
+  parser.add_argument("-o", "--output", help = "JSON report to write "
+                      "(default: none)")
+  parser.add_argument("--ticks", type = int,
+                      help = "tick limit of jobs that do not set one")
+  parser.add_argument("--timeout", type = float,
+                      help = "seconds allowed jobs that do not set one")
+  parser.add_argument("--no-hangs", action = "store_true",
+                      help = "do not check jobs for endless loops")
+  args = parser.parse_args()
+
+  jobs = collectJobs(args.paths)
+  for job in jobs:
+    if args.ticks is not None:
+      job.setdefault("ticks", args.ticks)
+    if args.timeout is not None:
+      job.setdefault("timeout", args.timeout)
+    if args.no_hangs:
+      job["hangs"] = False
+  start = time.perf_counter()
+  results = runJobs(jobs, args.jobs)
+  seconds = time.perf_counter() - start
+
+  for result in results:
+    if result["status"] not in (PASSED, RAN):
+      print("{}: {} {}".format(result["name"], result["status"],
+                               result.get("message", "")).rstrip())
+  counts = summarize(results)
+  print("{} jobs in {:.2f}s: {}".format(len(results), seconds, ", ".join(
+    "{} {}".format(count, status) for status, count in sorted(counts.items()))))
+  if args.output:
+    with open(args.output, 'w') as outfile:
+      json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "seconds": seconds, "summary": counts,
+                 "results": results}, outfile, indent = 2)
+  sys.exit(0 if set(counts) <= {PASSED, RAN} else 1)
+
+if __name__ == "__main__":
+  main()
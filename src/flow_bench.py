@@ -0,0 +1,451 @@
+#########################
+# flow_bench.py
+# --------------
+# Benchmarks the editor's hot paths on large
+# synthetic and scaled-up sample grids, with
+# a stubbed tkinter so no display is needed,
+# and a program cache of its own. Writes the
+# timings as JSON.
+#
+# usage: python flow_bench.py [-o results.json]
+#          [--sizes 1000 10000 ...] [--repeat N]
+#########################
+
+import argparse
+import contextlib
+import glob
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tkinter
+import tkinter.constants
+import types
+
+from flow_save import removeAutosave
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+EDITOR_FILE = os.path.join(SRC_DIR, "Flow Editor.py")
+SAMPLES_GLOB = os.path.join(SRC_DIR, "..", "samples", "*.fl")
+
+SYNTHETIC_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6) # cells per grid
+SAMPLE_SIZE = 10 ** 5 # cells the samples are tiled up to
+REPEAT = 3 # runs of each benchmark; the best is kept
+SEED = 1
+
+# triplets synthetic grids are made of
+SYNTHETIC_TRIPLETS = (">  ", "v  ", "<  ", "^  ", "@gg", "'01", ",01",
+                      ":41", "+gh", "-01", "*02", "/03", "%04", "?hh",
+                      '"@ ', "~gi", ")gj", ";gk", "   ")
+
+SHIFT_STEPS = 50 # view shifts per direction
+EDIT_BLOCK = 16 # side of the square cut and pasted
+EDIT_COUNT = 20 # cuts and pastes per run
+SELECT_STEPS = 40 # selection growth steps
+TYPED_TEXT = ":41\"@ +01" * 20
+
+"█████████████████████████████████   Stubs   ██████████████████████████████████"
+
+
+######################
+# StubWidget
+#   Stands in for every tkinter widget. Methods
+#   it does not define do nothing, and after
+#   callbacks are queued for flushIdle.
+######################
+class StubWidget:
+
+  calls = 0 # canvas calls made, across all stubs
+  idle = [] # queued after_idle callbacks
+  timers = [] # queued timed after callbacks
+  nextitem = 1
+
+  def __init__(self, master = None, *args, **kwargs):
+    self.master = master
+    self._config = dict(kwargs)
+
+  def __getattr__(self, name):
+    if name.startswith("__"):
+      raise AttributeError(name)
+    return self.nothing
+
+  def nothing(self, *args, **kwargs):
+    return ""
+
+  def after(self, ms, function = None, *args):
+    if function is not None:
+      (StubWidget.timers if ms else StubWidget.idle).append((function, args))
+    return "after"
+
+  def after_idle(self, function, *args):
+    return self.after(0, function, *args)
+
+  def config(self, **kwargs):
+    self._config.update(kwargs)
+
+  configure = config
+
+  def cget(self, key):
+    return self._config.get(key, "")
+
+
+######################
+# StubCanvas
+#   A StubWidget counting every call and
+#   numbering the items it creates.
+######################
+class StubCanvas(StubWidget):
+
+  def __getattribute__(self, name):
+    if not name.startswith("_"):
+      StubWidget.calls += 1
+    return object.__getattribute__(self, name)
+
+  def create(self, *args, **kwargs):
+    StubWidget.nextitem += 1
+    return StubWidget.nextitem
+
+  create_rectangle = create_text = create_line = create_image = create
+  create_oval = create_polygon = create_window = create
+
+
+###############
+# stubModules
+#   Returns stand-ins for tkinter and the dialog
+#   modules the editor imports, by module name.
+#   Dialogs answer None to everything.
+def stubModules():
+  stub = types.ModuleType("tkinter")
+  for name in dir(tkinter.constants):
+    if not name.startswith("_"):
+      setattr(stub, name, getattr(tkinter.constants, name))
+  for name in dir(tkinter):
+    value = getattr(tkinter, name)
+    if isinstance(value, type) and (issubclass(value, (tkinter.Misc,
+                                                       tkinter.Image,
+                                                       tkinter.Variable))):
+      setattr(stub, name, type(name, (StubWidget,), {}))
+  stub.Canvas = StubCanvas
+  stub.mainloop = lambda *args: None
+  modules = {"tkinter": stub}
+  for name in ("filedialog", "messagebox", "simpledialog"):
+    dialogs = types.ModuleType("tkinter." + name)
+    dialogs.__getattr__ = lambda attr: (lambda *args, **kwargs: None)
+    setattr(stub, name, dialogs)
+    modules["tkinter." + name] = dialogs
+  return modules
+
+###############
+# loadEditor
+#   Imports Flow Editor.py against the stubbed
+#   tkinter. Returns the module.
+def loadEditor():
+  modules = stubModules()
+  saved = {name: sys.modules.get(name) for name in modules}
+  sys.modules.update(modules)
+  if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+  try:
+    spec = importlib.util.spec_from_file_location("flow_editor", EDITOR_FILE)
+    editor = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(editor)
+  finally:
+    for name, module in saved.items():
+      if module is None:
+        del sys.modules[name]
+      else:
+        sys.modules[name] = module
+  return editor
+
+###############
+# flushIdle
+#   Runs queued after_idle callbacks, including
+#   any they queue, as Tk does between events.
+#   With timers set, timed callbacks run too, as
+#   if the user had stopped to wait, each at most
+#   once so periodic ones (like autosave) end.
+def flushIdle(timers = False):
+  ran = set() # timed callbacks already run
+  while True:
+    pending = StubWidget.idle
+    StubWidget.idle = []
+    if timers:
+      later = []
+      for timer in StubWidget.timers:
+        (later if timer[0] in ran else pending).append(timer)
+        ran.add(timer[0])
+      StubWidget.timers = later
+    if not pending:
+      return
+    for function, args in pending:
+      function(*args)
+
+
+"█████████████████████████████████   Grids   ██████████████████████████████████"
+
+
+###############
+# syntheticProgram
+#   Returns the lines of a random, roughly square
+#   program with about cells cells.
+def syntheticProgram(cells, seed = SEED):
+  rng = random.Random(seed)
+  width = max(int(cells ** 0.5), 2)
+  height = max(cells // width, 1)
+  lines = []
+  for y in range(height):
+    lines.append("".join(rng.choice(SYNTHETIC_TRIPLETS) for x in range(width)))
+  lines[0] = "#> " + lines[0][3:]
+  return lines
+
+###############
+# tiledProgram
+#   Returns the lines of a sample program tiled
+#   into a square of about cells cells, with only
+#   the first copy's start command kept.
+def tiledProgram(filename, cells):
+  with open(filename, 'r') as infile:
+    lines = infile.read().split("\n")
+  width = max(len(line) for line in lines) // 3 + 1
+  lines = [line.ljust(width * 3) for line in lines]
+  tiles = max(int((cells / (width * len(lines))) ** 0.5), 1)
+  plain = [line.replace("#", " ") for line in lines]
+  tiled = [line + plainline * (tiles - 1) for line, plainline in zip(lines, plain)]
+  for copy in range(tiles - 1):
+    tiled.extend(line * tiles for line in plain)
+  return tiled
+
+###############
+# benchGrids
+#   Yields (name, lines) of each grid to run on.
+def benchGrids(sizes):
+  for size in sizes:
+    yield ("synthetic-{}".format(size), syntheticProgram(size))
+  for filename in sorted(glob.glob(SAMPLES_GLOB)):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    yield ("sample-{}".format(name), tiledProgram(filename, SAMPLE_SIZE))
+
+
+"███████████████████████████████   Benchmarks   ███████████████████████████████"
+
+
+######################
+# KeyEvent
+#   The fields keyPress reads from a Tk event.
+######################
+class KeyEvent:
+
+  def __init__(self, char):
+    self.char = char
+    self.keysym = char
+    self.type = "2"
+    self.state = 0
+
+
+###############
+# loadGrid
+#   Opens a file in the editor, as File > Open.
+def loadGrid(editor, filename):
+  editor._openfile = filename
+  editor.loadIn()
+  flushIdle(True)
+
+###############
+# coldCache
+#   Empties the program cache, so the next
+#   load parses and analyzes the file.
+def coldCache(editor, filename):
+  editor.finishCache()
+  editor._cache.clear()
+
+###############
+# warmCache
+#   Opens a file and waits for its cache entry
+#   to be written, so the next load reads it.
+def warmCache(editor, filename):
+  loadGrid(editor, filename)
+  editor.cacheProgram(True)
+  editor.finishCache()
+
+###############
+# benchLoad
+def benchLoad(editor, filename):
+  loadGrid(editor, filename)
+  return 1
+
+###############
+# benchConvert
+def benchConvert(editor, filename):
+  editor.convertToStr()
+  return 1
+
+###############
+# benchShift
+#   Scrolls the view out and back in each direction.
+def benchShift(editor, filename):
+  for there, back in (("right", "left"), ("down", "up")):
+    for direction in (there, back):
+      for step in range(SHIFT_STEPS):
+        editor.shiftView(direction)
+        flushIdle()
+  return 4 * SHIFT_STEPS
+
+###############
+# benchCut
+#   Cuts square blocks from along the diagonal.
+def benchCut(editor, filename):
+  for i in range(EDIT_COUNT):
+    corner = (i * EDIT_BLOCK // 2, i * EDIT_BLOCK // 2)
+    editor._selection = [corner, (corner[0] + EDIT_BLOCK - 1,
+                                  corner[1] + EDIT_BLOCK - 1)]
+    editor.cut()
+    flushIdle()
+  flushIdle(True) # then the edits settle
+  return EDIT_COUNT
+
+###############
+# benchPaste
+#   Copies a square block and pastes it along
+#   the diagonal.
+def benchPaste(editor, filename):
+  editor._selection = [(0, 0), (EDIT_BLOCK - 1, EDIT_BLOCK - 1)]
+  editor.copy()
+  for i in range(EDIT_COUNT):
+    corner = (i * EDIT_BLOCK // 2 + 1, i * EDIT_BLOCK // 2 + 1)
+    editor._selection = [corner, corner]
+    editor.paste()
+    flushIdle()
+  flushIdle(True) # then the edits settle
+  return EDIT_COUNT
+
+###############
+# benchSelect
+#   Grows the selection one cell at a time and
+#   recolors it, as shift-arrow keys do.
+def benchSelect(editor, filename):
+  editor._position = (0, 0)
+  editor._selection = [(0, 0), (0, 0)]
+  for step in range(SELECT_STEPS // 2):
+    editor.selectRight()
+    flushIdle()
+    editor.selectDown()
+    flushIdle()
+  editor.colorSelection(True)
+  return SELECT_STEPS + 1
+
+###############
+# benchKeyPress
+#   Types text into the grid one key at a time.
+def benchKeyPress(editor, filename):
+  editor._position = (1, 1)
+  editor._selection = [(1, 1), (1, 1)]
+  editor._insertindex = 0
+  for char in TYPED_TEXT:
+    editor.keyPress(KeyEvent(char))
+    flushIdle()
+  flushIdle(True) # then the edits settle
+  return len(TYPED_TEXT)
+
+# (name, function, setup run untimed before each run,
+# if any: reloading the grid for those that edit it)
+BENCHMARKS = (("loadIn", benchLoad, coldCache),
+              ("loadIn cached", benchLoad, warmCache),
+              ("convertToStr", benchConvert, None),
+              ("shiftView", benchShift, None),
+              ("colorSelection", benchSelect, None),
+              ("keyPress", benchKeyPress, loadGrid),
+              ("cut", benchCut, loadGrid),
+              ("paste", benchPaste, loadGrid))
+
+###############
+# runBenchmarks
+#   Runs every benchmark on every grid. Returns a
+#   list of result dicts, keeping the best of
+#   repeat runs of each benchmark. The editor
+#   caches programs in a temporary folder, not
+#   the user's.
+def runBenchmarks(module, sizes, repeat, log = None):
+  with tempfile.TemporaryDirectory() as cachefolder:
+    return benchEditor(module, sizes, repeat, cachefolder, log)
+
+###############
+# benchEditor
+#   Does runBenchmarks with an editor caching
+#   programs in cachefolder.
+def benchEditor(module, sizes, repeat, cachefolder, log = None):
+  results = []
+  root = module.Tk()
+  editor = module.Editor(root)
+  editor._cache = module.FlowCache(cachefolder)
+  flushIdle()
+  for gridname, lines in benchGrids(sizes):
+    with tempfile.NamedTemporaryFile('w', suffix = ".fl",
+                                     delete = False) as outfile:
+      outfile.write("\n".join(lines) + "\n")
+    try:
+      loadGrid(editor, outfile.name)
+      cells = len(editor._grid)
+      for name, function, setup in BENCHMARKS:
+        best = None
+        for run in range(repeat):
+          if setup is not None:
+            setup(editor, outfile.name)
+          StubWidget.calls = 0
+          start = time.perf_counter()
+          ops = function(editor, outfile.name)
+          seconds = time.perf_counter() - start
+          if best is None or seconds < best[0]:
+            best = (seconds, StubWidget.calls)
+        results.append({"grid": gridname, "cells": cells, "benchmark": name,
+                        "ops": ops, "seconds": best[0],
+                        "seconds_per_op": best[0] / ops,
+                        "canvas_calls": best[1]})
+        if log is not None:
+          log("{:<28} {:>8} {:<15} {:10.6f}s".format(gridname, cells, name,
+                                                      best[0]))
+    finally:
+      editor.finishSave()
+      editor.finishCache()
+      os.remove(outfile.name)
+      removeAutosave(outfile.name)
+  return results
+
+
+"██████████████████████████████████   Main   ██████████████████████████████████"
+
+def main():
+  parser = argparse.ArgumentParser(description = "Benchmark the Flow Editor.")
+  parser.add_argument("-o", "--output", help = "JSON file to write "
+                      "(default: standard output)")
+  parser.add_argument("--sizes", type = int, nargs = "*",
+                      default = list(SYNTHETIC_SIZES),
+                      help = "cell counts of the synthetic grids")
+  parser.add_argument("--repeat", type = int, default = REPEAT,
+                      help = "runs of each benchmark, keeping the best")
+  args = parser.parse_args()
+
+  module = loadEditor()
+  log = lambda line: print(line, file = sys.stderr)
+  with open(os.devnull, 'w') as devnull:
+    with contextlib.redirect_stdout(devnull): # editor debug prints
+      results = runBenchmarks(module, args.sizes, args.repeat, log)
+  report = {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "results": results}
+  if args.output:
+    with open(args.output, 'w') as outfile:
+      json.dump(report, outfile, indent = 2)
+  else:
+    json.dump(report, sys.stdout, indent = 2)
+    print()
+
+if __name__ == "__main__":
+  main()
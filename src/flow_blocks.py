@@ -0,0 +1,336 @@
+#########################
+# flow_blocks.py
+# --------------
+# Compiles straight runs of a lowered Flow
+# program into Python functions, and caches
+# them for the engine.
+#########################
+
+from flow_common import *
+from flow_engine import *
+from flow_grid import gridExtent
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+MAX_BLOCK_TICKS = 512 # longest run compiled into one block
+BLOCK_END = -1 # returned as the error when the program completes
+UNLIMITED_TICKS = 1 << 62 # budget when a run has no tick limit
+
+# Python source for each arithmetic opcode, given the
+# operand as source (X) and the loaded variable (L).
+OPERATOR_SOURCE = {OP_SET_IMM: "L = X",
+                   OP_SET_VAR: "L = X",
+                   OP_ADD_IMM: "L = (L + X) & 0xFF",
+                   OP_ADD_VAR: "L = (L + X) & 0xFF",
+                   OP_SUB_IMM: "L = (L - X) & 0xFF",
+                   OP_SUB_VAR: "L = (L - X) & 0xFF",
+                   OP_MUL_IMM: "L = (L * X) & 0xFF",
+                   OP_MUL_VAR: "L = (L * X) & 0xFF",
+                   OP_OUT_IMM: "out.append(X)",
+                   OP_OUT_VAR: "out.append(X)"}
+
+"███████████████████████████████   Compiler   █████████████████████████████████"
+
+
+###############
+# operandSource
+#   Python source reading an operand.
+def operandSource(op, arg):
+  if op in (OP_NEXT_IMM, OP_PREV_IMM, OP_SET_IMM, OP_ADD_IMM, OP_SUB_IMM,
+            OP_MUL_IMM, OP_DIV_IMM, OP_MOD_IMM, OP_COMP_IMM, OP_OUT_IMM):
+    return str(arg)
+  return variableSource(arg)
+
+###############
+# variableSource
+#   Python source for a variable's cell in mem.
+def variableSource(arg):
+  if arg == ARG_LOADED:
+    return "mem[lv]"
+  return "mem[{}]".format(arg)
+
+###############
+# compileBlock
+#   Compiles the run that starts by moving from
+#   index in direction d. The run follows turns,
+#   and compares are side exits: it goes on
+#   through a compare that keeps its direction.
+#   A run that comes back to its entry becomes a
+#   loop. Returns (function, cells), where
+#   function(mem, lv, out, machine, budget) returns
+#   (next key, lv, ticks, error), runs at most
+#   budget ticks of loop iterations, and cells are
+#   the indices the run crosses.
+def compileBlock(program, index, d):
+  ops = program.ops
+  args = program.args
+  steps = program.steps
+  body = []
+  cells = []
+  seen = set()
+  entry = index * 4 + d
+  i = index
+  k = 0
+  looped = False
+
+  def leave(direction, error = 0):
+    return "return ({}, lv, n + {}, {})".format(i * 4 + direction, k, error)
+
+  while True:
+    if k > 0 and i * 4 + d == entry:
+      looped = True
+      body.append("n += {}".format(k))
+      body.append("if n + {} > budget: return ({}, lv, n, 0)".format(k, entry))
+      break
+    if i * 4 + d in seen or k >= MAX_BLOCK_TICKS:
+      body.append(leave(d))
+      break
+    seen.add(i * 4 + d)
+    i += steps[d]
+    k += 1
+    cells.append(i)
+    op = ops[i]
+    a = args[i]
+    if op == OP_NOP:
+      pass
+    elif op <= OP_DOWN:
+      d = op - 1
+    elif op == OP_END:
+      body.append(leave(d, BLOCK_END))
+      break
+    elif op == OP_LEAK:
+      body.append(leave(d, LEAK_ERROR))
+      break
+    elif op == OP_FAIL:
+      body.append(leave(d, a))
+      break
+    elif op == OP_COMP_IMM or op == OP_COMP_VAR:
+      body.append("v = " + operandSource(op, a))
+      body.append("if mem[lv] < v: " + leave(ROTATE_CCW[d]))
+      body.append("if mem[lv] > v: " + leave(ROTATE_CW[d]))
+    elif op == OP_LOAD:
+      body.append("lv = {}".format(a))
+    elif op in OPERATOR_SOURCE:
+      body.append(OPERATOR_SOURCE[op].replace("L", "mem[lv]")
+                                     .replace("X", operandSource(op, a)))
+    elif op == OP_NEXT_IMM or op == OP_NEXT_VAR:
+      body.append("v = lv + " + operandSource(op, a))
+      body.append("if v >= {}: {}".format(VARSPACE_CELLS,
+                                          leave(d, BOUNDS_VIOLATION)))
+      body.append("lv = v")
+    elif op == OP_PREV_IMM or op == OP_PREV_VAR:
+      body.append("v = lv - " + operandSource(op, a))
+      body.append("if v < 0: " + leave(d, BOUNDS_VIOLATION))
+      body.append("lv = v")
+    elif op == OP_COPY:
+      if a != ARG_LOADED:
+        body.append("mem[{}] = mem[lv]".format(a))
+    elif op == OP_CACHE:
+      if a == ARG_LOADED:
+        body.append("mem[lv] = 0")
+      else:
+        body.append("mem[{0}] = abs({0} - lv) & 0xFF".format(a))
+    elif op in (OP_DIV_IMM, OP_DIV_VAR, OP_MOD_IMM, OP_MOD_VAR):
+      body.append("v = " + operandSource(op, a))
+      body.append("if v == 0: " + leave(d, DIVIDE_BY_ZERO))
+      if op == OP_DIV_IMM or op == OP_DIV_VAR:
+        body.append("mem[lv] = mem[lv] // v")
+      else:
+        body.append("mem[lv] = mem[lv] % v")
+    elif op == OP_IN:
+      body.append(variableSource(a) + " = machine.readInput()")
+
+  if looped:
+    source = ("def block(mem, lv, out, machine, budget):\n  n = 0\n"
+              "  while True:\n    " + "\n    ".join(body) + "\n")
+  else:
+    source = ("def block(mem, lv, out, machine, budget):\n  n = 0\n  " +
+              "\n  ".join(body) + "\n")
+  namespace = {}
+  exec(compile(source, "<flow block>", "exec"), namespace)
+  return (namespace["block"], cells)
+
+
+######################
+# BlockCache
+#   Compiled blocks of a grid's program, keyed by
+#   (entry index, direction). Edited cells only
+#   drop the blocks that cross them.
+######################
+class BlockCache:
+
+  ##############
+  # init
+  #   Lowers a grid, with no blocks compiled yet.
+  def __init__(self, grid):
+    self._grid = grid
+    self.reset()
+
+  ###############
+  # reset
+  #   Re-lowers the whole grid and drops all blocks.
+  def reset(self):
+    self.program = FlowProgram(self._grid)
+    self._blocks = {} # index * 4 + direction: (function, length, cells)
+    self._cellblocks = {} # index: keys of blocks crossing it
+
+  ###############
+  # invalidate
+  #   Updates the program after cells changed, given
+  #   (coord, old, new) deltas, and drops the blocks
+  #   crossing them. If the program's extent changed,
+  #   everything is rebuilt.
+  def invalidate(self, deltas):
+    program = self.program
+    if gridExtent(self._grid) != program.extent:
+      self.reset()
+      return
+    for coord, old, new in deltas:
+      if old == new or not program.contains(coord):
+        continue # nothing to re-lower, and no index to re-lower it at
+      program.updateCell(coord, old, new)
+      for key in self._cellblocks.pop(program.index(coord), ()):
+        self._blocks.pop(key, None)
+    if program.start is None and program.starts > 0:
+      self.reset() # the start moved to a cell we cannot find cheaply
+
+  ###############
+  # block
+  #   Returns the (function, length, cells) block
+  #   leaving index in direction d, compiling it.
+  def block(self, index, d):
+    function, cells = compileBlock(self.program, index, d)
+    key = index * 4 + d
+    block = (function, len(cells), cells)
+    self._blocks[key] = block
+    for cell in cells:
+      self._cellblocks.setdefault(cell, []).append(key)
+    return block
+
+  ###############
+  # blockCells
+  #   Returns the indices crossed by the block
+  #   with a key, compiling it if needed.
+  def blockCells(self, key):
+    block = self._blocks.get(key)
+    if block is None:
+      block = self.block(key >> 2, key & 3)
+    return block[2]
+
+  ###############
+  # run
+  #   Runs a machine of this cache's program one
+  #   block at a time, like FlowMachine.run. Falls
+  #   back to single ticks when a block would
+  #   overrun maxticks. Given stopat, an index, it
+  #   instead stops before any block crossing it.
+  def run(self, machine, maxticks = None, stopat = None):
+    if machine.done():
+      return machine.error
+    blocks = self._blocks
+    stops = () if stopat is None else self._cellblocks.setdefault(stopat, [])
+    mem = machine.mem
+    out = machine.output
+    lv = machine.loaded
+    key = machine.index * 4 + machine.direction
+    ticks = 0
+    limit = UNLIMITED_TICKS if maxticks is None else maxticks
+    error = NO_ERROR
+    while True:
+      block = blocks.get(key)
+      if block is None:
+        block = self.block(key >> 2, key & 3)
+      if ticks + block[1] > limit or key in stops:
+        break
+      key, lv, n, error = block[0](mem, lv, out, machine, limit - ticks)
+      ticks += n
+      if error:
+        break
+
+    machine.loaded = lv
+    machine.index = key >> 2
+    machine.direction = key & 3
+    machine.ticks += ticks
+    if error == BLOCK_END:
+      machine.complete = True
+    elif error:
+      machine.error = error
+    elif ticks < limit and stopat is None:
+      return machine.run(limit - ticks)
+    return machine.error
+
+  ###############
+  # runTo
+  #   Runs a machine until flow moves onto cell
+  #   index, it finishes, or maxticks ticks have run.
+  #   Blocks crossing index are stepped through a
+  #   tick at a time. Returns True if it stopped at
+  #   index.
+  def runTo(self, machine, index, maxticks):
+    end = machine.ticks + maxticks
+    while not machine.done() and machine.ticks < end:
+      self.run(machine, end - machine.ticks, index)
+      if machine.done():
+        break
+      key = machine.index * 4 + machine.direction
+      block = self._blocks.get(key)
+      if block is None:
+        block = self.block(machine.index, machine.direction)
+      for tick in range(min(block[1], end - machine.ticks)):
+        machine.run(1)
+        if machine.index == index:
+          return True
+        if machine.done():
+          break
+    return False
+
+  ###############
+  # runProfiled
+  #   Runs like run, also counting into a FlowProfile
+  #   how often each block ran and where it left.
+  #   Kept apart from run so that plain runs pay
+  #   nothing for profiling.
+  def runProfiled(self, machine, profile, maxticks = None):
+    if machine.done():
+      return machine.error
+    blocks = self._blocks
+    passes = profile.passes
+    exits = profile.exits
+    mem = machine.mem
+    out = machine.output
+    lv = machine.loaded
+    key = machine.index * 4 + machine.direction
+    ticks = 0
+    limit = UNLIMITED_TICKS if maxticks is None else maxticks
+    error = NO_ERROR
+    while True:
+      block = blocks.get(key)
+      if block is None:
+        block = self.block(key >> 2, key & 3)
+      length = block[1]
+      if ticks + length > limit:
+        break
+      nextkey, lv, n, error = block[0](mem, lv, out, machine, limit - ticks)
+      ticks += n
+      if n > length: # a loop: all but its last pass ran whole
+        passes[key] = passes.get(key, 0) + (n - 1) // length
+        n -= (n - 1) // length * length
+      exit = (key, n, nextkey)
+      exits[exit] = exits.get(exit, 0) + 1
+      key = nextkey
+      if error:
+        break
+
+    machine.loaded = lv
+    machine.index = key >> 2
+    machine.direction = key & 3
+    machine.ticks += ticks
+    if error == BLOCK_END:
+      machine.complete = True
+    elif error:
+      machine.error = error
+    else:
+      while ticks < limit and not machine.done():
+        profile.tick(machine)
+        ticks += 1
+    return machine.error
@@ -0,0 +1,533 @@
+#########################
+# flow_cache.py
+# --------------
+# Keeps loaded Flow programs on disk, keyed by a
+# hash of the file's contents, so reopening an
+# unchanged file skips parsing it, lowering it
+# and analyzing its flow. Entries are flat
+# binary sections of data read through mmap,
+# never code, and the oldest used are evicted
+# once the cache outgrows its limit.
+#########################
+
+from array import array
+import copy
+import hashlib
+import io
+import json
+import locale
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from flow_analysis import FlowAnalysis, FlowPath
+from flow_blocks import BlockCache
+from flow_common import *
+from flow_engine import FlowProgram
+from flow_grid import TILE_BYTES, FlowGrid, readGrid
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+CACHE_ENV = "FLOW_CACHE_DIR" # overrides the cache folder
+CACHE_FOLDER = os.path.join(os.environ.get("XDG_CACHE_HOME") or
+                            os.path.join(os.path.expanduser("~"), ".cache"), "flow")
+CACHE_LIMIT = 1 << 30 # bytes of entries kept
+CACHE_SUFFIX = ".flc"
+CACHE_MAGIC = b"FLOWCACH"
+CACHE_FORMAT = 2 # bumped when the layout of entries changes
+
+# modules whose code decides what is cached; editing
+# any of them makes every older entry stale
+TOOL_MODULES = ("flow_common", "flow_grid", "flow_engine", "flow_analysis",
+                "flow_blocks", "flow_cache")
+
+HEADER = struct.Struct("<8sI32s32sI") # magic, format, tool, contents, sections
+SECTION = struct.Struct("<8sQQ") # name, offset, length
+ALIGN = 8 # sections start on multiples of this
+
+"████████████████████████████████   Entries   █████████████████████████████████"
+
+
+###############
+# toolVersion
+#   Returns a hash of everything an entry's
+#   layout and meaning depend on: the cache
+#   format, the Python version, byte order, text
+#   encoding and the code of TOOL_MODULES.
+def toolVersion():
+  digest = hashlib.sha256()
+  digest.update(repr((CACHE_FORMAT, sys.version, sys.byteorder,
+                      locale.getpreferredencoding(False))).encode())
+  folder = os.path.dirname(os.path.abspath(__file__))
+  for name in TOOL_MODULES:
+    with open(os.path.join(folder, name + ".py"), 'rb') as infile:
+      digest.update(infile.read())
+  return digest.digest()
+
+###############
+# packGrid
+#   Adds a grid's sections: its tiles and
+#   row and column indices as raw arrays, the
+#   rest in the meta dict.
+def packGrid(grid, sections, meta):
+  tilekeys = array('i')
+  for (tx, ty), count in grid._tilecounts.items():
+    tilekeys.extend((tx, ty, count))
+  sections[b"tilekeys"] = tilekeys.tobytes()
+  sections[b"tiles"] = b"".join(grid._tiles[tx, ty] for tx, ty in
+                                 zip(tilekeys[0::3], tilekeys[1::3]))
+  for name, lines in ((b"rows", grid._rows), (b"cols", grid._cols)):
+    keys = array('i')
+    for key, line in lines.items():
+      keys.extend((key, len(line)))
+    sections[name] = keys.tobytes()
+    sections[name + b"data"] = b"".join(line.tobytes() for line in lines.values())
+  meta.update(count = grid._count, bounds = grid._bounds,
+              boundsdirty = grid._boundsdirty,
+              wide = [[x, y, triplet] for (x, y), triplet in grid._wide.items()])
+
+###############
+# unpackGrid
+#   Rebuilds a grid from packGrid's sections.
+def unpackGrid(sections, meta):
+  grid = FlowGrid()
+  tilekeys = intArray('i', sections[b"tilekeys"])
+  tiles = sections[b"tiles"]
+  for n in range(len(tilekeys) // 3):
+    key = (tilekeys[3 * n], tilekeys[3 * n + 1])
+    grid._tiles[key] = bytearray(tiles[n * TILE_BYTES:(n + 1) * TILE_BYTES])
+    grid._tilecounts[key] = tilekeys[3 * n + 2]
+  for name, lines in ((b"rows", grid._rows), (b"cols", grid._cols)):
+    keys = intArray('i', sections[name])
+    data = intArray('i', sections[name + b"data"])
+    start = 0
+    for n in range(len(keys) // 2):
+      lines[keys[2 * n]] = data[start:start + keys[2 * n + 1]]
+      start += keys[2 * n + 1]
+  grid._count = meta["count"]
+  grid._bounds = None if meta["bounds"] is None else tuple(meta["bounds"])
+  grid._boundsdirty = meta["boundsdirty"]
+  grid._wide = {(x, y): triplet for x, y, triplet in meta["wide"]}
+  return grid
+
+###############
+# packProgram
+#   Adds a lowered program's arrays to the
+#   sections, its fields to meta.
+def packProgram(program, sections, meta):
+  sections[b"ops"] = bytes(program.ops)
+  sections[b"args"] = program.args.tobytes()
+  meta["program"] = {"extent": program.extent, "starts": program.starts,
+                     "start": program.start, "startchar": program.startchar}
+
+###############
+# unpackProgram
+#   Returns a new FlowProgram from packProgram's
+#   sections, as lowering the grid would.
+def unpackProgram(sections, meta):
+  fields = meta["program"]
+  program = FlowProgram.__new__(FlowProgram)
+  program.extent = tuple(fields["extent"])
+  left, top, right, bottom = program.extent
+  program.left = left - 1
+  program.top = top - 1
+  program.width = right - left + 3
+  program.height = bottom - top + 3
+  program.steps = tuple(dx + dy * program.width for dx, dy in DIR_DELTAS)
+  program.ops = bytearray(sections[b"ops"])
+  program.args = intArray('i', sections[b"args"])
+  program.starts = fields["starts"]
+  program.start = fields["start"]
+  program.startchar = fields["startchar"]
+  program.checkStart()
+  return program
+
+###############
+# packPaths
+#   Adds an analysis's walked paths (its
+#   control-flow graph) to the sections.
+def packPaths(analysis, sections):
+  records = array('q')
+  cells = array('q')
+  exits = array('q')
+  for key, path in analysis._paths.items():
+    leak = path.leak or (-1, -1)
+    records.extend((key, len(path.cells), len(path.exits), leak[0], leak[1],
+                    -1 if path.failure is None else path.failure, path.returns))
+    cells.extend(path.cells)
+    exits.extend(path.exits)
+  sections[b"paths"] = records.tobytes()
+  sections[b"pathcell"] = cells.tobytes()
+  sections[b"pathexit"] = exits.tobytes()
+
+###############
+# unpackPaths
+#   Returns a FlowAnalysis of grid with the
+#   program and paths packed, none left to walk.
+def unpackPaths(sections, meta, grid):
+  analysis = FlowAnalysis.__new__(FlowAnalysis)
+  analysis._grid = grid
+  analysis.program = unpackProgram(sections, meta)
+  analysis._paths = {}
+  analysis._cellpaths = {}
+  analysis._report = None
+  records = intArray('q', sections[b"paths"])
+  cells = intArray('q', sections[b"pathcell"]).tolist()
+  exits = intArray('q', sections[b"pathexit"]).tolist()
+  c = 0
+  e = 0
+  for n in range(0, len(records), 7):
+    key, ncells, nexits, leak, leakdir, failure, returns = records[n:n + 7]
+    path = FlowPath()
+    path.cells = cells[c:c + ncells]
+    path.exits = exits[e:e + nexits]
+    path.leak = None if leak < 0 else (leak, leakdir)
+    path.failure = None if failure < 0 else failure
+    path.returns = bool(returns)
+    c += ncells
+    e += nexits
+    analysis._paths[key] = path
+    for cell in path.cells:
+      analysis._cellpaths.setdefault(cell, []).append(key)
+  size = len(analysis.program.ops)
+  checkIndices(size, cells)
+  checkIndices(size * 4, exits)
+  checkIndices(size * 4, analysis._paths)
+  return analysis
+
+###############
+# packBlocks
+#   Adds the keys of a BlockCache's compiled
+#   blocks to the sections. Only the keys are
+#   kept: code is never loaded from the cache.
+def packBlocks(blocks, sections):
+  sections[b"blocks"] = array('q', blocks._blocks).tobytes()
+
+###############
+# unpackBlocks
+#   Returns a BlockCache of grid with the program
+#   packed, compiling again the blocks it had.
+def unpackBlocks(sections, meta, grid):
+  blocks = BlockCache.__new__(BlockCache)
+  blocks._grid = grid
+  blocks.program = unpackProgram(sections, meta)
+  blocks._blocks = {}
+  blocks._cellblocks = {}
+  keys = intArray('q', sections[b"blocks"])
+  checkIndices(len(blocks.program.ops) * 4, keys)
+  for key in keys:
+    blocks.block(key >> 2, key & 3)
+  return blocks
+
+###############
+# snapshotProgram
+#   Returns a CachedProgram of copies of a grid
+#   and its analysis and blocks, for store to
+#   pack on another thread while they change.
+#   Paths and blocks are never changed once made,
+#   so only the tables of them are copied.
+def snapshotProgram(key, grid, error, analysis = None, blocks = None):
+  grid = grid.copy()
+  if analysis is not None and analysis.program is not None:
+    original = analysis
+    analysis = FlowAnalysis.__new__(FlowAnalysis)
+    analysis._grid = grid
+    analysis.program = programCopy(original.program)
+    analysis._paths = dict(original._paths)
+  else:
+    analysis = None
+  if blocks is not None:
+    original = blocks
+    blocks = BlockCache.__new__(BlockCache)
+    blocks._grid = grid
+    blocks.program = programCopy(original.program)
+    blocks._blocks = dict(original._blocks)
+  return CachedProgram(key, grid, error, analysis, blocks)
+
+###############
+# programCopy
+#   Returns a copy of a FlowProgram whose cells
+#   can change apart from it.
+def programCopy(program):
+  program = copy.copy(program)
+  program.ops = bytearray(program.ops)
+  program.args = array('i', program.args)
+  return program
+
+###############
+# derivedSize
+#   Returns how much of a grid's analysis and
+#   blocks (either may be None) has been worked
+#   out, to tell whether storing them again
+#   would add anything.
+def derivedSize(analysis, blocks):
+  return (0 if analysis is None else len(analysis._paths),
+          0 if blocks is None else len(blocks._blocks))
+
+###############
+# checkIndices
+#   Raises ValueError unless every value is
+#   in range(size).
+def checkIndices(size, values):
+  if values and (min(values) < 0 or max(values) >= size):
+    raise ValueError("cache entry out of range")
+
+###############
+# trusted
+#   True if a file's stat shows it belongs to
+#   this user and nobody else may write to it.
+#   Where there are no user ids, any file is.
+def trusted(stat):
+  if not hasattr(os, "getuid"):
+    return True
+  return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+###############
+# intArray
+#   Returns an array of typecode from bytes.
+def intArray(typecode, data):
+  values = array(typecode)
+  values.frombytes(data)
+  return values
+
+
+######################
+# CachedProgram
+#   A program as loaded, from the cache or not:
+#   the contents hash it is cached under, its grid
+#   and load error, and the FlowAnalysis and
+#   BlockCache the cache had for it, if any.
+######################
+class CachedProgram:
+
+  def __init__(self, key, grid, error, analysis = None, blocks = None):
+    self.key = key
+    self.grid = grid
+    self.error = error
+    self.analysis = analysis
+    self.blocks = blocks
+
+
+"█████████████████████████████████   Cache   ██████████████████████████████████"
+
+
+######################
+# FlowCache
+#   A folder of entries named by a hash of the
+#   tool version and file contents, so a changed
+#   file or tool just misses. Each entry is a
+#   header, a table of sections and the sections,
+#   every one 8-byte aligned so arrays can be read
+#   straight out of the mapped file. An entry's
+#   modification time is when it was last used;
+#   the least recently used go first when the
+#   folder outgrows limit bytes.
+######################
+class FlowCache:
+
+  ##############
+  # init
+  #   Uses folder (by default CACHE_ENV, or
+  #   CACHE_FOLDER), creating it when first
+  #   written to.
+  def __init__(self, folder = None, limit = CACHE_LIMIT):
+    self.folder = folder or os.environ.get(CACHE_ENV) or CACHE_FOLDER
+    self.limit = limit
+    self.tool = toolVersion()
+
+  ###############
+  # key
+  #   Returns the hex key of file contents.
+  def key(self, data):
+    digest = hashlib.sha256(self.tool)
+    digest.update(data)
+    return digest.hexdigest()
+
+  ###############
+  # path
+  #   Returns the entry file of a key.
+  def path(self, key):
+    return os.path.join(self.folder, key + CACHE_SUFFIX)
+
+  ###############
+  # loadFile
+  #   Loads a Flow file like flow_grid.loadFile,
+  #   from its entry if there is one. Returns a
+  #   CachedProgram, or None if the file could not
+  #   be read.
+  def loadFile(self, filename):
+    try:
+      with open(filename, 'rb') as infile:
+        data = infile.read()
+    except OSError:
+      return None
+    key = self.key(data)
+    cached = self.read(key)
+    if cached is not None:
+      return cached
+    try:
+      grid, error = readGrid(io.TextIOWrapper(io.BytesIO(data)))
+    except UnicodeDecodeError:
+      return None
+    return CachedProgram(key, grid, error)
+
+  ###############
+  # read
+  #   Returns the CachedProgram of a key's entry,
+  #   marking it used, or None if there is none. A
+  #   damaged entry, or one another user could have
+  #   written, is removed.
+  def read(self, key):
+    filename = self.path(key)
+    try:
+      with open(filename, 'rb') as infile:
+        if not trusted(os.fstat(infile.fileno())):
+          raise ValueError("untrusted cache entry")
+        with mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+          cached = self.unpack(mapped, key)
+      os.utime(filename)
+    except FileNotFoundError:
+      return None
+    except (OSError, ValueError, KeyError, IndexError, TypeError, EOFError,
+            struct.error):
+      self.remove(filename)
+      return None
+    return cached
+
+  ###############
+  # unpack
+  #   Checks a mapped entry's header against the
+  #   key and returns its CachedProgram, read out
+  #   of views of the map without copying the
+  #   sections first.
+  def unpack(self, mapped, key):
+    magic, version, tool, contents, count = HEADER.unpack_from(mapped, 0)
+    if (magic != CACHE_MAGIC or version != CACHE_FORMAT or tool != self.tool or
+        contents.hex() != key):
+      raise ValueError("stale cache entry")
+    view = memoryview(mapped)
+    sections = {}
+    try:
+      for n in range(count):
+        name, offset, length = SECTION.unpack_from(mapped, HEADER.size + n * SECTION.size)
+        if offset + length > len(mapped):
+          raise ValueError("truncated cache entry")
+        sections[name.rstrip(b"\0")] = view[offset:offset + length]
+      meta = json.loads(bytes(sections[b"meta"]).decode("utf-8"))
+      grid = unpackGrid(sections, meta)
+      analysis = unpackPaths(sections, meta, grid) if b"paths" in sections else None
+      blocks = unpackBlocks(sections, meta, grid) if b"blocks" in sections else None
+    finally:
+      for section in sections.values():
+        section.release() # or the map cannot be closed
+      view.release()
+    return CachedProgram(key, grid, meta["error"], analysis, blocks)
+
+  ###############
+  # store
+  #   Writes the entry of a CachedProgram (from
+  #   snapshotProgram, when the editor stores it
+  #   on a BackgroundSave) through a temp file
+  #   renamed into place, then evicts the least
+  #   recently used entries over the limit.
+  #   Failing to write just leaves it uncached.
+  #   Returns NO_ERROR, like saveFile.
+  def store(self, cached, progress = None):
+    grid, analysis, blocks = cached.grid, cached.analysis, cached.blocks
+    sections = {}
+    meta = {"error": cached.error}
+    packGrid(grid, sections, meta)
+    if analysis is not None and analysis.program is not None:
+      packProgram(analysis.program, sections, meta)
+      packPaths(analysis, sections)
+    if blocks is not None:
+      if analysis is None or analysis.program is None:
+        packProgram(blocks.program, sections, meta)
+      packBlocks(blocks, sections)
+    sections[b"meta"] = json.dumps(meta).encode("utf-8")
+
+    try:
+      os.makedirs(self.folder, mode = 0o700, exist_ok = True)
+      handle, temp = tempfile.mkstemp(suffix = ".tmp", dir = self.folder)
+      try:
+        with os.fdopen(handle, 'wb') as outfile:
+          self.writeEntry(outfile, cached.key, sections)
+        os.replace(temp, self.path(cached.key))
+      except OSError:
+        self.remove(temp)
+        raise
+    except OSError:
+      return NO_ERROR
+    self.evict(cached.key)
+    return NO_ERROR
+
+  ###############
+  # writeEntry
+  #   Writes the header, section table and
+  #   sections of an entry.
+  def writeEntry(self, outfile, key, sections):
+    offset = HEADER.size + len(sections) * SECTION.size
+    table = []
+    for name, data in sections.items():
+      offset += -offset % ALIGN
+      table.append(SECTION.pack(name, offset, len(data)))
+      offset += len(data)
+    outfile.write(HEADER.pack(CACHE_MAGIC, CACHE_FORMAT, self.tool,
+                              bytes.fromhex(key), len(sections)))
+    outfile.write(b"".join(table))
+    written = HEADER.size + len(table) * SECTION.size
+    for data in sections.values():
+      outfile.write(b"\0" * (-written % ALIGN))
+      written += -written % ALIGN
+      outfile.write(data)
+      written += len(data)
+
+  ###############
+  # evict
+  #   Removes the least recently used entries
+  #   until the rest fit the limit, keeping the
+  #   entry of key.
+  def evict(self, key):
+    entries = []
+    total = 0
+    try:
+      names = os.listdir(self.folder)
+    except OSError:
+      return
+    for name in names:
+      filename = os.path.join(self.folder, name)
+      try:
+        stat = os.stat(filename)
+      except OSError:
+        continue
+      if name.endswith(CACHE_SUFFIX) and name != key + CACHE_SUFFIX:
+        entries.append((stat.st_mtime, filename, stat.st_size))
+      total += stat.st_size
+    for used, filename, size in sorted(entries):
+      if total <= self.limit:
+        break
+      self.remove(filename)
+      total -= size
+
+  ###############
+  # clear
+  #   Deletes every entry.
+  def clear(self):
+    try:
+      names = os.listdir(self.folder)
+    except OSError:
+      return
+    for name in names:
+      if name.endswith(CACHE_SUFFIX):
+        self.remove(os.path.join(self.folder, name))
+
+  ###############
+  # remove
+  #   Deletes an entry file, if it still exists.
+  def remove(self, filename):
+    try:
+      os.remove(filename)
+    except OSError:
+      pass
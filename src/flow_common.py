@@ -0,0 +1,89 @@
+#########################
+# flow_common.py
+# --------------
+# Definitions shared by the Python tools,
+# mirroring main.h of the interpreter.
+#########################
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+# Flow commands
+CMD_START  = '#' # start & end of program
+CMD_IGNORE = ' ' # spaces are ignored
+
+CMD_LOAD  = '@' # sets LOADED_VAR pointer
+CMD_NEXT  = "'" # loads a variable forward in memory
+CMD_PREV  = ',' # loads a variable backwards in memory
+CMD_CACHE = ';' # caches LOADED_VAR offset to this
+CMD_SET   = ':' # sets loaded var to this
+CMD_COPY  = ')' # copies LOADED_VAR to this var
+CMD_ADD   = '+' # adds this to loaded var
+CMD_SUB   = '-' # subtracts this from loaded var
+CMD_MUL   = '*' # multiplies this and loaded var
+CMD_DIV   = '/' # divides loaded var by this
+CMD_MOD   = '%' # modulos loaded var by this
+CMD_COMP  = '?' # compares this to loaded var
+CMD_OUT   = '"' # prints out ASCII of loaded var
+CMD_IN    = '~' # gets single char input in this var
+
+CMD_UP    = '^' # turns program flow up
+CMD_DOWN  = 'v' # turns program flow down
+CMD_LEFT  = '<' # turns program flow left
+CMD_RIGHT = '>' # turns program flow right
+
+# Variable space
+VARSPACE_SIZE  = 16 # number of unique characters
+VARSPACE_START = 'g' # start character for variable space
+VARSPACE_END   = chr(ord(VARSPACE_START) + VARSPACE_SIZE - 1)
+
+OP_LENGTH = 3
+EMPTY_TRIPLET = " " * OP_LENGTH
+
+# FlowDir
+UP    = 0
+LEFT  = 1
+RIGHT = 2
+DOWN  = 3
+
+DIR_NAMES = ("up", "left", "right", "down")
+DIR_COMMANDS = {CMD_UP: UP, CMD_LEFT: LEFT, CMD_RIGHT: RIGHT, CMD_DOWN: DOWN}
+DIR_DELTAS = ((0, -1), (-1, 0), (1, 0), (0, 1)) # (dx, dy) per FlowDir
+ROTATE_CCW = (LEFT, DOWN, UP, RIGHT) # see rotate_ccw in interpreter.c
+ROTATE_CW  = (RIGHT, UP, DOWN, LEFT) # see rotate_cw in interpreter.c
+
+# ErrCode
+NO_ERROR = 0
+
+# parsing errors
+INVALID_FILE        = 1
+NO_START_CMD        = 2
+MULTIPLE_START_CMDS = 3
+NO_START_DIRECTION  = 4
+
+# runtime errors
+LEAK_ERROR           = 5
+INVALID_EXPRESSION   = 6
+INVALID_VARIABLENAME = 7
+INVALID_OPERATOR     = 8
+BOUNDS_VIOLATION     = 9
+
+# debug errors
+INVALID_DEBUG_FILE = 10
+
+# Python engine only; interpreter.c crashes instead
+DIVIDE_BY_ZERO = 11
+
+# messages, as printed by handle_error in main.c
+ERROR_MESSAGES = {
+  INVALID_FILE:         "PARSING ERROR: Invalid file.",
+  NO_START_CMD:         "PARSING ERROR: No start command in file.",
+  MULTIPLE_START_CMDS:  "PARSING ERROR: Multiple start commands in file.",
+  NO_START_DIRECTION:   "PARSING ERROR: No start direction specified.",
+  LEAK_ERROR:           "RUNTIME ERROR: Program flow left file",
+  INVALID_EXPRESSION:   "RUNTIME ERROR: Invalid expression",
+  INVALID_VARIABLENAME: "RUNTIME ERROR: Invalid variable name",
+  INVALID_OPERATOR:     "RUNTIME ERROR: Invalid operator",
+  BOUNDS_VIOLATION:     "RUNTIME ERROR: Attempted to access invalid memory location",
+  INVALID_DEBUG_FILE:   "DEBUG ERROR: Could not open debug file.",
+  DIVIDE_BY_ZERO:       "RUNTIME ERROR: Division by zero",
+}
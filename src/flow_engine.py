@@ -0,0 +1,422 @@
+#########################
+# flow_engine.py
+# --------------
+# Headless Python engine for running Flow
+# programs, matching tick() in interpreter.c.
+#########################
+
+from array import array
+
+from flow_common import *
+from flow_grid import gridExtent, startError
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+# Opcodes. Directions come first so that
+# op - 1 is the matching FlowDir.
+OP_NOP      = 0
+OP_UP       = 1
+OP_LEFT     = 2
+OP_RIGHT    = 3
+OP_DOWN     = 4
+OP_END      = 5
+OP_LEAK     = 6  # border around the program
+OP_FAIL     = 7  # operand is the ErrCode to raise
+OP_LOAD     = 8
+OP_NEXT_IMM = 9
+OP_NEXT_VAR = 10
+OP_PREV_IMM = 11
+OP_PREV_VAR = 12
+OP_CACHE    = 13
+OP_SET_IMM  = 14
+OP_SET_VAR  = 15
+OP_COPY     = 16
+OP_ADD_IMM  = 17
+OP_ADD_VAR  = 18
+OP_SUB_IMM  = 19
+OP_SUB_VAR  = 20
+OP_MUL_IMM  = 21
+OP_MUL_VAR  = 22
+OP_DIV_IMM  = 23
+OP_DIV_VAR  = 24
+OP_MOD_IMM  = 25
+OP_MOD_VAR  = 26
+OP_COMP_IMM = 27
+OP_COMP_VAR = 28
+OP_OUT_IMM  = 29
+OP_OUT_VAR  = 30
+OP_IN       = 31
+
+# operand standing for the loaded variable ("@ ")
+ARG_LOADED = -1
+
+VARSPACE_CELLS = VARSPACE_SIZE * VARSPACE_SIZE
+
+# commands taking a variable (get_variable)
+VARIABLE_OPS = {CMD_LOAD: OP_LOAD, CMD_CACHE: OP_CACHE,
+                CMD_COPY: OP_COPY, CMD_IN: OP_IN}
+
+# commands taking an expression (evaluate), as (IMM, VAR) opcodes
+EXPRESSION_OPS = {CMD_NEXT: (OP_NEXT_IMM, OP_NEXT_VAR),
+                  CMD_PREV: (OP_PREV_IMM, OP_PREV_VAR),
+                  CMD_SET:  (OP_SET_IMM, OP_SET_VAR),
+                  CMD_ADD:  (OP_ADD_IMM, OP_ADD_VAR),
+                  CMD_SUB:  (OP_SUB_IMM, OP_SUB_VAR),
+                  CMD_MUL:  (OP_MUL_IMM, OP_MUL_VAR),
+                  CMD_DIV:  (OP_DIV_IMM, OP_DIV_VAR),
+                  CMD_MOD:  (OP_MOD_IMM, OP_MOD_VAR),
+                  CMD_COMP: (OP_COMP_IMM, OP_COMP_VAR),
+                  CMD_OUT:  (OP_OUT_IMM, OP_OUT_VAR)}
+
+HEX_DIGITS = "0123456789ABCDEF"
+
+"███████████████████████████████   Lowering   █████████████████████████████████"
+
+
+###############
+# decodeVariable
+#   Decodes a variable name as get_variable does.
+#   Returns its offset in the variable space,
+#   ARG_LOADED for "@ ", or None if invalid.
+def decodeVariable(expression):
+  if expression == "@ ":
+    return ARG_LOADED
+  if len(expression) != 2:
+    return None
+  i = ord(expression[0]) - ord(VARSPACE_START)
+  j = ord(expression[1]) - ord(VARSPACE_START)
+  if 0 <= i < VARSPACE_SIZE and 0 <= j < VARSPACE_SIZE:
+    return i * VARSPACE_SIZE + j
+  return None
+
+###############
+# decodeHex
+#   Decodes a value as translate_hex does.
+#   Returns None if invalid.
+def decodeHex(expression):
+  if (len(expression) != 2 or expression[0] not in HEX_DIGITS or
+      expression[1] not in HEX_DIGITS):
+    return None
+  return HEX_DIGITS.index(expression[0]) * 16 + HEX_DIGITS.index(expression[1])
+
+###############
+# lowerCell
+#   Translates a triplet into (opcode, operand).
+def lowerCell(triplet):
+  command = triplet[0]
+  expression = triplet[1:3]
+  if command == CMD_IGNORE:
+    return (OP_NOP, 0)
+  elif command in DIR_COMMANDS:
+    return (DIR_COMMANDS[command] + 1, 0)
+  elif command == CMD_START:
+    return (OP_END, 0)
+  elif command in VARIABLE_OPS:
+    var = decodeVariable(expression)
+    if var is None:
+      return (OP_FAIL, INVALID_VARIABLENAME)
+    if command == CMD_LOAD and var == ARG_LOADED:
+      return (OP_NOP, 0) # loads itself
+    return (VARIABLE_OPS[command], var)
+  elif command in EXPRESSION_OPS:
+    var = decodeVariable(expression)
+    if var is not None:
+      return (EXPRESSION_OPS[command][1], var)
+    value = decodeHex(expression)
+    if value is None:
+      return (OP_FAIL, INVALID_EXPRESSION)
+    return (EXPRESSION_OPS[command][0], value)
+  return (OP_FAIL, INVALID_OPERATOR)
+
+
+######################
+# FlowProgram
+#   A grid lowered into dense arrays of opcodes
+#   and pre-decoded operands, surrounded by a
+#   border of OP_LEAK cells so that leaving the
+#   program needs no bounds check.
+######################
+class FlowProgram:
+
+  ##############
+  # init
+  #   Lowers a grid. Coords outside the grid's
+  #   saved extent are outside the program.
+  def __init__(self, grid):
+    self.extent = gridExtent(grid)
+    left, top, right, bottom = self.extent
+    self.left = left - 1 # grid coord of index 0
+    self.top = top - 1
+    self.width = right - left + 3
+    self.height = bottom - top + 3
+    size = self.width * self.height
+
+    self.ops = bytearray(size)
+    self.args = array('i', bytes(4 * size))
+    for x in range(self.width):
+      self.ops[x] = OP_LEAK
+      self.ops[size - self.width + x] = OP_LEAK
+    for y in range(self.height):
+      self.ops[y * self.width] = OP_LEAK
+      self.ops[y * self.width + self.width - 1] = OP_LEAK
+
+    # direction steps through the arrays, per FlowDir
+    self.steps = tuple(dx + dy * self.width for dx, dy in DIR_DELTAS)
+
+    self.starts = 0 # number of start commands
+    self.start = None
+    self.startchar = None
+    lowered = {} # triplet: (op, arg), as programs repeat triplets a lot
+    left = self.left
+    top = self.top
+    width = self.width
+    for key, triplet in grid.items():
+      index = (key[1] - top) * width + key[0] - left
+      cell = lowered.get(triplet)
+      if cell is None:
+        cell = lowered[triplet] = lowerCell(triplet)
+      self.ops[index], self.args[index] = cell
+      if CMD_START in triplet:
+        self.starts += triplet.count(CMD_START)
+        if triplet[0] == CMD_START:
+          self.start = index
+          self.startchar = triplet[1]
+    self.checkStart()
+
+  ###############
+  # checkStart
+  #   Sets the start direction and parse error
+  #   from the start commands found.
+  def checkStart(self):
+    self.startdir = DIR_COMMANDS.get(self.startchar)
+    self.error = startError(self.starts, self.startchar)
+
+  ###############
+  # contains
+  #   True if a grid coord is inside the program.
+  def contains(self, coord):
+    return (self.extent[0] <= coord[0] <= self.extent[2] and
+            self.extent[1] <= coord[1] <= self.extent[3])
+
+  ###############
+  # updateCell
+  #   Re-lowers one cell after it changed from old
+  #   to new (None if empty). The cell must be one
+  #   the program contains.
+  def updateCell(self, coord, old, new):
+    index = self.index(coord)
+    self.ops[index], self.args[index] = lowerCell(new or EMPTY_TRIPLET)
+    if old is not None and CMD_START in old:
+      self.starts -= old.count(CMD_START)
+      if index == self.start:
+        self.start = None
+        self.startchar = None
+    if new is not None and CMD_START in new:
+      self.starts += new.count(CMD_START)
+      if new[0] == CMD_START:
+        self.start = index
+        self.startchar = new[1]
+    self.checkStart()
+
+  ###############
+  # index
+  #   Array index of a grid coord.
+  def index(self, coord):
+    return (coord[1] - self.top) * self.width + coord[0] - self.left
+
+  ###############
+  # coord
+  #   Grid coord of an array index.
+  def coord(self, index):
+    return (index % self.width + self.left, index // self.width + self.top)
+
+
+"████████████████████████████████   Machine   █████████████████████████████████"
+
+
+######################
+# FlowMachine
+#   Execution state of a FlowProgram: the
+#   variable space, loaded variable, position,
+#   flow direction and I/O buffers.
+######################
+class FlowMachine:
+
+  ##############
+  # init
+  #   Prepares to run a program from its start
+  #   command, reading input from data.
+  def __init__(self, program, data = b""):
+    self.program = program
+    self.mem = bytearray(VARSPACE_CELLS) # VAR_SPACE
+    self.loaded = 0 # offset of LOADED_VAR
+    self.index = program.start
+    self.direction = program.startdir
+    self.ticks = 0
+    self.input = bytes(data)
+    self.inputpos = 0
+    self.output = bytearray()
+    self.complete = False
+    self.error = program.error
+
+  ###############
+  # readInput
+  #   Returns the next input byte, or 0xFF at EOF
+  #   as getchar() stored in an unsigned char.
+  def readInput(self):
+    if self.inputpos < len(self.input):
+      self.inputpos += 1
+      return self.input[self.inputpos - 1]
+    return 0xFF
+
+  ###############
+  # position
+  #   Grid coord of the current cell.
+  def position(self):
+    return self.program.coord(self.index)
+
+  ###############
+  # done
+  #   True once the program has finished
+  #   or stopped on an error.
+  def done(self):
+    return self.complete or self.error != NO_ERROR
+
+  ###############
+  # run
+  #   Ticks until the program completes, hits an
+  #   error, or maxticks ticks have run. Returns
+  #   the ErrCode (NO_ERROR if still running).
+  def run(self, maxticks = None):
+    if self.done():
+      return self.error
+    ops = self.program.ops
+    args = self.program.args
+    steps = self.program.steps
+    mem = self.mem
+    output = self.output
+    lv = self.loaded
+    i = self.index
+    d = self.direction
+    step = steps[d]
+    n = 0
+    limit = -1 if maxticks is None else maxticks
+    error = NO_ERROR
+
+    while n != limit:
+      i += step
+      n += 1
+      op = ops[i]
+      if op == OP_NOP:
+        continue
+      if op <= OP_DOWN:
+        d = op - 1
+        step = steps[d]
+        continue
+      a = args[i]
+      if op == OP_COMP_IMM or op == OP_COMP_VAR:
+        if op == OP_COMP_VAR:
+          a = mem[lv if a < 0 else a]
+        if mem[lv] < a:
+          d = ROTATE_CCW[d]
+          step = steps[d]
+        elif mem[lv] > a:
+          d = ROTATE_CW[d]
+          step = steps[d]
+      elif op == OP_LOAD:
+        lv = a
+      elif op == OP_SET_IMM:
+        mem[lv] = a
+      elif op == OP_ADD_IMM:
+        mem[lv] = (mem[lv] + a) & 0xFF
+      elif op == OP_SUB_IMM:
+        mem[lv] = (mem[lv] - a) & 0xFF
+      elif op == OP_OUT_VAR:
+        output.append(mem[lv if a < 0 else a])
+      elif op == OP_OUT_IMM:
+        output.append(a)
+      elif op == OP_NEXT_IMM or op == OP_NEXT_VAR:
+        if op == OP_NEXT_VAR:
+          a = mem[lv if a < 0 else a]
+        if lv + a >= VARSPACE_CELLS:
+          error = BOUNDS_VIOLATION
+          break
+        lv += a
+      elif op == OP_PREV_IMM or op == OP_PREV_VAR:
+        if op == OP_PREV_VAR:
+          a = mem[lv if a < 0 else a]
+        if lv - a < 0:
+          error = BOUNDS_VIOLATION
+          break
+        lv -= a
+      elif op == OP_SET_VAR:
+        mem[lv] = mem[lv if a < 0 else a]
+      elif op == OP_COPY:
+        if a >= 0:
+          mem[a] = mem[lv]
+      elif op == OP_CACHE:
+        if a < 0:
+          mem[lv] = 0
+        else:
+          mem[a] = abs(a - lv) & 0xFF
+      elif op == OP_ADD_VAR:
+        mem[lv] = (mem[lv] + mem[lv if a < 0 else a]) & 0xFF
+      elif op == OP_SUB_VAR:
+        mem[lv] = (mem[lv] - mem[lv if a < 0 else a]) & 0xFF
+      elif op == OP_MUL_IMM or op == OP_MUL_VAR:
+        if op == OP_MUL_VAR:
+          a = mem[lv if a < 0 else a]
+        mem[lv] = (mem[lv] * a) & 0xFF
+      elif (op == OP_DIV_IMM or op == OP_DIV_VAR or
+            op == OP_MOD_IMM or op == OP_MOD_VAR):
+        if op == OP_DIV_VAR or op == OP_MOD_VAR:
+          a = mem[lv if a < 0 else a]
+        if a == 0:
+          error = DIVIDE_BY_ZERO
+          break
+        if op == OP_DIV_IMM or op == OP_DIV_VAR:
+          mem[lv] = mem[lv] // a
+        else:
+          mem[lv] = mem[lv] % a
+      elif op == OP_IN:
+        mem[lv if a < 0 else a] = self.readInput()
+      elif op == OP_END:
+        self.complete = True
+        break
+      elif op == OP_LEAK:
+        error = LEAK_ERROR
+        break
+      else: # OP_FAIL
+        error = a
+        break
+
+    self.loaded = lv
+    self.index = i
+    self.direction = d
+    self.ticks += n
+    self.error = error
+    return error
+
+  ###############
+  # errorMessage
+  #   Describes the current error like handle_error
+  #   in main.c, with grid coords instead of the
+  #   file's line and column.
+  def errorMessage(self):
+    if self.error == NO_ERROR:
+      return ""
+    message = ERROR_MESSAGES.get(self.error, "ERROR: Unspecified error")
+    if self.error >= LEAK_ERROR:
+      x, y = self.position()
+      message += " at cell ({}, {}).".format(x, y)
+    return message
+
+
+###############
+# runGrid
+#   Runs a grid to completion (or maxticks) and
+#   returns the finished FlowMachine.
+def runGrid(grid, data = b"", maxticks = None):
+  machine = FlowMachine(FlowProgram(grid), data)
+  machine.run(maxticks)
+  return machine
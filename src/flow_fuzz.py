@@ -0,0 +1,490 @@
+#########################
+# flow_fuzz.py
+# --------------
+# Coverage-guided fuzzing of a Flow program's
+# input: mutates input bytes, runs the program
+# on them across a process pool, keeps inputs
+# that run new cells or take compares new ways,
+# and reports the inputs that end in a runtime
+# error, shrunk to as few bytes as still fail
+# the same way at the same cell.
+#
+# usage: python flow_fuzz.py prog.fl [-j N] [--seconds S] [--runs N]
+#          [--ticks N] [--seed N] [--corpus DIR] [-o report.json]
+#
+# Files in the corpus folder are extra starting
+# inputs, and inputs found are written back there.
+#########################
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+from flow_blocks import BlockCache
+from flow_common import *
+from flow_engine import *
+from flow_grid import loadFile
+from flow_profile import FlowProfile
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+FUZZ_TICKS = 100000 # default tick limit of a run
+FUZZ_SECONDS = 60.0 # default time to fuzz for
+FUZZ_BATCH = 64 # inputs per worker per round
+MAX_INPUT = 4096 # longest input made
+MAX_MUTATIONS = 8 # most mutations stacked on one input
+REPORT_SECONDS = 2.0 # between progress lines
+INTERESTING_BYTES = (0, 1, 10, 13, 32, 48, 57, 65, 90, 97, 122, 127, 128, 255)
+SEED_INPUTS = (b"", b"\n", b"a\n", b"0 1 2\n")
+
+# coverage features are ints: index * 4 for a cell
+# run, index * 4 + one of these for a compare's way
+BRANCH_CCW = 1
+BRANCH_STRAIGHT = 2
+BRANCH_CW = 3
+BRANCH_NAMES = ("", "ccw", "straight", "cw")
+
+"████████████████████████████████   Runner   ██████████████████████████████████"
+
+
+######################
+# TailProfile
+#   A FlowProfile that also lists the ticks run
+#   one at a time after the last whole block, near
+#   the tick limit, as (index, direction before,
+#   direction after).
+######################
+class TailProfile(FlowProfile):
+
+  def __init__(self, program):
+    FlowProfile.__init__(self, program)
+    self.tail = []
+
+  ###############
+  # tick
+  #   Runs one tick of a machine, listing it.
+  def tick(self, machine):
+    d = machine.direction
+    ticks = machine.ticks
+    machine.run(1)
+    if machine.ticks > ticks:
+      self.tail.append((machine.index, d, machine.direction))
+
+
+######################
+# FuzzRunner
+#   Runs one program on inputs with a BlockCache,
+#   profiling each run into coverage features.
+#   The features of each block pass and exit are
+#   worked out once and kept.
+######################
+class FuzzRunner:
+
+  ##############
+  # init
+  #   Compiles a loaded grid for runs of up
+  #   to maxticks ticks.
+  def __init__(self, grid, maxticks = FUZZ_TICKS):
+    self.blocks = BlockCache(grid)
+    self.program = self.blocks.program
+    self.maxticks = maxticks
+    self._features = {} # pass key or exit: tuple of features
+
+  ###############
+  # run
+  #   Runs the program on data. Returns (features,
+  #   machine), features a set.
+  def run(self, data):
+    machine = FlowMachine(self.program, data)
+    profile = TailProfile(self.program)
+    self.blocks.runProfiled(machine, profile, self.maxticks)
+    features = set()
+    for key in profile.passes:
+      features.update(self.passFeatures(key))
+    for exit in profile.exits:
+      features.update(self.exitFeatures(exit))
+    ops = self.program.ops
+    for index, d, e in profile.tail:
+      features.add(index * 4)
+      if ops[index] in (OP_COMP_IMM, OP_COMP_VAR):
+        features.add(branchFeature(index, d, e))
+    return (features, machine)
+
+  ###############
+  # failure
+  #   Runs the program on data without profiling.
+  #   Returns (error, index) if it stopped on a
+  #   runtime error, else None.
+  def failure(self, data):
+    machine = FlowMachine(self.program, data)
+    self.blocks.run(machine, self.maxticks)
+    return crashOf(machine)
+
+  ###############
+  # passFeatures
+  #   Features of a whole pass of a loop block:
+  #   its cells, and its compares going straight.
+  def passFeatures(self, key):
+    features = self._features.get(key)
+    if features is None:
+      cells = self.blocks.blockCells(key)
+      features = self._features[key] = self.cellFeatures(cells, len(cells))
+    return features
+
+  ###############
+  # exitFeatures
+  #   Features of a block left after n cells for
+  #   nextkey: the cells run, compares before the
+  #   last going straight, and the way the last
+  #   one went if it is a compare.
+  def exitFeatures(self, exit):
+    features = self._features.get(exit)
+    if features is None:
+      key, n, nextkey = exit
+      cells = self.blocks.blockCells(key)[:n]
+      features = self.cellFeatures(cells, n - 1)
+      last = cells[-1]
+      if self.program.ops[last] in (OP_COMP_IMM, OP_COMP_VAR):
+        previous = cells[-2] if n > 1 else key >> 2
+        d = self.program.steps.index(last - previous)
+        features += (branchFeature(last, d, nextkey & 3),)
+      self._features[exit] = features
+    return features
+
+  ###############
+  # cellFeatures
+  #   Features of running cells, of which the
+  #   first straight went on past compares.
+  def cellFeatures(self, cells, straight):
+    ops = self.program.ops
+    return tuple([cell * 4 for cell in cells] +
+                 [cell * 4 + BRANCH_STRAIGHT for cell in cells[:straight]
+                  if ops[cell] in (OP_COMP_IMM, OP_COMP_VAR)])
+
+###############
+# branchFeature
+#   Returns the feature of the compare at index
+#   turning flow from direction d to e.
+def branchFeature(index, d, e):
+  return index * 4 + (BRANCH_STRAIGHT if e == d else
+                      BRANCH_CCW if e == ROTATE_CCW[d] else BRANCH_CW)
+
+###############
+# crashOf
+#   Returns (error, index) of a machine stopped
+#   on a runtime error, else None.
+def crashOf(machine):
+  if machine.error >= LEAK_ERROR:
+    return (machine.error, machine.index)
+  return None
+
+
+"█████████████████████████████████   Workers   ████████████████████████████████"
+
+_runner = None # each worker process's FuzzRunner
+_seen = set() # features it has reported
+
+###############
+# startWorker
+#   Loads the program in a worker process.
+def startWorker(filename, maxticks):
+  global _runner
+  grid, error = loadFile(filename)
+  _runner = FuzzRunner(grid, maxticks)
+
+###############
+# runInput
+#   Runs one input in a worker. Returns (features
+#   this worker had not seen, crash, ticks).
+def runInput(data):
+  features, machine = _runner.run(data)
+  new = features - _seen
+  _seen.update(new)
+  return (new, crashOf(machine), machine.ticks)
+
+
+"████████████████████████████████   Fuzzing   █████████████████████████████████"
+
+
+######################
+# Mutator
+#   Makes new inputs from the corpus by stacking
+#   random byte flips, overwrites, inserts,
+#   deletes, duplications and splices, using
+#   interesting bytes and the values the program
+#   compares against.
+######################
+class Mutator:
+
+  ##############
+  # init
+  #   Draws from a seeded random generator; the
+  #   dictionary is extra bytes worth trying.
+  def __init__(self, seed = None, dictionary = b""):
+    self.random = random.Random(seed)
+    self.dictionary = bytes(sorted(set(INTERESTING_BYTES) | set(dictionary)))
+
+  ###############
+  # mutate
+  #   Returns a mutated copy of data, splicing
+  #   in from other if it is needed.
+  def mutate(self, data, other):
+    rand = self.random
+    data = bytearray(data)
+    for mutation in range(rand.randint(1, MAX_MUTATIONS)):
+      kind = rand.randrange(7)
+      if not data and kind < 5:
+        kind = 5
+      if kind == 0: # flip a bit
+        data[rand.randrange(len(data))] ^= 1 << rand.randrange(8)
+      elif kind == 1: # overwrite a byte
+        data[rand.randrange(len(data))] = rand.randrange(256)
+      elif kind == 2: # overwrite with a dictionary byte
+        data[rand.randrange(len(data))] = rand.choice(self.dictionary)
+      elif kind == 3: # delete a run
+        start = rand.randrange(len(data))
+        del data[start:start + rand.randint(1, 8)]
+      elif kind == 4: # duplicate a run
+        start = rand.randrange(len(data))
+        run = data[start:start + rand.randint(1, 8)]
+        at = rand.randrange(len(data) + 1)
+        data[at:at] = run * rand.randint(1, 4)
+      elif kind == 5: # insert dictionary bytes
+        at = rand.randrange(len(data) + 1)
+        data[at:at] = bytes(rand.choice(self.dictionary)
+                            for i in range(rand.randint(1, 4)))
+      else: # splice in part of another input
+        if other:
+          start = rand.randrange(len(other))
+          at = rand.randrange(len(data) + 1)
+          data[at:] = other[start:start + rand.randint(1, len(other))]
+    return bytes(data[:MAX_INPUT])
+
+###############
+# compareValues
+#   Returns the bytes a program's compares test
+#   against directly.
+def compareValues(program):
+  return bytes(sorted({program.args[i] for i, op in enumerate(program.ops)
+                       if op == OP_COMP_IMM}))
+
+###############
+# minimize
+#   Shrinks a crashing input by cutting out runs of
+#   bytes, halving them down to single bytes, as long
+#   as it still fails with the same error at the same
+#   cell. Returns the shortest input found.
+def minimize(runner, data, crash):
+  chunk = max(1, len(data) // 2)
+  while True:
+    i = 0
+    while i < len(data):
+      candidate = data[:i] + data[i + chunk:]
+      if runner.failure(candidate) == crash:
+        data = candidate
+      else:
+        i += chunk
+    if chunk == 1:
+      return data
+    chunk //= 2
+
+
+######################
+# Fuzzer
+#   The corpus, total coverage and crashes found
+#   fuzzing one program, run in rounds of a batch
+#   of inputs per worker.
+######################
+class Fuzzer:
+
+  ##############
+  # init
+  #   Prepares to fuzz a loaded grid, starting
+  #   from the seed inputs.
+  def __init__(self, filename, grid, seeds, maxticks = FUZZ_TICKS,
+               seed = None, corpusdir = None):
+    self.filename = filename
+    self.grid = grid
+    self.maxticks = maxticks
+    self.runner = FuzzRunner(grid, maxticks) # for minimizing
+    self.program = self.runner.program
+    self.mutator = Mutator(seed, compareValues(self.program))
+    self.corpusdir = corpusdir
+    self.seeds = list(dict.fromkeys(seeds))
+    self.corpus = []
+    self.features = set()
+    self.crashes = {} # (error, index): crash dict
+    self.runs = 0
+    self.ticks = 0
+
+  ###############
+  # fuzz
+  #   Runs seeds and then mutated inputs on workers
+  #   processes (one per CPU if None) until seconds
+  #   have passed or runs inputs have run. Calls
+  #   progress(fuzzer) every REPORT_SECONDS.
+  def fuzz(self, workers = None, seconds = FUZZ_SECONDS, runs = None,
+           progress = None):
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    reported = start
+    with ProcessPoolExecutor(workers, initializer = startWorker,
+                             initargs = (self.filename, self.maxticks)) as pool:
+      batch = self.seeds
+      while batch:
+        results = pool.map(runInput, batch, chunksize = FUZZ_BATCH)
+        for data, result in zip(batch, results):
+          self.add(data, *result)
+        now = time.perf_counter()
+        if progress is not None and now - reported >= REPORT_SECONDS:
+          progress(self)
+          reported = now
+        size = workers * FUZZ_BATCH
+        if runs is not None:
+          size = min(size, runs - self.runs)
+        if now - start >= seconds:
+          size = 0
+        batch = [self.mutant() for i in range(size)]
+    self.seconds = time.perf_counter() - start
+
+  ###############
+  # mutant
+  #   Returns a mutation of a corpus input.
+  def mutant(self):
+    rand = self.mutator.random
+    corpus = self.corpus or [b""]
+    return self.mutator.mutate(rand.choice(corpus), rand.choice(corpus))
+
+  ###############
+  # add
+  #   Takes in the result of running data: keeps it
+  #   if it reached new features, and records its
+  #   crash, minimized, if not seen before.
+  def add(self, data, features, crash, ticks):
+    self.runs += 1
+    self.ticks += ticks
+    new = features - self.features
+    if new or not self.corpus:
+      self.features.update(new)
+      self.corpus.append(data)
+      self.saveInput(data)
+    if crash is not None and crash not in self.crashes:
+      small = minimize(self.runner, data, crash)
+      machine = FlowMachine(self.program, small)
+      self.runner.blocks.run(machine, self.maxticks)
+      self.crashes[crash] = {"error": crash[0], "message": machine.errorMessage(),
+                             "cell": self.program.coord(crash[1]),
+                             "input": small.decode("latin-1"),
+                             "found": self.runs}
+
+  ###############
+  # saveInput
+  #   Writes a corpus input into the corpus folder,
+  #   named by its hash.
+  def saveInput(self, data):
+    if self.corpusdir is not None:
+      name = os.path.join(self.corpusdir, hashlib.sha1(data).hexdigest())
+      if not os.path.exists(name):
+        with open(name, 'wb') as outfile:
+          outfile.write(data)
+
+  ###############
+  # coverage
+  #   Returns (cells run, cells, compare ways
+  #   taken, compare ways) over the program's
+  #   non-blank cells.
+  def coverage(self):
+    program = self.program
+    cells = [program.index(coord) for coord in self.grid]
+    compares = [i for i in cells if program.ops[i] in (OP_COMP_IMM, OP_COMP_VAR)]
+    ways = sum(1 for i in compares for way in (BRANCH_CCW, BRANCH_STRAIGHT, BRANCH_CW)
+               if i * 4 + way in self.features)
+    return (sum(1 for i in cells if i * 4 in self.features), len(cells),
+            ways, 3 * len(compares))
+
+  ###############
+  # branches
+  #   Returns {coord: ways taken} of every compare.
+  def branches(self):
+    program = self.program
+    return {coord: [BRANCH_NAMES[way] for way in (BRANCH_CCW, BRANCH_STRAIGHT, BRANCH_CW)
+                    if program.index(coord) * 4 + way in self.features]
+            for coord in self.grid
+            if program.ops[program.index(coord)] in (OP_COMP_IMM, OP_COMP_VAR)}
+
+  ###############
+  # status
+  #   Returns a progress line.
+  def status(self):
+    run, cells, ways, allways = self.coverage()
+    return "{} runs: {}/{} cells, {}/{} compare ways, {} inputs, {} crashes".format(
+      self.runs, run, cells, ways, allways, len(self.corpus), len(self.crashes))
+
+###############
+# readSeeds
+#   Returns the contents of every file in a
+#   folder, in name order.
+def readSeeds(folder):
+  seeds = []
+  for name in sorted(os.listdir(folder)):
+    path = os.path.join(folder, name)
+    if os.path.isfile(path):
+      with open(path, 'rb') as infile:
+        seeds.append(infile.read())
+  return seeds
+
+
+"██████████████████████████████████   Main   ██████████████████████████████████"
+
+def main():
+  parser = argparse.ArgumentParser(description = "Fuzz a Flow program's input.")
+  parser.add_argument("program", help = "Flow file (.fl)")
+  parser.add_argument("-j", "--jobs", type = int,
+                      help = "worker processes (default: one per CPU)")
+  parser.add_argument("--seconds", type = float, default = FUZZ_SECONDS,
+                      help = "time to fuzz for (default: {:g})".format(FUZZ_SECONDS))
+  parser.add_argument("--runs", type = int, help = "stop after this many inputs")
+  parser.add_argument("--ticks", type = int, default = FUZZ_TICKS,
+                      help = "tick limit of a run (default: {})".format(FUZZ_TICKS))
+  parser.add_argument("--seed", type = int, help = "random seed")
+  parser.add_argument("--corpus", help = "folder of inputs to start from "
+                      "and to add new ones to")
+  parser.add_argument("-o", "--output", help = "JSON report to write "
+                      "(default: none)")
+  args = parser.parse_args()
+
+  grid, error = loadFile(args.program)
+  if grid is None or error != NO_ERROR:
+    sys.exit(ERROR_MESSAGES[error])
+  seeds = list(SEED_INPUTS)
+  if args.corpus is not None:
+    os.makedirs(args.corpus, exist_ok = True)
+    seeds.extend(readSeeds(args.corpus))
+  fuzzer = Fuzzer(args.program, grid, seeds, args.ticks, args.seed, args.corpus)
+  fuzzer.fuzz(args.jobs, args.seconds, args.runs,
+              lambda fuzzer: print(fuzzer.status(), flush = True))
+
+  print("{} in {:.2f}s".format(fuzzer.status(), fuzzer.seconds))
+  for crash in sorted(fuzzer.crashes.values(), key = lambda crash: crash["found"]):
+    print("{}\n  input: {!r}".format(crash["message"], crash["input"].encode("latin-1")))
+  if args.output:
+    run, cells, ways, allways = fuzzer.coverage()
+    with open(args.output, 'w') as outfile:
+      json.dump({"program": args.program, "runs": fuzzer.runs,
+                 "seconds": fuzzer.seconds, "ticks": fuzzer.ticks,
+                 "cells": [run, cells], "compare ways": [ways, allways],
+                 "branches": [{"cell": coord, "ways": ways}
+                              for coord, ways in fuzzer.branches().items()],
+                 "corpus": [data.decode("latin-1") for data in fuzzer.corpus],
+                 "crashes": sorted(fuzzer.crashes.values(),
+                                   key = lambda crash: crash["found"])},
+                outfile, indent = 2)
+  sys.exit(1 if fuzzer.crashes else 0)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,736 @@
+#########################
+# flow_grid.py
+# --------------
+# Sparse storage for the cells of a
+# Flow program, with a spatial index.
+#########################
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import ItemsView, MutableMapping
+import os
+import tempfile
+
+from flow_common import *
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+TILE_BITS = 6
+TILE_SIZE = 1 << TILE_BITS # cells per tile side
+TILE_MASK = TILE_SIZE - 1
+TILE_ROW = TILE_SIZE * OP_LENGTH # bytes per tile row
+TILE_BYTES = TILE_SIZE * TILE_ROW
+
+EMPTY_BYTES = b"\0" * OP_LENGTH # an empty cell in a tile
+WIDE_BYTES = b"\0\0\1" # a cell kept in the overflow dict
+EMPTY_CELL = EMPTY_BYTES.decode("latin-1")
+WIDE_CELL = WIDE_BYTES.decode("latin-1")
+
+BULK_ROW_CELLS = 8 # cells in a row above which it is rewritten in one go
+PROGRESS_ROWS = 256 # rows written between progress reports
+NEW_FILE_MODE = 0o644 # permissions of newly saved files
+
+"██████████████████████████████   Flow Grid   █████████████████████████████████"
+
+
+###############
+# cellBytes
+#   Returns a triplet as the 3 bytes stored in a
+#   tile, or None if it has to go in the overflow
+#   dict: it is not 3 latin-1 characters, or it
+#   holds a NUL, which tiles use for empty cells.
+def cellBytes(triplet):
+  if len(triplet) != OP_LENGTH or "\0" in triplet:
+    return None
+  try:
+    return triplet.encode("latin-1")
+  except UnicodeEncodeError:
+    return None
+
+
+######################
+# FlowGrid
+#   Maps (x, y) coords to triplets, like a dict.
+#   Cells are stored 3 bytes each in TILE_SIZE
+#   square tiles, allocated as cells are set, with
+#   a small overflow dict for triplets that do not
+#   fit in 3 bytes. Keeps per-row and per-column
+#   sorted coordinate arrays and the bounding box
+#   of all cells up to date on every insert and
+#   delete.
+######################
+class FlowGrid(MutableMapping):
+
+  ##############
+  # init
+  #   Creates a grid, optionally filled
+  #   from a dict of coord: triplet.
+  def __init__(self, cells = None):
+    self._tiles = {} # (tx, ty): bytearray of TILE_BYTES
+    self._tilecounts = {} # (tx, ty): cells set in the tile
+    self._wide = {} # coord: triplet not stored in its tile
+    self._count = 0
+    self._rows = {} # y: sorted array of x
+    self._cols = {} # x: sorted array of y
+    self._bounds = None # (minX, minY, maxX, maxY), None if empty
+    self._boundsdirty = False
+    if cells is not None:
+      for key, val in cells.items():
+        self[key] = val
+
+  ###############
+  # dict-like access
+  def __getitem__(self, key):
+    tile = self._tiles.get((key[0] >> TILE_BITS, key[1] >> TILE_BITS))
+    if tile is not None:
+      i = (key[1] & TILE_MASK) * TILE_ROW + (key[0] & TILE_MASK) * OP_LENGTH
+      cell = tile[i:i + OP_LENGTH]
+      if cell[0]:
+        return cell.decode("latin-1")
+      if cell == WIDE_BYTES:
+        return self._wide[key]
+    raise KeyError(key)
+
+  def __setitem__(self, key, val):
+    data = cellBytes(val)
+    tilekey = (key[0] >> TILE_BITS, key[1] >> TILE_BITS)
+    tile = self._tiles.get(tilekey)
+    if tile is None:
+      tile = self._tiles[tilekey] = bytearray(TILE_BYTES)
+      self._tilecounts[tilekey] = 0
+    i = (key[1] & TILE_MASK) * TILE_ROW + (key[0] & TILE_MASK) * OP_LENGTH
+    old = tile[i:i + OP_LENGTH]
+    if old == WIDE_BYTES:
+      del self._wide[key]
+    elif old == EMPTY_BYTES:
+      self._tilecounts[tilekey] += 1
+      self._count += 1
+      insort(self._rows.setdefault(key[1], array('i')), key[0])
+      insort(self._cols.setdefault(key[0], array('i')), key[1])
+      self.growBounds(key)
+    if data is None:
+      self._wide[key] = val
+      data = WIDE_BYTES
+    tile[i:i + OP_LENGTH] = data
+
+  def __delitem__(self, key):
+    tilekey = (key[0] >> TILE_BITS, key[1] >> TILE_BITS)
+    tile = self._tiles.get(tilekey)
+    i = (key[1] & TILE_MASK) * TILE_ROW + (key[0] & TILE_MASK) * OP_LENGTH
+    if tile is None or tile[i:i + OP_LENGTH] == EMPTY_BYTES:
+      raise KeyError(key)
+    if tile[i:i + OP_LENGTH] == WIDE_BYTES:
+      del self._wide[key]
+    self._tilecounts[tilekey] -= 1
+    if self._tilecounts[tilekey]:
+      tile[i:i + OP_LENGTH] = EMPTY_BYTES
+    else:
+      del self._tiles[tilekey]
+      del self._tilecounts[tilekey]
+    self._count -= 1
+    row = self._rows[key[1]]
+    del row[bisect_left(row, key[0])]
+    if not row:
+      del self._rows[key[1]]
+    col = self._cols[key[0]]
+    del col[bisect_left(col, key[1])]
+    if not col:
+      del self._cols[key[0]]
+    self.shrinkBounds(key)
+
+  def __contains__(self, key):
+    tile = self._tiles.get((key[0] >> TILE_BITS, key[1] >> TILE_BITS))
+    if tile is None:
+      return False
+    i = (key[1] & TILE_MASK) * TILE_ROW + (key[0] & TILE_MASK) * OP_LENGTH
+    return tile[i:i + OP_LENGTH] != EMPTY_BYTES
+
+  def __iter__(self):
+    rows = self._rows
+    for y in sorted(rows):
+      for x in rows[y]:
+        yield (x, y)
+
+  def __len__(self):
+    return self._count
+
+  def get(self, key, default = None):
+    try:
+      return self[key]
+    except KeyError:
+      return default
+
+  def items(self):
+    return GridItems(self)
+
+  ###############
+  # copy
+  #   Returns an independent copy of the grid,
+  #   copying tiles and index arrays whole.
+  def copy(self):
+    grid = FlowGrid()
+    grid._tiles = {key: bytearray(tile) for key, tile in self._tiles.items()}
+    grid._tilecounts = dict(self._tilecounts)
+    grid._wide = dict(self._wide)
+    grid._count = self._count
+    grid._rows = {y: array('i', xs) for y, xs in self._rows.items()}
+    grid._cols = {x: array('i', ys) for x, ys in self._cols.items()}
+    grid._bounds = self._bounds
+    grid._boundsdirty = self._boundsdirty
+    return grid
+
+  ###############
+  # iterItems
+  #   Yields (coord, triplet) of every cell in
+  #   reading order. Dense rows are sliced out of
+  #   one rowText, others decode each tile row once.
+  def iterItems(self):
+    rows = self._rows
+    tiles = self._tiles
+    for y in sorted(rows):
+      xs = rows[y]
+      left = xs[0]
+      width = xs[-1] - left + 1
+      if not self._wide and width <= 2 * len(xs) + TILE_SIZE:
+        text = self.rowText(y, left, width, EMPTY_CELL)
+        yield from [((x, y), text[(x - left) * OP_LENGTH:
+                                  (x - left + 1) * OP_LENGTH]) for x in xs]
+        continue
+      ty = y >> TILE_BITS
+      r = (y & TILE_MASK) * TILE_ROW
+      tx = None
+      for x in xs:
+        if x >> TILE_BITS != tx:
+          tx = x >> TILE_BITS
+          text = tiles[(tx, ty)][r:r + TILE_ROW].decode("latin-1")
+        i = (x & TILE_MASK) * OP_LENGTH
+        cell = text[i:i + OP_LENGTH]
+        if cell == WIDE_CELL:
+          cell = self._wide[(x, y)]
+        yield ((x, y), cell)
+
+  ###############
+  # setRow
+  #   Stores a run of cells in row y in one go.
+  #   xs must be sorted, with one triplet per x.
+  def setRow(self, y, xs, triplets):
+    if not xs:
+      return
+    joined = "".join(triplets)
+    if (y in self._rows or "\0" in joined or
+        len(joined) != OP_LENGTH * len(triplets)):
+      for x, val in zip(xs, triplets):
+        self[(x, y)] = val
+      return
+
+    # a new row: write each tile's part in one go
+    ty = y >> TILE_BITS
+    r = (y & TILE_MASK) * TILE_ROW
+    cells = None
+    for x, val in zip(xs, triplets):
+      if cells is None or x >> TILE_BITS != tx:
+        if cells is not None:
+          self.setTileRow((tx, ty), r, cells, count)
+        tx = x >> TILE_BITS
+        cells = [EMPTY_CELL] * TILE_SIZE
+        count = 0
+      cells[x & TILE_MASK] = val
+      count += 1
+    self.setTileRow((tx, ty), r, cells, count)
+
+    self._count += len(xs)
+    self._rows[y] = array('i', xs)
+    for x in xs:
+      col = self._cols.get(x)
+      if col is None:
+        self._cols[x] = array('i', (y,))
+      elif col[-1] < y:
+        col.append(y)
+      else:
+        insort(col, y)
+    self.growBounds((xs[0], y))
+    self.growBounds((xs[-1], y))
+
+  ###############
+  # setTileRow
+  #   Writes count new cells into an empty row of a
+  #   tile, given one triplet (or EMPTY_CELL) per
+  #   column. Only setRow should call this.
+  def setTileRow(self, tilekey, r, cells, count):
+    tile = self._tiles.get(tilekey)
+    if tile is None:
+      tile = self._tiles[tilekey] = bytearray(TILE_BYTES)
+      self._tilecounts[tilekey] = 0
+    self._tilecounts[tilekey] += count
+    try:
+      tile[r:r + TILE_ROW] = "".join(cells).encode("latin-1")
+    except UnicodeEncodeError: # some cell does not fit in 3 bytes
+      for lx, val in enumerate(cells):
+        if val == EMPTY_CELL:
+          continue
+        data = cellBytes(val)
+        if data is None:
+          x = (tilekey[0] << TILE_BITS) + lx
+          y = (tilekey[1] << TILE_BITS) + r // TILE_ROW
+          self._wide[(x, y)] = val
+          data = WIDE_BYTES
+        i = r + lx * OP_LENGTH
+        tile[i:i + OP_LENGTH] = data
+  ###############
+  # rowText
+  #   Returns row y as a string of width triplets
+  #   starting at column left, with empty cells
+  #   filled with spaces (or fill). Copies whole
+  #   runs of each tile's row at a time.
+  def rowText(self, y, left, width, fill = EMPTY_TRIPLET):
+    if y not in self._rows:
+      return fill * width
+    ty = y >> TILE_BITS
+    r = (y & TILE_MASK) * TILE_ROW
+    parts = []
+    x = left
+    end = left + width
+    while x < end:
+      lx = x & TILE_MASK
+      n = min(TILE_SIZE - lx, end - x)
+      tile = self._tiles.get((x >> TILE_BITS, ty))
+      if tile is None:
+        parts.append(EMPTY_BYTES * n)
+      else:
+        i = r + lx * OP_LENGTH
+        parts.append(tile[i:i + n * OP_LENGTH])
+      x += n
+    text = b"".join(parts).decode("latin-1")
+    if fill != EMPTY_CELL:
+      text = text.replace(EMPTY_CELL, fill)
+    if self._wide and WIDE_CELL in text:
+      cells = [text[i:i + OP_LENGTH] for i in range(0, len(text), OP_LENGTH)]
+      for (x, wy), val in self._wide.items():
+        if wy == y and left <= x < end:
+          cells[x - left] = val
+      text = "".join(cells)
+    return text
+
+  ###############
+  # rect
+  #   Returns width x height cells from topleft as
+  #   one rowText string per row.
+  def rect(self, topleft, width, height, fill = EMPTY_TRIPLET):
+    return [self.rowText(y, topleft[0], width, fill)
+            for y in range(topleft[1], topleft[1] + height)]
+
+  ###############
+  # setRect
+  #   Writes rows of cells (as rect returns them with
+  #   EMPTY_CELL fill) from topleft, emptying cells
+  #   that are EMPTY_CELL in rows. Only cells that
+  #   change are touched. Returns their (coord, old,
+  #   new) deltas.
+  def setRect(self, topleft, rows):
+    left, top = topleft
+    deltas = []
+    for y, new in enumerate(rows, top):
+      width = len(new) // OP_LENGTH
+      old = self.rowText(y, left, width, EMPTY_CELL)
+      if old == new or self.setRowText(y, left, old, new, deltas):
+        continue
+      for i in range(0, len(new), OP_LENGTH):
+        was = old[i:i + OP_LENGTH]
+        cell = new[i:i + OP_LENGTH]
+        if was != cell:
+          coord = (left + i // OP_LENGTH, y)
+          if cell == EMPTY_CELL:
+            deltas.append((coord, self[coord], None))
+            del self[coord]
+          else:
+            deltas.append((coord, self.get(coord), cell))
+            self[coord] = cell
+    return deltas
+
+  ###############
+  # setRowText
+  #   setRect's fast path for one row: works out the
+  #   changed cells, then copies the whole row into
+  #   the tiles and fixes up the indexes in bulk.
+  #   Appends the deltas and returns True, or returns
+  #   False having changed nothing if some cell has
+  #   to go in the overflow dict.
+  def setRowText(self, y, left, old, new, deltas):
+    if self._wide:
+      return False
+    try:
+      data = new.encode("latin-1")
+    except UnicodeEncodeError:
+      return False
+    added = [] # xs of new cells
+    removed = [] # xs of emptied cells
+    changes = []
+    for i in range(0, len(new), OP_LENGTH):
+      was = old[i:i + OP_LENGTH]
+      cell = new[i:i + OP_LENGTH]
+      if was != cell:
+        x = left + i // OP_LENGTH
+        if cell == EMPTY_CELL:
+          changes.append(((x, y), was, None))
+          removed.append(x)
+        else:
+          if "\0" in cell:
+            return False
+          if was == EMPTY_CELL:
+            changes.append(((x, y), None, cell))
+            added.append(x)
+          else:
+            changes.append(((x, y), was, cell))
+    deltas.extend(changes)
+
+    # tiles
+    ty = y >> TILE_BITS
+    r = (y & TILE_MASK) * TILE_ROW
+    counts = {}
+    for x in added:
+      counts[x >> TILE_BITS] = counts.get(x >> TILE_BITS, 0) + 1
+    for x in removed:
+      counts[x >> TILE_BITS] = counts.get(x >> TILE_BITS, 0) - 1
+    x = left
+    end = left + len(new) // OP_LENGTH
+    while x < end:
+      lx = x & TILE_MASK
+      n = min(TILE_SIZE - lx, end - x)
+      tilekey = (x >> TILE_BITS, ty)
+      tile = self._tiles.get(tilekey)
+      if tile is None and counts.get(tilekey[0], 0) > 0:
+        tile = self._tiles[tilekey] = bytearray(TILE_BYTES)
+        self._tilecounts[tilekey] = 0
+      if tile is not None:
+        count = self._tilecounts[tilekey] + counts.get(tilekey[0], 0)
+        if count:
+          i = (x - left) * OP_LENGTH
+          tile[r + lx * OP_LENGTH:r + (lx + n) * OP_LENGTH] = data[i:i + n * OP_LENGTH]
+          self._tilecounts[tilekey] = count
+        else:
+          del self._tiles[tilekey]
+          del self._tilecounts[tilekey]
+      x += n
+
+    # indexes
+    self._count += len(added) - len(removed)
+    xs = self._rows.get(y)
+    if xs is None:
+      if added:
+        self._rows[y] = array('i', added)
+    elif len(added) + len(removed) > len(xs) // 8:
+      xs = sorted(set(xs).difference(removed).union(added))
+      if xs:
+        self._rows[y] = array('i', xs)
+      else:
+        del self._rows[y]
+    else:
+      for x in removed:
+        del xs[bisect_left(xs, x)]
+      for x in added:
+        insort(xs, x)
+      if not xs:
+        del self._rows[y]
+    for x in added:
+      col = self._cols.get(x)
+      if col is None:
+        self._cols[x] = array('i', (y,))
+      elif col[-1] < y:
+        col.append(y)
+      else:
+        insort(col, y)
+    for x in removed:
+      col = self._cols[x]
+      del col[bisect_left(col, y)]
+      if not col:
+        del self._cols[x]
+    if added:
+      self.growBounds((added[0], y))
+      self.growBounds((added[-1], y))
+    for x in removed:
+      self.shrinkBounds((x, y))
+    return True
+
+  ###############
+  # clearRect
+  #   Empties the rectangle from topleft to botright
+  #   inclusive. Returns the (coord, old, None)
+  #   deltas of the cells removed.
+  def clearRect(self, topleft, botright):
+    deltas = []
+    for y in range(topleft[1], botright[1] + 1):
+      xs = self._rows.get(y)
+      if not xs:
+        continue
+      lo = bisect_left(xs, topleft[0])
+      hi = bisect_right(xs, botright[0])
+      if hi - lo > BULK_ROW_CELLS:
+        left = xs[lo]
+        width = xs[hi - 1] - left + 1
+        old = self.rowText(y, left, width, EMPTY_CELL)
+        if self.setRowText(y, left, old, EMPTY_CELL * width, deltas):
+          continue
+      for x in xs[lo:hi].tolist():
+        deltas.append(((x, y), self[(x, y)], None))
+        del self[(x, y)]
+    return deltas
+
+  ###############
+  # apply
+  #   Sets each coord to its triplet, or empties it
+  #   for None, given (coord, triplet) changes.
+  #   Returns the (coord, old, new) deltas.
+  def apply(self, changes):
+    deltas = []
+    for coord, triplet in changes:
+      old = self.get(coord)
+      if triplet is not None:
+        self[coord] = triplet
+      elif old is not None:
+        del self[coord]
+      deltas.append((coord, old, triplet))
+    return deltas
+
+  ###############
+  # rectCoords
+  #   Returns the coords of all cells in the rectangle
+  #   from topleft to botright inclusive, in reading
+  #   order.
+  def rectCoords(self, topleft, botright):
+    coords = []
+    for y in range(topleft[1], botright[1] + 1):
+      xs = self._rows.get(y)
+      if xs:
+        coords.extend([(x, y) for x in xs[bisect_left(xs, topleft[0]):
+                                          bisect_right(xs, botright[0])]])
+    return coords
+
+  ###############
+  # row
+  #   Returns the coords of all cells in row y,
+  #   ordered by x.
+  def row(self, y):
+    return [(x, y) for x in self._rows.get(y, ())]
+
+  ###############
+  # column
+  #   Returns the coords of all cells in column x,
+  #   ordered by y.
+  def column(self, x):
+    return [(x, y) for y in self._cols.get(x, ())]
+
+  ###############
+  # tileKeys
+  #   Returns the (tx, ty) keys of all allocated
+  #   tiles. Tile (tx, ty) holds the cells with
+  #   x >> TILE_BITS == tx and y >> TILE_BITS == ty.
+  def tileKeys(self):
+    return list(self._tiles)
+
+  ###############
+  # tileCommands
+  #   Returns the first byte of every cell of a tile,
+  #   row by row, TILE_SIZE * TILE_SIZE bytes with 0
+  #   for empty cells, or None if the tile is empty.
+  #   Overflow cells give their command's latin-1
+  #   byte, or 1 if it has none.
+  def tileCommands(self, tilekey):
+    tile = self._tiles.get(tilekey)
+    if tile is None:
+      return None
+    commands = tile[0::OP_LENGTH]
+    for (x, y), triplet in self._wide.items():
+      if (x >> TILE_BITS, y >> TILE_BITS) == tilekey:
+        command = ord(triplet[0]) if triplet else 1
+        commands[(y & TILE_MASK) * TILE_SIZE + (x & TILE_MASK)] = (
+          command if 0 < command < 256 else 1)
+    return commands
+
+  ###############
+  # bounds
+  #   Returns (minX, minY, maxX, maxY) of all
+  #   cells, or None if the grid is empty.
+  def bounds(self):
+    if self._boundsdirty:
+      if self._count:
+        self._bounds = (min(self._cols), min(self._rows),
+                        max(self._cols), max(self._rows))
+      else:
+        self._bounds = None
+      self._boundsdirty = False
+    return self._bounds
+
+  ###############
+  # growBounds
+  #   Extends the bounding box to hold a new coord.
+  def growBounds(self, key):
+    if self._boundsdirty:
+      return # recomputed on next query anyway
+    if self._bounds is None:
+      self._bounds = (key[0], key[1], key[0], key[1])
+    else:
+      b = self._bounds
+      self._bounds = (min(b[0], key[0]), min(b[1], key[1]),
+                      max(b[2], key[0]), max(b[3], key[1]))
+
+  ###############
+  # shrinkBounds
+  #   Marks the bounding box for recomputation if
+  #   a removed coord emptied one of its edges.
+  def shrinkBounds(self, key):
+    if self._boundsdirty or self._bounds is None:
+      return
+    b = self._bounds
+    if ((key[0] == b[0] or key[0] == b[2]) and key[0] not in self._cols or
+        (key[1] == b[1] or key[1] == b[3]) and key[1] not in self._rows):
+      self._boundsdirty = True
+
+
+######################
+# GridItems
+#   The items() view of a FlowGrid, iterating
+#   through the tiles instead of looking up
+#   each cell.
+######################
+class GridItems(ItemsView):
+
+  def __iter__(self):
+    return self._mapping.iterItems()
+
+
+"████████████████████████████████   File I/O   ████████████████████████████████"
+
+
+###############
+# checkStart
+#   Counts the start commands in a line of text and
+#   finds the start cell, as load_file in loader.c
+#   does. Returns (count, start, direction), with
+#   start None if no cell in the line begins with #.
+def checkStart(line, y):
+  count = line.count(CMD_START)
+  start = None
+  direction = None
+  i = line.find(CMD_START)
+  while i != -1:
+    if i % OP_LENGTH == 0:
+      start = (i // OP_LENGTH, y)
+      direction = line[i + 1:i + 2]
+    i = line.find(CMD_START, i + 1)
+  return (count, start, direction)
+
+###############
+# startError
+#   Returns the ErrCode load_file would give for
+#   the start commands found in a program.
+def startError(count, direction):
+  if count == 0:
+    return NO_START_CMD
+  elif count > 1:
+    return MULTIPLE_START_CMDS
+  elif direction is None:
+    return NO_START_CMD # the only # is not at the start of a cell
+  elif direction not in DIR_COMMANDS:
+    return NO_START_DIRECTION
+  return NO_ERROR
+
+###############
+# readGrid
+#   Parses lines of a Flow file straight into a grid,
+#   one line at a time. Blank triplets are not stored.
+#   Returns (grid, error), where error is an ErrCode
+#   for the program's start command.
+def readGrid(lines):
+  grid = FlowGrid()
+  starts = 0
+  direction = None
+  y = 0
+  for line in lines:
+    line = line.rstrip("\n")
+    if CMD_START in line:
+      count, start, startdir = checkStart(line, y)
+      starts += count
+      if start is not None:
+        direction = startdir
+    triplets = [line[i:i + OP_LENGTH] for i in range(0, len(line), OP_LENGTH)]
+    if triplets and len(triplets[-1]) < OP_LENGTH:
+      triplets[-1] = triplets[-1].ljust(OP_LENGTH)
+    xs = [x for x, t in enumerate(triplets) if t != EMPTY_TRIPLET]
+    if len(xs) < len(triplets):
+      triplets = [triplets[x] for x in xs]
+    grid.setRow(y, xs, triplets)
+    y += 1
+  return (grid, startError(starts, direction))
+
+###############
+# loadFile
+#   Streams a Flow file from disk into a grid.
+#   Returns (grid, error); grid is None if the
+#   file could not be read.
+def loadFile(filename):
+  try:
+    with open(filename, 'r') as infile:
+      return readGrid(infile)
+  except (OSError, UnicodeDecodeError):
+    return (None, INVALID_FILE)
+
+###############
+# gridExtent
+#   Returns (left, top, right, bottom) of the area
+#   saved to file: the grid's bounds, always
+#   including the origin.
+def gridExtent(grid):
+  bounds = grid.bounds()
+  if bounds is None:
+    return (0, 0, 0, 0)
+  return (min(bounds[0], 0), min(bounds[1], 0),
+          max(bounds[2], 0), max(bounds[3], 0))
+
+###############
+# writeGrid
+#   Writes a grid to a text stream, one whole row
+#   per write. Returns an ErrCode for the program's
+#   start command, checked on the way through. If
+#   given, progress(rows written, rows) is called
+#   every PROGRESS_ROWS rows.
+def writeGrid(grid, outfile, progress = None):
+  left, top, right, bottom = gridExtent(grid)
+  width = right - left + 1
+  starts = 0
+  direction = None
+  for y in range(top, bottom + 1):
+    if progress is not None and (y - top) % PROGRESS_ROWS == 0:
+      progress(y - top, bottom - top + 1)
+    line = grid.rowText(y, left, width)
+    if CMD_START in line:
+      count, start, startdir = checkStart(line, y)
+      starts += count
+      if start is not None:
+        direction = startdir
+    outfile.write(line + "\n")
+  return startError(starts, direction)
+
+###############
+# saveFile
+#   Writes a grid to a Flow file on disk through
+#   a temp file renamed over it, so the file is
+#   never left half written. Returns the ErrCode
+#   from writeGrid.
+def saveFile(grid, filename, progress = None):
+  folder, name = os.path.split(os.path.abspath(filename))
+  handle, temp = tempfile.mkstemp(prefix = "." + name, suffix = ".tmp",
+                                  dir = folder)
+  try:
+    with os.fdopen(handle, 'w') as outfile:
+      error = writeGrid(grid, outfile, progress)
+      outfile.flush()
+      os.fsync(outfile.fileno())
+    if os.path.exists(filename):
+      os.chmod(temp, os.stat(filename).st_mode & 0o777)
+    else:
+      os.chmod(temp, NEW_FILE_MODE)
+    os.replace(temp, filename)
+  except BaseException:
+    os.remove(temp)
+    raise
+  return error
@@ -0,0 +1,182 @@
+#########################
+# flow_hang.py
+# --------------
+# Proves a running Flow program will never
+# stop, by finding a repeated machine state:
+# the program is deterministic, so from a
+# repeat on it can only go round again.
+#########################
+
+import copy
+
+from flow_common import *
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+HANG_STRIDE = 1 << 14 # ticks between state checks
+CYCLE_TICK_LIMIT = 1 << 16 # ticks stepped through to list a cycle's cells
+
+"█████████████████████████████████   Hangs   ██████████████████████████████████"
+
+
+###############
+# machineState
+#   Returns everything a machine's future
+#   depends on: position, direction, loaded
+#   variable, variable space and input read.
+def machineState(machine):
+  return (machine.index, machine.direction, machine.loaded,
+          machine.inputpos, bytes(machine.mem))
+
+
+######################
+# FlowCycle
+#   A loop a program can never leave: ticks long,
+#   through cells (coords, in the order first run),
+#   found after at ticks. If the loop was too long
+#   to step through, cells holds only its start
+#   and complete is False.
+######################
+class FlowCycle:
+
+  def __init__(self, ticks, cells, at, complete):
+    self.ticks = ticks
+    self.cells = cells
+    self.at = at
+    self.complete = complete
+
+  ###############
+  # message
+  #   Describes the cycle like the engine's
+  #   status lines.
+  def message(self):
+    return "[Flow] Stopped: program loops forever ({} tick cycle through {}{} cells{}).".format(
+      self.ticks, "" if self.complete else "at least ", len(self.cells),
+      ", first at ({}, {})".format(*self.cells[0]) if self.cells else "")
+
+
+######################
+# CycleSearch
+#   Lists the cells of a loop found at a repeated
+#   state, by stepping a copy of the machine until
+#   it gets back there, a few ticks per call so
+#   the editor can spread it over idle time. The
+#   machine itself is left where it is. Most ticks
+#   are ruled out by position and direction alone;
+#   only those are compared to the whole state.
+######################
+class CycleSearch:
+
+  ##############
+  # init
+  #   Starts from the machine in a state seen a
+  #   multiple of length ticks before.
+  def __init__(self, machine, state, length):
+    self.machine = copy.copy(machine)
+    self.machine.mem = bytearray(machine.mem)
+    self.machine.output = bytearray()
+    self.state = state
+    self.length = length
+    self.limit = min(length, CYCLE_TICK_LIMIT)
+    self.at = machine.ticks
+    self.cells = []
+    self._seen = set()
+
+  ###############
+  # step
+  #   Steps up to maxticks more ticks. Returns the
+  #   FlowCycle once the state comes round again
+  #   or the tick limit is reached, else None.
+  def step(self, maxticks):
+    machine = self.machine
+    index, direction = self.state[0], self.state[1]
+    seen = self._seen
+    cells = self.cells
+    for tick in range(min(maxticks, self.limit - (machine.ticks - self.at))):
+      machine.run(1)
+      if machine.index not in seen:
+        seen.add(machine.index)
+        cells.append(machine.position())
+      if (machine.index == index and machine.direction == direction and
+          machineState(machine) == self.state):
+        return FlowCycle(machine.ticks - self.at, cells, self.at, True)
+    if machine.ticks - self.at >= self.limit:
+      return FlowCycle(self.length, cells, self.at, False)
+    return None
+
+
+######################
+# HangWatch
+#   Runs a machine through a BlockCache in strides
+#   of HANG_STRIDE ticks, comparing its state after
+#   each with a saved one, as in Brent's cycle
+#   detection: the saved state moves to the current
+#   one after 1, 2, 4, 8... strides, so a loop is
+#   found within a few times its length (in whole
+#   strides) of starting. Only one state is kept,
+#   and whole states are compared, so there are no
+#   false alarms. Once a state repeats, a
+#   CycleSearch lists the loop's cells.
+######################
+class HangWatch:
+
+  ##############
+  # init
+  #   Starts watching a machine from its
+  #   current state.
+  def __init__(self, machine, stride = HANG_STRIDE):
+    self.machine = machine
+    self.stride = stride
+    self.cycle = None # FlowCycle once one is found
+    self.search = None # CycleSearch once a state repeats
+    self._saved = machineState(machine)
+    self._power = 1 # strides before the saved state moves on
+    self._length = 0 # strides since it last moved
+    self._next = machine.ticks + stride # ticks at the next check
+
+  ###############
+  # run
+  #   Runs up to maxticks ticks with blocks, stopping
+  #   early if the program ends or is found to loop.
+  #   Returns True if it loops; cycle is then set
+  #   by finishCycle or listCycle.
+  def run(self, blocks, maxticks):
+    machine = self.machine
+    end = machine.ticks + maxticks
+    while self.search is None and not machine.done() and machine.ticks < end:
+      blocks.run(machine, min(end, self._next) - machine.ticks)
+      if machine.ticks == self._next and not machine.done():
+        self._next += self.stride
+        self.check()
+    return self.search is not None
+
+  ###############
+  # listCycle
+  #   Steps the search for the loop's cells by up to
+  #   maxticks ticks. Returns the FlowCycle once
+  #   found, else None.
+  def listCycle(self, maxticks):
+    if self.cycle is None:
+      self.cycle = self.search.step(maxticks)
+    return self.cycle
+
+  ###############
+  # finishCycle
+  #   Lists the loop's cells in one go. Returns
+  #   the FlowCycle.
+  def finishCycle(self):
+    return self.listCycle(CYCLE_TICK_LIMIT)
+
+  ###############
+  # check
+  #   Compares the machine's state to the saved
+  #   one, after a whole stride.
+  def check(self):
+    state = machineState(self.machine)
+    self._length += 1
+    if state == self._saved:
+      self.search = CycleSearch(self.machine, state, self._length * self.stride)
+    elif self._length == self._power:
+      self._saved = state
+      self._power *= 2
+      self._length = 0
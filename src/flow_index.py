@@ -0,0 +1,157 @@
+#########################
+# flow_index.py
+# --------------
+# Index from triplets to the cells holding
+# them, for finding operators and operands
+# without scanning the grid.
+#########################
+
+from bisect import bisect_left, bisect_right, insort
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+KEY_OFFSET = 1 << 31 # keeps negative coords positive in a key
+
+"████████████████████████████████   Indexes   █████████████████████████████████"
+
+
+###############
+# coordKey
+#   Packs a coord into an int that sorts in
+#   reading order (by row, then column).
+def coordKey(coord):
+  return (coord[1] + KEY_OFFSET) << 32 | (coord[0] + KEY_OFFSET)
+
+###############
+# keyCoord
+#   Unpacks a coordKey int into its coord.
+def keyCoord(key):
+  return ((key & 0xFFFFFFFF) - KEY_OFFSET, (key >> 32) - KEY_OFFSET)
+
+
+######################
+# TripletIndex
+#   Maps each distinct triplet in a grid to the
+#   coordKeys of the cells holding it. A program
+#   has few distinct triplets, so a search only
+#   tests those, not every cell.
+######################
+class TripletIndex:
+
+  ##############
+  # init
+  #   Indexes every cell of a grid.
+  def __init__(self, grid):
+    self._keys = {} # triplet: set of coordKeys
+    for coord, triplet in grid.items():
+      keys = self._keys.get(triplet)
+      if keys is None:
+        self._keys[triplet] = {coordKey(coord)}
+      else:
+        keys.add(coordKey(coord))
+
+  ###############
+  # update
+  #   Moves edited cells between triplets, given
+  #   (coord, old, new) deltas.
+  def update(self, deltas):
+    for coord, old, new in deltas:
+      key = coordKey(coord)
+      if old is not None:
+        keys = self._keys[old]
+        keys.discard(key)
+        if not keys:
+          del self._keys[old]
+      if new is not None:
+        self._keys.setdefault(new, set()).add(key)
+
+  ###############
+  # triplets
+  #   Returns the distinct triplets containing text.
+  def triplets(self, text):
+    return [triplet for triplet in self._keys if text in triplet]
+
+  ###############
+  # keys
+  #   Returns the coordKeys of all cells
+  #   containing text, unordered.
+  def keys(self, text):
+    keys = []
+    for triplet in self.triplets(text):
+      keys.extend(self._keys[triplet])
+    return keys
+
+  ###############
+  # find
+  #   Returns the coords of all cells containing
+  #   text, unordered.
+  def find(self, text):
+    return [keyCoord(key) for key in self.keys(text)]
+
+
+######################
+# Search
+#   The matches of one search, kept in reading
+#   order (by row, then column) and updated as
+#   cells change, for next/previous navigation.
+######################
+class Search:
+
+  ##############
+  # init
+  #   Collects the matches of text in an index.
+  def __init__(self, index, text):
+    self.text = text
+    self._keys = sorted(index.keys(text))
+
+  def __len__(self):
+    return len(self._keys)
+
+  ###############
+  # update
+  #   Adds and removes matches, given the
+  #   (coord, old, new) deltas of edited cells.
+  def update(self, deltas):
+    for coord, old, new in deltas:
+      was = old is not None and self.text in old
+      now = new is not None and self.text in new
+      if was and not now:
+        key = coordKey(coord)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+          del self._keys[i]
+      elif now and not was:
+        insort(self._keys, coordKey(coord))
+
+  ###############
+  # next
+  #   Returns the first match after coord in
+  #   reading order, wrapping around, or None
+  #   if there are no matches.
+  def next(self, coord):
+    if not self._keys:
+      return None
+    i = bisect_right(self._keys, coordKey(coord))
+    return keyCoord(self._keys[i % len(self._keys)])
+
+  ###############
+  # previous
+  #   Returns the last match before coord in
+  #   reading order, wrapping around, or None
+  #   if there are no matches.
+  def previous(self, coord):
+    if not self._keys:
+      return None
+    i = bisect_left(self._keys, coordKey(coord))
+    return keyCoord(self._keys[i - 1])
+
+  ###############
+  # number
+  #   Returns the 1-based number of the match
+  #   at coord, or 0 if coord is not a match.
+  def number(self, coord):
+    key = coordKey(coord)
+    i = bisect_left(self._keys, key)
+    if i < len(self._keys) and self._keys[i] == key:
+      return i + 1
+    return 0
@@ -0,0 +1,170 @@
+#########################
+# flow_instrument.py
+# --------------
+# Times the editor's event handlers and
+# render paths and counts the Tk calls they
+# make, for finding where keystroke latency
+# goes. Only wraps anything when enabled.
+#########################
+
+from collections import deque
+import json
+import time
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+INSTRUMENT_ENV = "FLOW_INSTRUMENT" # names the file to dump to; enables instrumenting
+RING_SIZE = 4096 # most recent calls kept
+HISTOGRAM_BUCKETS = 24 # latency buckets, doubling from 1 microsecond
+
+"███████████████████████████████   Instrument   ███████████████████████████████"
+
+
+######################
+# HandlerStats
+#   Calls, total and worst seconds, and Tk calls
+#   of one handler, with a latency histogram: bucket
+#   i counts calls of under 2**i microseconds (the
+#   last also counts anything longer).
+######################
+class HandlerStats:
+
+  def __init__(self):
+    self.calls = 0
+    self.seconds = 0.0
+    self.worst = 0.0
+    self.tkcalls = 0
+    self.buckets = [0] * HISTOGRAM_BUCKETS
+
+  ###############
+  # add
+  #   Counts one call.
+  def add(self, seconds, tkcalls):
+    self.calls += 1
+    self.seconds += seconds
+    self.worst = max(self.worst, seconds)
+    self.tkcalls += tkcalls
+    bucket = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+    self.buckets[bucket] += 1
+
+  ###############
+  # percentile
+  #   Returns the upper bound in seconds of the
+  #   bucket holding fraction of the calls, or the
+  #   worst call if that is lower.
+  def percentile(self, fraction):
+    need = fraction * self.calls
+    total = 0
+    for bucket, count in enumerate(self.buckets):
+      total += count
+      if total >= need:
+        return min((1 << bucket) / 1e6, self.worst)
+    return self.worst
+
+
+######################
+# CountingTk
+#   Stands in for a widget's Tk interpreter,
+#   counting every call made through it.
+######################
+class CountingTk:
+
+  def __init__(self, tk, instrument):
+    self._tk = tk
+    self._instrument = instrument
+
+  def call(self, *args):
+    self._instrument.tkcalls += 1
+    return self._tk.call(*args)
+
+  def __getattr__(self, name):
+    return getattr(self._tk, name)
+
+
+######################
+# Instrument
+#   Per-handler stats and a ring of the most recent
+#   calls, as (start, name, seconds, Tk calls) with
+#   start in seconds since the instrument was made.
+#   Handlers are wrapped where they are looked up,
+#   so it must be applied before they are bound.
+######################
+class Instrument:
+
+  ##############
+  # init
+  #   Starts with no calls recorded; dumps
+  #   go to filename.
+  def __init__(self, filename, ringsize = RING_SIZE):
+    self.filename = filename
+    self.start = time.perf_counter()
+    self.stats = {} # handler name: HandlerStats
+    self.ring = deque(maxlen = ringsize)
+    self.tkcalls = 0 # Tk calls made so far
+
+  ###############
+  # wrap
+  #   Returns function timed and counted
+  #   under name.
+  def wrap(self, name, function):
+    stats = self.stats.setdefault(name, HandlerStats())
+    def timed(*args, **kwargs):
+      tkcalls = self.tkcalls
+      start = time.perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        seconds = time.perf_counter() - start
+        stats.add(seconds, self.tkcalls - tkcalls)
+        self.ring.append((start - self.start, name, seconds, self.tkcalls - tkcalls))
+    timed.__name__ = function.__name__
+    return timed
+
+  ###############
+  # wrapMethods
+  #   Replaces the named methods of obj
+  #   with timed ones.
+  def wrapMethods(self, obj, names):
+    for name in names:
+      setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+  ###############
+  # countCalls
+  #   Counts the Tk calls of widget and every
+  #   widget under it (and any made under them
+  #   later, which share their interpreter).
+  def countCalls(self, widget):
+    if not isinstance(widget.tk, CountingTk):
+      widget.tk = CountingTk(widget.tk, self)
+    for child in widget.winfo_children():
+      self.countCalls(child)
+
+  ###############
+  # report
+  #   Returns a line per handler, slowest
+  #   worst case first.
+  def report(self):
+    lines = ["{:<16}{:>7}{:>9}{:>9}{:>9}{:>8}".format(
+      "handler", "calls", "mean ms", "p99 ms", "max ms", "tk/call")]
+    for name, stats in sorted(self.stats.items(), key = lambda item: -item[1].worst):
+      if stats.calls:
+        lines.append("{:<16}{:>7}{:>9.2f}{:>9.2f}{:>9.2f}{:>8.1f}".format(
+          name[:15], stats.calls, 1000 * stats.seconds / stats.calls,
+          1000 * stats.percentile(0.99), 1000 * stats.worst,
+          stats.tkcalls / stats.calls))
+    return lines
+
+  ###############
+  # dump
+  #   Writes every handler's stats and the
+  #   ring of recent calls as JSON.
+  def dump(self):
+    handlers = {name: {"calls": stats.calls, "seconds": stats.seconds,
+                       "worst": stats.worst, "tkcalls": stats.tkcalls,
+                       "histogram_us": {str(1 << bucket): count
+                                        for bucket, count in enumerate(stats.buckets)
+                                        if count}}
+                for name, stats in self.stats.items() if stats.calls}
+    with open(self.filename, 'w') as outfile:
+      json.dump({"handlers": handlers, "tkcalls": self.tkcalls,
+                 "recent": list(self.ring)}, outfile, indent = 1)
@@ -0,0 +1,160 @@
+#########################
+# flow_journal.py
+# --------------
+# Undo/redo journal of grid edits, storing
+# only the cells each edit changed.
+#########################
+
+from flow_common import OP_LENGTH
+from flow_grid import EMPTY_CELL
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+UNDO_LIMIT = 1000 # actions kept in the journal
+
+"████████████████████████████████   Journal   █████████████████████████████████"
+
+
+######################
+# CellAction
+#   An edit of scattered cells, kept as
+#   coord: (old, new), None meaning empty.
+######################
+class CellAction:
+
+  def __init__(self, typing):
+    self.typing = typing # keystrokes can be merged into it
+    self.cells = {}
+
+  ###############
+  # add
+  #   Merges (coord, old, new) deltas, keeping the
+  #   oldest old value of each cell.
+  def add(self, deltas):
+    for coord, old, new in deltas:
+      if coord in self.cells:
+        old = self.cells[coord][0]
+      self.cells[coord] = (old, new)
+
+  ###############
+  # apply
+  #   Undoes (or redoes) this action on a grid.
+  #   Returns the (coord, old, new) deltas.
+  def apply(self, grid, undo):
+    side = 0 if undo else 1
+    return grid.apply([(coord, values[side])
+                       for coord, values in self.cells.items()])
+
+
+######################
+# RectAction
+#   An edit of a rectangle, kept as one string per
+#   row for the old and new contents, with EMPTY_CELL
+#   for empty cells. new is None if it cleared the
+#   whole rectangle.
+######################
+class RectAction:
+
+  def __init__(self, topleft, width, old, new):
+    self.typing = False
+    self.topleft = topleft
+    self.width = width
+    self.old = old
+    self.new = new
+
+  ###############
+  # apply
+  #   Undoes (or redoes) this action on a grid,
+  #   writing back whole rows. Returns the
+  #   (coord, old, new) deltas.
+  def apply(self, grid, undo):
+    if undo:
+      return grid.setRect(self.topleft, self.old)
+    elif self.new is None:
+      return grid.clearRect(self.topleft,
+                            (self.topleft[0] + self.width - 1,
+                             self.topleft[1] + len(self.old) - 1))
+    return grid.setRect(self.topleft, self.new)
+
+
+###############
+# rowCell
+#   Returns cell x of a rect row, or None if empty.
+def rowCell(row, x):
+  cell = row[x * OP_LENGTH:(x + 1) * OP_LENGTH]
+  return None if cell == EMPTY_CELL else cell
+
+
+######################
+# EditJournal
+#   Undo and redo stacks of edit actions.
+######################
+class EditJournal:
+
+  def __init__(self):
+    self._undo = []
+    self._redo = []
+
+  ###############
+  # recordCells
+  #   Records (coord, old, new) deltas as an action.
+  #   Consecutive typing is merged into one action.
+  def recordCells(self, deltas, typing = False):
+    if not deltas:
+      return
+    if typing and self._undo and self._undo[-1].typing and not self._redo:
+      self._undo[-1].add(deltas)
+      return
+    action = CellAction(typing)
+    action.add(deltas)
+    self.push(action)
+
+  ###############
+  # recordRect
+  #   Records an edit of the rectangle at topleft,
+  #   given its old and new rows (new None if the
+  #   rectangle was cleared).
+  def recordRect(self, topleft, width, old, new):
+    self.push(RectAction(topleft, width, old, new))
+
+  ###############
+  # push
+  #   Adds an action, dropping the redo stack
+  #   and the oldest actions over the limit.
+  def push(self, action):
+    self._undo.append(action)
+    self._redo = []
+    if len(self._undo) > UNDO_LIMIT:
+      del self._undo[0]
+
+  ###############
+  # seal
+  #   Stops further typing merging into the last action.
+  def seal(self):
+    if self._undo:
+      self._undo[-1].typing = False
+
+  ###############
+  # undo
+  #   Undoes the last action on a grid. Returns the
+  #   (coord, old, new) deltas, or None if there is
+  #   nothing to undo.
+  def undo(self, grid):
+    if not self._undo:
+      return None
+    action = self._undo.pop()
+    action.typing = False
+    self._redo.append(action)
+    return action.apply(grid, True)
+
+  ###############
+  # redo
+  #   Redoes the last undone action on a grid.
+  #   Returns the (coord, old, new) deltas, or None
+  #   if there is nothing to redo.
+  def redo(self, grid):
+    if not self._redo:
+      return None
+    action = self._redo.pop()
+    self._undo.append(action)
+    return action.apply(grid, False)
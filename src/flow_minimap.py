@@ -0,0 +1,234 @@
+#########################
+# flow_minimap.py
+# --------------
+# Overview of a whole Flow program as a
+# bitmap, one pixel per cell (or per square
+# of cells, for programs too big to fit),
+# colored by what kind of command is there.
+#########################
+
+from flow_common import *
+from flow_grid import TILE_SIZE
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+MINIMAP_SIZE = 160 # pixels per side of the minimap
+MINIMAP_BG_COLOR = "#EEEEFF" # pixels with no cells
+
+# kinds of command, most visible first: a pixel
+# covering several cells shows the first kind
+# among them. Bytes in no kind are bad commands.
+CELL_KINDS = (
+  ("start",      CMD_START,                                   "#000000"),
+  ("bad",        "",                                          "#FF0000"),
+  ("compare",    CMD_COMP,                                    "#FF8800"),
+  ("io",         CMD_OUT + CMD_IN,                            "#CC00CC"),
+  ("direction",  CMD_UP + CMD_DOWN + CMD_LEFT + CMD_RIGHT,    "#2244DD"),
+  ("arithmetic", CMD_ADD + CMD_SUB + CMD_MUL + CMD_DIV + CMD_MOD,
+                                                              "#00AA44"),
+  ("variable",   CMD_LOAD + CMD_NEXT + CMD_PREV + CMD_CACHE + CMD_SET + CMD_COPY,
+                                                              "#888800"),
+  ("nothing",    CMD_IGNORE,                                  "#BBBBDD"),
+)
+BAD_KIND = 1 # index in CELL_KINDS
+
+###############
+# kindTables
+#   Builds the lookup tables a minimap is drawn
+#   with: a bytes.translate table from a command
+#   byte to its kind's bit (1 << index in
+#   CELL_KINDS), and a str.translate table from an
+#   OR of kind bits to the Tk color of the most
+#   visible kind, then a space.
+def kindTables():
+  bits = bytearray(256)
+  for i, (name, commands, color) in enumerate(CELL_KINDS):
+    for command in commands:
+      bits[ord(command)] = 1 << i
+  for byte in range(1, 256):
+    if not bits[byte]:
+      bits[byte] = 1 << BAD_KIND
+  colors = [MINIMAP_BG_COLOR + " "]
+  for mask in range(1, 256):
+    colors.append(CELL_KINDS[(mask & -mask).bit_length() - 1][2] + " ")
+  return bytes(bits), colors
+
+KIND_BITS, KIND_COLORS = kindTables()
+
+"████████████████████████████████   Minimap   █████████████████████████████████"
+
+
+###############
+# orBytes
+#   ORs equal-length byte strings together, byte
+#   by byte, as big ints rather than per byte.
+def orBytes(chunks):
+  total = 0
+  for chunk in chunks:
+    total |= int.from_bytes(chunk, "big")
+  return total.to_bytes(len(chunks[0]), "big")
+
+###############
+# foldBytes
+#   Returns the OR of every byte of data, whose
+#   length must be a power of 2, as an int.
+def foldBytes(data):
+  total = int.from_bytes(data, "big")
+  bits = len(data) * 8
+  while bits > 8:
+    bits //= 2
+    total = (total >> bits) | (total & ((1 << bits) - 1))
+  return total
+
+
+######################
+# Minimap
+#   The pixels of a grid's overview, one per
+#   scale x scale square of cells, drawn a unit
+#   at a time: a tile, or a square of tiles once
+#   a pixel covers more than a tile. Edits mark
+#   their units dirty, and updates returns the
+#   PhotoImage.put calls that redraw just those.
+######################
+class Minimap:
+
+  ##############
+  # init
+  #   Starts a minimap of a grid that will be
+  #   drawn in full on the first update.
+  def __init__(self, grid, size = MINIMAP_SIZE):
+    self.size = size
+    self.reset(grid)
+
+  ###############
+  # reset
+  #   Switches to a grid, redrawing it in full
+  #   on the next update.
+  def reset(self, grid):
+    self._grid = grid
+    self.scale = 1 # cells per pixel side, a power of 2
+    self.origin = (0, 0) # cell at pixel (0, 0)
+    self._full = True
+    self._dirty = set() # unit keys to redraw
+
+  ###############
+  # invalidate
+  #   Marks the units holding edited cells, given
+  #   (coord, old, new) deltas.
+  def invalidate(self, deltas):
+    unit = max(self.scale, TILE_SIZE)
+    for coord, old, new in deltas:
+      self._dirty.add((coord[0] // unit, coord[1] // unit))
+
+  ###############
+  # layout
+  #   Returns the (scale, origin) the grid fits the
+  #   minimap with: the smallest scale, and an origin
+  #   on a unit corner so units map to whole pixels.
+  def layout(self):
+    bounds = self._grid.bounds()
+    if bounds is None:
+      return (1, (0, 0))
+    left, top, right, bottom = bounds
+    scale = 1
+    while True:
+      unit = max(scale, TILE_SIZE)
+      origin = (left - left % unit, top - top % unit)
+      if ((right - origin[0]) // scale < self.size and
+          (bottom - origin[1]) // scale < self.size):
+        return (scale, origin)
+      scale *= 2
+
+  ###############
+  # pixel
+  #   Returns the pixel showing a coord.
+  def pixel(self, coord):
+    return ((coord[0] - self.origin[0]) // self.scale,
+            (coord[1] - self.origin[1]) // self.scale)
+
+  ###############
+  # coord
+  #   Returns the top left coord a pixel shows.
+  def coord(self, x, y):
+    return (self.origin[0] + x * self.scale, self.origin[1] + y * self.scale)
+
+  ###############
+  # updates
+  #   Brings the minimap up to date with the grid.
+  #   Returns (data, to) pairs to pass to put on a
+  #   size x size PhotoImage, and whether the layout
+  #   changed (so the whole image is redrawn).
+  def updates(self):
+    layout = self.layout()
+    full = self._full or layout != (self.scale, self.origin)
+    puts = []
+    if full:
+      self.scale, self.origin = layout
+      self._full = False
+      puts.append(("{" + MINIMAP_BG_COLOR + "}",
+                   (0, 0, self.size, self.size)))
+      unit = max(self.scale, TILE_SIZE) // TILE_SIZE
+      units = {(tx // unit, ty // unit) for tx, ty in self._grid.tileKeys()}
+    else:
+      units = self._dirty
+    self._dirty = set()
+    for key in sorted(units):
+      puts.append(self.unitPut(key, full))
+    return [put for put in puts if put is not None], full
+
+  ###############
+  # unitPut
+  #   Returns the (data, to) put that draws a unit,
+  #   or None for an empty unit when the whole
+  #   image was just cleared.
+  def unitPut(self, key, cleared):
+    unit = max(self.scale, TILE_SIZE)
+    x, y = self.pixel((key[0] * unit, key[1] * unit))
+    side = unit // self.scale
+    if not (0 <= x < self.size and 0 <= y < self.size):
+      return None # edited outside the layout; redrawn once re-laid out
+    rows = self.unitRows(key)
+    if rows is None:
+      if cleared:
+        return None
+      return ("{" + MINIMAP_BG_COLOR + "}", (x, y, x + side, y + side))
+    return (" ".join("{" + row.decode("latin-1").translate(KIND_COLORS) + "}"
+                     for row in rows), (x, y))
+
+  ###############
+  # unitRows
+  #   Returns a unit's pixels as rows of kind-bit
+  #   bytes, or None if it has no cells.
+  def unitRows(self, key):
+    scale = self.scale
+    if scale <= TILE_SIZE:
+      commands = self._grid.tileCommands(key)
+      if commands is None:
+        return None
+      bits = commands.translate(KIND_BITS)
+      if scale == 1:
+        return [bits[r:r + TILE_SIZE]
+                for r in range(0, len(bits), TILE_SIZE)]
+      rows = []
+      band = TILE_SIZE * scale # bytes in a row of pixels
+      for r in range(0, len(bits), band):
+        merged = orBytes([bits[i:i + TILE_SIZE]
+                          for i in range(r, r + band, TILE_SIZE)])
+        rows.append(orBytes([merged[i::scale] for i in range(scale)]))
+      return rows
+
+    # one pixel for a square of tiles
+    step = scale // TILE_SIZE
+    tiles = self._grid.tileKeys()
+    if step * step < len(tiles):
+      tiles = [(key[0] * step + i, key[1] * step + j)
+               for i in range(step) for j in range(step)]
+    mask = 0
+    for tx, ty in tiles:
+      if tx // step == key[0] and ty // step == key[1]:
+        commands = self._grid.tileCommands((tx, ty))
+        if commands is not None:
+          mask |= foldBytes(commands.translate(KIND_BITS))
+    if not mask:
+      return None
+    return [bytes((mask,))]
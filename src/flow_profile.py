@@ -0,0 +1,161 @@
+#########################
+# flow_profile.py
+# --------------
+# Per-cell execution counts of a Flow run,
+# and which way each compare sent flow,
+# for finding a program's hot loops.
+#########################
+
+from array import array
+import csv
+import json
+import math
+
+from flow_common import *
+from flow_engine import *
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+HEAT_LEVELS = 8 # shades of a heatmap, not counting cold cells
+PROFILE_COLUMNS = ("x", "y", "triplet", "hits", "ccw", "straight", "cw")
+
+"████████████████████████████████   Profile   █████████████████████████████████"
+
+
+######################
+# FlowProfile
+#   Hit counts of a run, one per program index in
+#   a flat array, plus ccw/cw turn counts of each
+#   compare (straight is hits minus turns). While
+#   running, BlockCache.runProfiled only counts
+#   block passes and exits; finish expands those
+#   into the per-cell counts.
+######################
+class FlowProfile:
+
+  ##############
+  # init
+  #   Starts an empty profile of a program.
+  def __init__(self, program):
+    self.program = program
+    self.hits = array('Q', bytes(8 * len(program.ops)))
+    self.turns = {} # compare index: [ccw, cw]
+    self.ticks = 0
+    self.passes = {} # block key: whole loop passes
+    self.exits = {} # (block key, cells run, next key): count
+
+  ###############
+  # tick
+  #   Runs one tick of a machine, counting it.
+  def tick(self, machine):
+    d = machine.direction
+    ticks = machine.ticks
+    machine.run(1)
+    if machine.ticks > ticks:
+      self.hits[machine.index] += 1
+      self.countTurn(machine.index, d, machine.direction, 1)
+
+  ###############
+  # countTurn
+  #   Counts a compare at index turning flow
+  #   from direction d to e, count times.
+  def countTurn(self, index, d, e, count):
+    if d == e or self.program.ops[index] not in (OP_COMP_IMM, OP_COMP_VAR):
+      return
+    turns = self.turns.setdefault(index, [0, 0])
+    turns[0 if e == ROTATE_CCW[d] else 1] += count
+
+  ###############
+  # finish
+  #   Expands the block counts runProfiled made
+  #   with a BlockCache into per-cell counts, once
+  #   machine has stopped.
+  def finish(self, blocks, machine):
+    hits = self.hits
+    steps = self.program.steps
+    for key, count in self.passes.items():
+      for cell in blocks.blockCells(key):
+        hits[cell] += count
+    for (key, n, nextkey), count in self.exits.items():
+      cells = blocks.blockCells(key)[:n]
+      for cell in cells:
+        hits[cell] += count
+      last = cells[-1]
+      previous = cells[-2] if n > 1 else key >> 2
+      self.countTurn(last, steps.index(last - previous), nextkey & 3, count)
+    self.passes = {}
+    self.exits = {}
+    self.ticks = machine.ticks
+
+  ###############
+  # counts
+  #   Returns (hits, ccw, straight, cw) of a coord;
+  #   the turns are None if it is not a compare.
+  def counts(self, coord):
+    program = self.program
+    if not program.contains(coord):
+      return (0, None, None, None)
+    index = program.index(coord)
+    hits = self.hits[index]
+    if program.ops[index] not in (OP_COMP_IMM, OP_COMP_VAR):
+      return (hits, None, None, None)
+    ccw, cw = self.turns.get(index, (0, 0))
+    return (hits, ccw, hits - ccw - cw, cw)
+
+  ###############
+  # hottest
+  #   Returns (hits, coord) of the most run
+  #   cell, or None if nothing ran.
+  def hottest(self):
+    top = max(self.hits)
+    if not top:
+      return None
+    return (top, self.program.coord(self.hits.index(top)))
+
+  ###############
+  # heat
+  #   Returns how hot a coord ran, from 0 (never)
+  #   to HEAT_LEVELS, on a log scale up to the
+  #   hottest cell.
+  def heat(self, coord, top):
+    hits = self.counts(coord)[0]
+    if not hits:
+      return 0
+    if top <= 1:
+      return HEAT_LEVELS
+    return 1 + int((HEAT_LEVELS - 1) * math.log(hits) / math.log(top))
+
+  ###############
+  # rows
+  #   Returns a row of PROFILE_COLUMNS for every
+  #   cell of grid that ran, in reading order.
+  def rows(self, grid):
+    rows = []
+    for coord, triplet in grid.items():
+      hits, ccw, straight, cw = self.counts(coord)
+      if hits:
+        rows.append((coord[0], coord[1], triplet, hits, ccw, straight, cw))
+    return rows
+
+  ###############
+  # writeCSV
+  #   Writes the profile of grid's cells as CSV,
+  #   leaving the turns of non-compares blank.
+  def writeCSV(self, grid, outfile):
+    writer = csv.writer(outfile)
+    writer.writerow(PROFILE_COLUMNS)
+    for row in self.rows(grid):
+      writer.writerow(["" if value is None else value for value in row])
+
+  ###############
+  # writeJSON
+  #   Writes the profile of grid's cells as JSON.
+  def writeJSON(self, grid, outfile):
+    cells = []
+    for row in self.rows(grid):
+      cell = dict(zip(PROFILE_COLUMNS[:4], row[:4]))
+      if row[4] is not None:
+        cell["branches"] = dict(zip(PROFILE_COLUMNS[4:], row[4:]))
+      cells.append(cell)
+    json.dump({"ticks": self.ticks, "cells": cells}, outfile, indent = 1)
+    outfile.write("\n")
@@ -0,0 +1,156 @@
+#########################
+# flow_save.py
+# --------------
+# Saving Flow files off the Tk thread, and
+# the autosave log of rows changed since
+# the last save.
+#########################
+
+import json
+import os
+import threading
+
+from flow_common import *
+from flow_grid import EMPTY_CELL, PROGRESS_ROWS
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+AUTOSAVE_SUFFIX = ".autosave" # autosave log name, after the file's
+
+"███████████████████████████████   Background   ███████████████████████████████"
+
+
+######################
+# BackgroundSave
+#   Runs write(*args, progress) on a worker thread,
+#   where write is saveFile or appendRows. The Tk
+#   thread polls progress and done; once done, saved
+#   tells whether write returned, error holds the
+#   ErrCode it returned, and failure the exception
+#   that stopped it, if any.
+######################
+class BackgroundSave:
+
+  ##############
+  # init
+  #   Starts writing. Anything in args must not
+  #   change until done (pass a copy of the grid).
+  def __init__(self, write, *args):
+    self.progress = 0.0 # fraction of rows written
+    self.done = False
+    self.saved = False
+    self.error = NO_ERROR
+    self.failure = None
+    self._thread = threading.Thread(target = self.run, args = (write, args),
+                                    daemon = True)
+    self._thread.start()
+
+  ###############
+  # run
+  #   Writes the file. Runs on the worker thread.
+  def run(self, write, args):
+    try:
+      self.error = write(*args, self.report)
+      self.saved = True
+    except Exception as failure:
+      self.failure = failure
+    finally:
+      self.progress = 1.0
+      self.done = True
+
+  ###############
+  # report
+  #   writeGrid's progress callback.
+  def report(self, rows, total):
+    self.progress = rows / total
+
+  ###############
+  # wait
+  #   Blocks until the save has finished.
+  def wait(self):
+    self._thread.join()
+
+
+"████████████████████████████████   Autosave   ████████████████████████████████"
+
+
+###############
+# autosaveName
+#   Returns the autosave log's name for a file.
+def autosaveName(filename):
+  return filename + AUTOSAVE_SUFFIX
+
+###############
+# appendRows
+#   Appends rows to a file's autosave log, one JSON
+#   line [y, left, text] per row, where text is the
+#   row from column left as FlowGrid.rowText gives
+#   it with EMPTY_CELL fill ("" for an empty row).
+#   Each line replaces all of row y. Returns
+#   NO_ERROR, like saveFile.
+def appendRows(filename, rows, progress = None):
+  with open(autosaveName(filename), 'a') as log:
+    for i, (y, left, text) in enumerate(rows):
+      if progress is not None and i % PROGRESS_ROWS == 0:
+        progress(i, len(rows))
+      log.write(json.dumps([y, left, text]) + "\n")
+    log.flush()
+    os.fsync(log.fileno())
+  return NO_ERROR
+
+###############
+# rowRecord
+#   Returns row y of a grid as an autosave
+#   log entry (y, left, text).
+def rowRecord(grid, y):
+  coords = grid.row(y)
+  if not coords:
+    return (y, 0, "")
+  left = coords[0][0]
+  return (y, left, grid.rowText(y, left, coords[-1][0] - left + 1, EMPTY_CELL))
+
+###############
+# replayRows
+#   Applies a file's autosave log to a grid loaded
+#   from that file. Returns the number of rows
+#   replayed, or None if there is no usable log.
+#   A torn last line, from a crash mid-write, is
+#   ignored.
+def replayRows(grid, filename):
+  try:
+    with open(autosaveName(filename), 'r') as log:
+      lines = log.readlines()
+  except (OSError, UnicodeDecodeError):
+    return None
+  count = 0
+  for line in lines:
+    try:
+      y, left, text = json.loads(line)
+    except ValueError:
+      break
+    row = grid.row(y)
+    if row:
+      grid.clearRect(row[0], row[-1])
+    grid.setRect((left, y), [text])
+    count += 1
+  return count
+
+###############
+# hasAutosave
+#   True if a file has an autosave log newer
+#   than itself.
+def hasAutosave(filename):
+  try:
+    return (os.path.getmtime(autosaveName(filename)) >=
+            os.path.getmtime(filename))
+  except OSError:
+    return False
+
+###############
+# removeAutosave
+#   Deletes a file's autosave log, if any.
+def removeAutosave(filename):
+  try:
+    os.remove(autosaveName(filename))
+  except FileNotFoundError:
+    pass
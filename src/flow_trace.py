@@ -0,0 +1,93 @@
+#########################
+# flow_trace.py
+# --------------
+# Runs a Flow program in time slices, so
+# the editor can show where it is between
+# slices without slowing it to the screen's
+# frame rate.
+#########################
+
+import time
+
+from flow_engine import FlowMachine
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+TRACE_BATCH = 1024 # ticks in the first batch of a slice
+MAX_TRACE_BATCH = 1 << 24 # most ticks run between clock checks
+
+"████████████████████████████████   Tracing   █████████████████████████████████"
+
+
+######################
+# FlowTrace
+#   A machine run through a BlockCache in batches
+#   of ticks, checking the clock between batches.
+#   Batch size adapts so a slice overshoots its
+#   time by at most about one batch.
+######################
+class FlowTrace:
+
+  ##############
+  # init
+  #   Prepares to run a cache's program from its
+  #   start command, reading input from data.
+  def __init__(self, blocks, data = b""):
+    self.blocks = blocks
+    self.machine = FlowMachine(blocks.program, data)
+    self.batch = TRACE_BATCH
+
+  ###############
+  # done
+  #   True once the program has finished
+  #   or stopped on an error.
+  def done(self):
+    return self.machine.done()
+
+  ###############
+  # runFor
+  #   Runs for about seconds, or until the program
+  #   ends. Returns the ticks run.
+  def runFor(self, seconds):
+    return self.slice(seconds, lambda batch:
+                      self.blocks.run(self.machine, batch))
+
+  ###############
+  # runTo
+  #   Runs for about seconds, until flow moves onto
+  #   cell index, or until the program ends. Returns
+  #   True if it stopped at index.
+  def runTo(self, index, seconds):
+    ticks = self.machine.ticks
+    self.slice(seconds, lambda batch:
+               self.blocks.runTo(self.machine, index, batch))
+    return self.machine.index == index and self.machine.ticks > ticks
+
+  ###############
+  # step
+  #   Runs one tick.
+  def step(self):
+    self.machine.run(1)
+
+  ###############
+  # slice
+  #   Calls run(batch) until seconds have passed,
+  #   the program ends, or run returns true.
+  #   Doubles the batch while batches are quick
+  #   and halves it when one runs long. Returns
+  #   the ticks run.
+  def slice(self, seconds, run):
+    machine = self.machine
+    start = machine.ticks
+    now = time.perf_counter()
+    deadline = now + seconds
+    while not machine.done() and now < deadline:
+      before = now
+      if run(self.batch):
+        break
+      now = time.perf_counter()
+      if now - before < seconds / 8:
+        self.batch = min(self.batch * 2, MAX_TRACE_BATCH)
+      elif now - before > seconds / 2:
+        self.batch = max(self.batch // 2, 1)
+    return machine.ticks - start
@@ -0,0 +1,430 @@
+#########################
+# flow_transpile.py
+# --------------
+# Translates a Flow program into a standalone
+# C program and compiles it with the local cc.
+# Every reachable (cell, direction) state is a
+# label and flow between them is direct gotos,
+# so the binary prints exactly what the
+# interpreter would, without its tick() loop.
+#
+# usage: python flow_transpile.py prog.fl [-o out] [-S]
+#          [--cc CC] [--cflags FLAGS]
+#
+# Writes the executable out (default: prog.fl
+# without its extension), or with -S just the
+# C source (default: prog.c).
+#########################
+
+import argparse
+from collections import deque
+import io
+import locale
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+from flow_common import *
+from flow_engine import *
+from flow_grid import writeGrid
+
+"███████████████████████████████   Constants   ████████████████████████████████"
+
+C_COMPILER = os.environ.get("CC", "cc")
+C_FLAGS = "-O2"
+EOF_BYTE = 0xFF # read as EOF by load_file's char temp = fgetc()
+
+# ops that only move flow on, folded into the gotos
+STATIC_OPS = {OP_NOP, OP_UP, OP_LEFT, OP_RIGHT, OP_DOWN}
+
+# C statements of ops acting on the loaded variable,
+# with {0} the operand expression
+LOADED_OPS = {OP_SET_IMM: "mem[lv] = {0};", OP_SET_VAR: "mem[lv] = {0};",
+              OP_ADD_IMM: "mem[lv] += {0};", OP_ADD_VAR: "mem[lv] += {0};",
+              OP_SUB_IMM: "mem[lv] -= {0};", OP_SUB_VAR: "mem[lv] -= {0};",
+              OP_MUL_IMM: "mem[lv] *= {0};", OP_MUL_VAR: "mem[lv] *= {0};",
+              OP_DIV_IMM: "mem[lv] /= {0};", OP_DIV_VAR: "mem[lv] /= {0};",
+              OP_MOD_IMM: "mem[lv] %= {0};", OP_MOD_VAR: "mem[lv] %= {0};",
+              OP_OUT_IMM: "putchar({0});", OP_OUT_VAR: "putchar({0});"}
+
+# ErrCode names of the errors a cell can raise
+ERROR_NAMES = {INVALID_EXPRESSION: "INVALID_EXPRESSION",
+               INVALID_VARIABLENAME: "INVALID_VARIABLENAME",
+               INVALID_OPERATOR: "INVALID_OPERATOR"}
+
+# what every generated program starts with; the
+# ErrCode values and messages are those of main.h
+# and handle_error in main.c
+C_PROLOGUE = r"""/* {name}, translated from Flow by flow_transpile.py */
+
+#include <stdio.h>
+#ifdef _WIN32
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
+
+#define VARSPACE_SIZE 16
+#define VARSPACE_LAST (VARSPACE_SIZE * VARSPACE_SIZE - 1)
+#define OUTPUT_BUFFER_SIZE 65536
+
+typedef enum ErrCode_enum {{
+	NO_ERROR,
+	INVALID_FILE,
+	NO_START_CMD,
+	MULTIPLE_START_CMDS,
+	NO_START_DIRECTION,
+	LEAK_ERROR,
+	INVALID_EXPRESSION,
+	INVALID_VARIABLENAME,
+	INVALID_OPERATOR,
+	BOUNDS_VIOLATION
+}} ErrCode;
+
+#define FAIL(e, l, c) do {{ error = e; line = l; column = c; goto fail; }} while (0)
+
+unsigned char VAR_SPACE[VARSPACE_SIZE][VARSPACE_SIZE];
+volatile unsigned char ZERO = 0; /* divides by zero at run time, as the interpreter does */
+
+int main(void) {{
+	unsigned char* mem = (unsigned char*)VAR_SPACE;
+	int lv = 0; /* offset of LOADED_VAR */
+	unsigned char t;
+	ErrCode error = NO_ERROR;
+	int line = 0, column = 0;
+
+	setvbuf(stdout, NULL, isatty(fileno(stdout)) ? _IOLBF : _IOFBF, OUTPUT_BUFFER_SIZE);
+	printf("[Flow] Beginning execution . . .\n");
+	{entry}
+"""
+
+C_EPILOGUE = r"""
+done:
+	printf("[Flow] Program exited successfully.\n");
+	goto close;
+fail:
+	switch (error) {
+	case LEAK_ERROR:
+		printf("RUNTIME ERROR: Program flow left file at line %d column %d.\n", line, column);
+		break;
+	case INVALID_EXPRESSION:
+		printf("RUNTIME ERROR: Invalid expression at line %d column %d.\n", line, column);
+		break;
+	case INVALID_VARIABLENAME:
+		printf("RUNTIME ERROR: Invalid variable name at line %d column %d.\n", line, column);
+		break;
+	case INVALID_OPERATOR:
+		printf("RUNTIME ERROR: Invalid operator at line %d column %d.\n", line, column);
+		break;
+	case BOUNDS_VIOLATION:
+		printf("RUNTIME ERROR: Attempted to access invalid memory location at line %d column %d. Current location: %p. Bounds: %p ~ %p.\n", line, column, (void*)&mem[lv], (void*)VAR_SPACE, (void*)&VAR_SPACE[VARSPACE_SIZE-1][VARSPACE_SIZE-1]);
+		break;
+	default:
+		printf("ERROR: Unspecified error %d\n", error);
+		break;
+	}
+close:
+	printf("\n[Flow] Press Enter to close this window . . . ");
+	fflush(stdout);
+	getchar();
+	return 0;
+}
+"""
+
+"████████████████████████████████   Source   ██████████████████████████████████"
+
+
+######################
+# FlowSource
+#   A Flow file as load_file in loader.c sees it:
+#   its lines padded to PROGRAM_LINELEN, the start
+#   command's line and column (which need not be a
+#   multiple of 3) and the parse error, if any.
+#   Lines and columns are those of the file, as
+#   the interpreter's error messages give them.
+######################
+class FlowSource:
+
+  ##############
+  # init
+  #   Reads the bytes of a Flow file.
+  def __init__(self, data):
+    end = data.find(bytes([EOF_BYTE]))
+    if end != -1:
+      data = data[:end]
+    self.lines = data.split(b"\n")
+    self.numlines = len(self.lines)
+    longest = max(len(line) for line in self.lines) + 1 # counts the \n or EOF
+    self.linelen = longest + (-longest) % OP_LENGTH
+    self.start = None # (line, column)
+    self.startdir = None
+    self._lowered = {} # triplet: (op, arg)
+
+    starts = data.count(CMD_START.encode())
+    if starts == 1:
+      for line, text in enumerate(self.lines):
+        column = text.find(CMD_START.encode())
+        if column != -1:
+          self.start = (line, column)
+          self.startdir = DIR_COMMANDS.get(self.triplet(line, column)[1])
+    if starts == 0:
+      self.error = NO_START_CMD
+    elif starts > 1:
+      self.error = MULTIPLE_START_CMDS
+    elif longest == 1:
+      self.error = INVALID_FILE
+    elif self.startdir is None:
+      self.error = NO_START_DIRECTION
+    else:
+      self.error = NO_ERROR
+
+  ###############
+  # contains
+  #   True if a line and column are inside
+  #   the program.
+  def contains(self, line, column):
+    return 0 <= line < self.numlines and 0 <= column < self.linelen
+
+  ###############
+  # triplet
+  #   Returns the 3 characters from a line and
+  #   column, padded with spaces. Past the end of
+  #   the line the interpreter reads beyond its
+  #   row, but only where a space before decides
+  #   the command.
+  def triplet(self, line, column):
+    text = self.lines[line][column:column + OP_LENGTH]
+    return text.decode("latin-1").ljust(OP_LENGTH)
+
+  ###############
+  # cell
+  #   Returns the (op, arg) the interpreter
+  #   runs at a line and column.
+  def cell(self, line, column):
+    triplet = self.triplet(line, column)
+    cell = self._lowered.get(triplet)
+    if cell is None:
+      cell = self._lowered[triplet] = lowerCell(triplet)
+    if cell[0] == OP_COPY and cell[1] == ARG_LOADED:
+      return (OP_NOP, 0) # copies itself
+    return cell
+
+###############
+# gridSource
+#   Returns the FlowSource of a grid as it
+#   would be saved to file.
+def gridSource(grid):
+  text = io.StringIO()
+  writeGrid(grid, text)
+  return FlowSource(text.getvalue().encode(locale.getpreferredencoding(False)))
+
+
+"██████████████████████████████   Transpiler   ████████████████████████████████"
+
+
+######################
+# FlowTranspiler
+#   Writes a FlowSource as C. A state is the line,
+#   column and direction flow enters a cell with;
+#   only states at cells that do something get a
+#   label, as blank cells and turns are followed
+#   when working out where each goto lands.
+######################
+class FlowTranspiler:
+
+  ##############
+  # init
+  #   Finds the reachable states of a source
+  #   with no parse error.
+  def __init__(self, source):
+    self.source = source
+    self.labels = {} # state: label, in the order found
+    self.targets = {} # (line, column, direction) moved on from: target
+    self._queue = deque() # states labelled but not yet followed
+    self.entry = self.target(source.start[0], source.start[1], source.startdir)
+    while self._queue:
+      line, column, direction = self._queue.popleft()
+      op, arg = source.cell(line, column)
+      for turn in self.exits(op, direction):
+        self.target(line, column, turn)
+
+  ###############
+  # exits
+  #   Returns the directions flow can leave a
+  #   cell in, entered going direction.
+  def exits(self, op, direction):
+    if op == OP_COMP_IMM or op == OP_COMP_VAR:
+      return (direction, ROTATE_CCW[direction], ROTATE_CW[direction])
+    if op == OP_END or op == OP_FAIL:
+      return ()
+    return (direction,)
+
+  ###############
+  # target
+  #   Returns where flow lands moving on from a
+  #   line and column going direction: a label,
+  #   labelling it if new, or a statement that
+  #   fails with LEAK_ERROR or spins forever when
+  #   flow only goes round blank cells and turns.
+  def target(self, line, column, direction):
+    key = (line, column, direction)
+    if key in self.targets:
+      return self.targets[key]
+    source = self.source
+    seen = set()
+    while True:
+      dx, dy = DIR_DELTAS[direction]
+      line += dy
+      column += dx * OP_LENGTH
+      if not source.contains(line, column):
+        found = "FAIL(LEAK_ERROR, {}, {});".format(line, column)
+        break
+      op, arg = source.cell(line, column)
+      if op not in STATIC_OPS:
+        state = (line, column, direction)
+        if state not in self.labels:
+          self.labels[state] = "s{}".format(len(self.labels))
+          self._queue.append(state)
+        found = "goto {};".format(self.labels[state])
+        break
+      if op != OP_NOP:
+        direction = op - 1
+      if (line, column, direction) in seen:
+        found = "for (;;) {}"
+        break
+      seen.add((line, column, direction))
+    self.targets[key] = found
+    return found
+
+  ###############
+  # operand
+  #   Returns a C expression for an operand.
+  def operand(self, op, arg):
+    if op in (OP_NEXT_IMM, OP_PREV_IMM, OP_SET_IMM, OP_ADD_IMM, OP_SUB_IMM,
+              OP_MUL_IMM, OP_DIV_IMM, OP_MOD_IMM, OP_COMP_IMM, OP_OUT_IMM):
+      if arg == 0 and op in (OP_DIV_IMM, OP_MOD_IMM):
+        return "ZERO"
+      return "0x{:02X}".format(arg)
+    return "mem[lv]" if arg == ARG_LOADED else "mem[{}]".format(arg)
+
+  ###############
+  # statements
+  #   Returns the C lines running a state,
+  #   ending with its gotos.
+  def statements(self, state):
+    line, column, direction = state
+    op, arg = self.source.cell(line, column)
+    if op == OP_END:
+      return ["goto done;"]
+    elif op == OP_FAIL:
+      return ["FAIL({}, {}, {});".format(ERROR_NAMES[arg], line, column)]
+    value = self.operand(op, arg)
+    onward = self.target(line, column, direction)
+    if value == "ZERO": # traps, as in the interpreter; keep what was printed
+      return ["fflush(stdout);", LOADED_OPS[op].format(value), onward]
+    elif op in (OP_DIV_VAR, OP_MOD_VAR):
+      return ["if (!{}) fflush(stdout);".format(value),
+              LOADED_OPS[op].format(value), onward]
+    elif op in LOADED_OPS:
+      return [LOADED_OPS[op].format(value), onward]
+    elif op == OP_LOAD:
+      return ["lv = {};".format(arg), onward]
+    elif op in (OP_NEXT_IMM, OP_NEXT_VAR):
+      return ["t = {};".format(value),
+              "if (lv + t > VARSPACE_LAST) FAIL(BOUNDS_VIOLATION, {}, {});".format(
+                line, column),
+              "lv += t;", onward]
+    elif op in (OP_PREV_IMM, OP_PREV_VAR):
+      return ["t = {};".format(value),
+              "if (lv < t) FAIL(BOUNDS_VIOLATION, {}, {});".format(line, column),
+              "lv -= t;", onward]
+    elif op == OP_CACHE:
+      if arg == ARG_LOADED:
+        return ["mem[lv] = 0;", onward]
+      return ["mem[{0}] = (unsigned char)({0} > lv ? {0} - lv : lv - {0});".format(arg),
+              onward]
+    elif op == OP_IN:
+      return ["fflush(stdout);", "{} = getchar();".format(value), onward]
+    elif op in (OP_COMP_IMM, OP_COMP_VAR):
+      straight, ccw, cw = (self.target(line, column, turn)
+                           for turn in self.exits(op, direction))
+      return ["t = {};".format(value),
+              "if (mem[lv] < t) {}".format(ccw),
+              "if (mem[lv] > t) {}".format(cw), straight]
+    return ["mem[{}] = mem[lv];".format(arg), onward] # OP_COPY
+
+  ###############
+  # cSource
+  #   Returns the whole C program; name goes
+  #   in its opening comment.
+  def cSource(self, name):
+    out = [C_PROLOGUE.format(name = name, entry = self.entry)]
+    for state, label in self.labels.items():
+      line, column, direction = state
+      out.append("{}: /* line {} column {} going {}: {} */\n".format(
+        label, line, column, DIR_NAMES[direction],
+        self.source.triplet(line, column).encode("unicode_escape").decode(
+          "ascii").replace("*/", "* /")))
+      out.extend("\t{}\n".format(statement) for statement in self.statements(state))
+    out.append(C_EPILOGUE)
+    return "".join(out)
+
+###############
+# compileC
+#   Compiles C source text into an executable.
+#   Returns the compiler's messages; raises
+#   RuntimeError with them if it fails.
+def compileC(text, executable, cc = C_COMPILER, cflags = C_FLAGS):
+  handle, cfile = tempfile.mkstemp(suffix = ".c")
+  try:
+    with os.fdopen(handle, 'w') as outfile:
+      outfile.write(text)
+    done = subprocess.run([cc] + shlex.split(cflags) + ["-o", executable, cfile],
+                          stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                          universal_newlines = True)
+  finally:
+    os.remove(cfile)
+  if done.returncode != 0:
+    raise RuntimeError(done.stdout)
+  return done.stdout
+
+
+"██████████████████████████████████   Main   ██████████████████████████████████"
+
+def main():
+  parser = argparse.ArgumentParser(description = "Translate a Flow program to C.")
+  parser.add_argument("program", help = "Flow file (.fl)")
+  parser.add_argument("-o", "--output", help = "file to write")
+  parser.add_argument("-S", "--source", action = "store_true",
+                      help = "write C source instead of compiling it")
+  parser.add_argument("--cc", default = C_COMPILER,
+                      help = "C compiler (default: $CC or cc)")
+  parser.add_argument("--cflags", default = C_FLAGS,
+                      help = "compiler flags (default: {})".format(C_FLAGS))
+  args = parser.parse_args()
+
+  try:
+    with open(args.program, 'rb') as infile:
+      source = FlowSource(infile.read())
+  except OSError:
+    sys.exit(ERROR_MESSAGES[INVALID_FILE])
+  if source.error != NO_ERROR:
+    sys.exit(ERROR_MESSAGES[source.error])
+  transpiler = FlowTranspiler(source)
+  name = os.path.basename(args.program)
+  text = transpiler.cSource(name)
+
+  stem = os.path.splitext(args.program)[0]
+  if args.source:
+    with open(args.output or stem + ".c", 'w') as outfile:
+      outfile.write(text)
+    return
+  try:
+    sys.stdout.write(compileC(text, args.output or stem, args.cc, args.cflags))
+  except (OSError, RuntimeError) as failure:
+    sys.exit("Could not compile {}:\n{}".format(name, failure))
+
+if __name__ == "__main__":
+  main()
@@ -257,6 +257,9 @@ ErrCode cmd_divide(char expression[]) {
 	unsigned char temp;
 	error = evaluate(expression, &temp);
 	if (error == NO_ERROR) {
+		if (temp == 0) {
+			fflush(stdout); // the division traps; keep what was printed
+		}
 		(*LOADED_VAR) = (*LOADED_VAR) / temp;
 	}
 	return error;
@@ -271,6 +274,9 @@ ErrCode cmd_modulus(char expression[]) {
 	unsigned char temp;
 	error = evaluate(expression, &temp);
 	if (error == NO_ERROR) {
+		if (temp == 0) {
+			fflush(stdout); // the division traps; keep what was printed
+		}
 		(*LOADED_VAR) = (*LOADED_VAR) % temp;
 	}
 	return error;
@@ -304,6 +310,7 @@ ErrCode cmd_in(char expression[]) {
 	unsigned char* var = NULL;
 	error = get_variable(expression, &var);
 	if (error == NO_ERROR) {
+		fflush(stdout); // show any prompt before waiting
 		(*var) = getchar();
 	}
 
@@ -318,7 +325,7 @@ ErrCode cmd_out(char expression[]) {
 	unsigned char temp;
 	error = evaluate(expression, &temp);
 	if (error == NO_ERROR) {
-		printf("%c", (char)temp);
+		putchar(temp);
 	}
 	
 	return error;
@@ -7,6 +7,11 @@
 /////////////////////
 
 #include "main.h"
+#ifdef _WIN32
+#include <io.h> // isatty
+#else
+#include <unistd.h> // isatty
+#endif
 #include "loader.h"
 #include "interpreter.h"
 #include "debug.h"
@@ -89,6 +94,15 @@ int main(int argc, char *argv[]) {
 	int i;
 	init_globals();
 
+	// buffer output fully when it goes to a file or pipe; it is flushed
+	// whenever input is read and before a division by zero traps. On a
+	// terminal keep it line buffered, so it shows as it is printed.
+	if (isatty(fileno(stdout))) {
+		setvbuf(stdout, NULL, _IOLBF, OUTPUT_BUFFER_SIZE);
+	} else {
+		setvbuf(stdout, NULL, _IOFBF, OUTPUT_BUFFER_SIZE);
+	}
+
 	// command line arguments
 	for (int i = 1; i < argc; i++) {
 		if ((strcmp(argv[i],"-h") == 0) || (strcmp(argv[i],"--help") == 0)) {
@@ -119,6 +133,7 @@ int main(int argc, char *argv[]) {
 	if (ERROR == INVALID_FILE) {
 		char filename[512];
 		printf("[Flow] Enter the file to be executed: ");
+		fflush(stdout);
 		filename[0] = getchar();
 		i = 0;
 		while (filename[i] != '\n') {
@@ -150,6 +165,7 @@ int main(int argc, char *argv[]) {
 		dump_VAR_SPACE(DEBUG_MODE - 1);
 	}
 	printf("\n[Flow] Press Enter to close this window . . . ");
+	fflush(stdout);
 	getchar();
 
 	return 0;
@@ -53,6 +53,8 @@
 
 #define DEBUG_FILENAME "debug.txt"
 
+#define OUTPUT_BUFFER_SIZE 65536 // bytes of output buffered between writes
+
 typedef enum FlowDir_enum {
 	UP,
 	LEFT,
@@ -0,0 +1,92 @@
+#########################
+# test_flow_blocks.py
+# -------------------
+# Checks that BlockCache keeps its lowered
+# program in step with the grid as it is
+# edited.
+#########################
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from flow_analysis import FlowAnalysis
+from flow_blocks import BlockCache
+from flow_engine import FlowMachine, FlowProgram
+from flow_grid import FlowGrid
+
+TRIPLETS = (">__", "v__", "<__", "^__", "+_1", "O_a", "   ", "?_0")
+
+
+######################
+######################
+# BlockCacheTest
+######################
+######################
+
+class BlockCacheTest(unittest.TestCase):
+
+  ###############
+  # assertLowered
+  #   Fails unless the cache's program matches
+  #   lowering the grid from scratch.
+  def assertLowered(self, program, grid):
+    fresh = FlowProgram(grid)
+    self.assertEqual(list(program.ops), list(fresh.ops))
+    self.assertEqual(list(program.args), list(fresh.args))
+    self.assertEqual((program.start, program.starts),
+                     (fresh.start, fresh.starts))
+
+  ###############
+  # testDeleteOutsideExtent
+  #   Clearing an empty cell outside the program
+  #   must not touch the cells it would index.
+  def testDeleteOutsideExtent(self):
+    grid = FlowGrid({(0, 0): "#v_", (0, 1): ">__", (1, 1): "v__"})
+    cache = BlockCache(grid)
+    machine = FlowMachine(cache.program)
+    cache.run(machine, 1000)
+    for coord in ((4, 0), (-3, 1), (0, 5), (2, -1)):
+      cache.invalidate([(coord, None, None)])
+    self.assertLowered(cache.program, grid)
+    again = FlowMachine(cache.program)
+    cache.run(again, 1000)
+    fresh = BlockCache(grid)
+    expected = FlowMachine(fresh.program)
+    fresh.run(expected, 1000)
+    self.assertEqual((again.ticks, again.error), (expected.ticks, expected.error))
+
+  ###############
+  # testRandomEdits
+  #   Random sets and clears, in and out of the
+  #   program, leave it lowered like a fresh one,
+  #   in the block cache and the flow analysis.
+  def testRandomEdits(self):
+    rng = random.Random(5)
+    grid = FlowGrid({(0, 0): "#v_", (0, 1): ">__", (1, 1): "v__"})
+    cache = BlockCache(grid)
+    analysis = FlowAnalysis(grid)
+    analysis.report()
+    for step in range(500):
+      coord = (rng.randrange(-2, 6), rng.randrange(-2, 6))
+      old = grid.get(coord)
+      if coord == (0, 0):
+        continue
+      new = rng.choice(TRIPLETS + (None,) * 4)
+      if new is None:
+        grid.pop(coord, None)
+      else:
+        grid[coord] = new
+      cache.invalidate([(coord, old, new)])
+      self.assertLowered(cache.program, grid)
+      analysis.invalidate([(coord, old, new)])
+      if analysis.program is not None:
+        self.assertLowered(analysis.program, grid)
+      analysis.report()
+
+
+if __name__ == "__main__":
+  unittest.main()